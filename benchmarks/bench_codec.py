@@ -0,0 +1,91 @@
+"""
+局面编码基准测试：紧凑二进制编码与FEN、chess.Board对象的速度和内存对比
+
+用法：
+    python benchmarks/bench_codec.py --positions 20000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chess
+
+from chess_core.utils import decode_position, encode_position
+from sessions.models import ChessSession
+
+
+def sample_boards(count: int, seed: int = 0):
+    """随机对局中的局面（带走法栈）"""
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < count:
+        board = chess.Board()
+        for _ in range(rng.randint(1, 120)):
+            if board.is_game_over():
+                break
+            board.push(rng.choice(list(board.legal_moves)))
+            if rng.random() < 0.1:
+                boards.append(board.copy())
+    return boards[:count]
+
+
+def per_call_us(func, items) -> float:
+    """对每个元素调用一次，返回平均微秒数"""
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def memory_per_million(build) -> float:
+    """build()生成的对象列表每百万个占用的内存（MB）"""
+    tracemalloc.start()
+    items = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current / len(items) * 1e6 / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="局面编码基准测试")
+    parser.add_argument("--positions", type=int, default=20000)
+    args = parser.parse_args()
+
+    boards = sample_boards(args.positions)
+    fens = [board.fen() for board in boards]
+    blobs = [encode_position(board) for board in boards]
+    plain = [chess.Board(fen) for fen in fens]
+
+    print(f"{args.positions} 个局面，平均走法栈 {sum(len(b.move_stack) for b in boards) / len(boards):.0f} 步")
+    print(f"{'格式':<22} {'编码 us':>9} {'解码 us':>9} {'平均字节':>9} {'MB/百万局面':>12}")
+    print(f"{'FEN字符串':<22} {per_call_us(chess.Board.fen, plain):>9.2f} "
+          f"{per_call_us(chess.Board, fens):>9.2f} {sum(map(len, fens)) / len(fens):>9.1f} "
+          f"{memory_per_million(lambda: [board.fen() for board in plain]):>12.1f}")
+    print(f"{'紧凑编码':<22} {per_call_us(encode_position, plain):>9.2f} "
+          f"{per_call_us(decode_position, blobs):>9.2f} {sum(map(len, blobs)) / len(blobs):>9.1f} "
+          f"{memory_per_million(lambda: [encode_position(board) for board in plain]):>12.1f}")
+    print(f"{'chess.Board（无走法栈）':<22} {'-':>9} {'-':>9} {'-':>9} "
+          f"{memory_per_million(lambda: [chess.Board(fen) for fen in fens]):>12.1f}")
+    print(f"{'chess.Board（带走法栈）':<22} {'-':>9} {'-':>9} {'-':>9} "
+          f"{memory_per_million(lambda: [board.copy() for board in boards]):>12.1f}")
+
+    sessions = []
+    for board in boards[:2000]:
+        session = ChessSession()
+        session.board = board
+        sessions.append(session)
+    packed = [session.to_bytes() for session in sessions]
+    print(f"会话序列化: 平均 {sum(map(len, packed)) / len(packed):.1f} 字节, "
+          f"to_bytes {per_call_us(ChessSession.to_bytes, sessions):.1f} us, "
+          f"from_bytes {per_call_us(ChessSession.from_bytes, packed):.1f} us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""
+引擎性能基准测试
+
+用法：
+    python benchmarks/bench_engine.py latency --time-limit 1.0 --runs 5
+    python benchmarks/bench_engine.py throughput --pool-sizes 1 2 4 --requests 32
+    python benchmarks/bench_engine.py batch --workers 4 --positions 64
+    python benchmarks/bench_engine.py profiles
+    python benchmarks/bench_engine.py coalesce --duplicates 1 4 16 64
+    python benchmarks/bench_engine.py mixed --workers 2 --positions 64
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+from chess_core.async_engine import AsyncEnginePool
+from chess_core.batch import analyze_batch
+from chess_core.config import PROFILES, EngineConfig
+from chess_core.engine import StockfishEngine
+from chess_core.pool import EnginePool
+
+
+SAMPLE_FENS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 2 3",
+    "r1bqk2r/pppp1ppp/2n2n2/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQ1RK1 w kq - 0 5",
+    "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq c6 0 2",
+]
+
+
+def bench_latency(args):
+    """测量单次analyze_position的墙钟时间，应与time_limit基本一致"""
+    engine = StockfishEngine(args.engine)
+    with engine:
+        samples = []
+        for i in range(args.runs):
+            fen = SAMPLE_FENS[i % len(SAMPLE_FENS)]
+            start = time.perf_counter()
+            result = engine.analyze_position(fen, time_limit=args.time_limit, multipv=args.multipv)
+            elapsed = time.perf_counter() - start
+            if not result["success"]:
+                print(f"分析失败: {result['error']}")
+                return 1
+            samples.append(elapsed)
+            print(f"  #{i + 1}: {elapsed:.3f}s  depth={result['depth']}  best={result['best_move']}")
+
+    p50 = statistics.median(samples)
+    print(f"time_limit={args.time_limit:.2f}s  p50={p50:.3f}s  "
+          f"max={max(samples):.3f}s  比值={p50 / args.time_limit:.2f}x")
+    return 0
+
+
+def bench_throughput(args):
+    """并发请求下不同池大小的吞吐量（局面/秒），应随池大小近似线性增长"""
+    fens = [SAMPLE_FENS[i % len(SAMPLE_FENS)] for i in range(args.requests)]
+    baseline = None
+    for size in args.pool_sizes:
+        with EnginePool(args.engine, size=size, options={"Threads": 1, "Hash": 16}) as pool:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.clients) as executor:
+                results = list(executor.map(
+                    lambda fen: pool.analyze_position(fen, time_limit=args.time_limit, multipv=1),
+                    fens
+                ))
+            elapsed = time.perf_counter() - start
+
+        failed = sum(1 for r in results if not r["success"])
+        rate = len(fens) / elapsed
+        baseline = baseline or rate
+        print(f"pool={size:<3d} {rate:7.2f} 局面/秒  加速比={rate / baseline:.2f}x  失败={failed}")
+    return 0
+
+
+def bench_batch(args):
+    """批量分析：逐个串行调用 vs analyze_batch多进程分发（局面/秒）"""
+    fens = [SAMPLE_FENS[i % len(SAMPLE_FENS)] for i in range(args.positions)]
+
+    with StockfishEngine(args.engine) as engine:
+        start = time.perf_counter()
+        for fen in fens:
+            engine.analyze_position(fen, time_limit=args.time_limit, multipv=1)
+        serial = len(fens) / (time.perf_counter() - start)
+    print(f"串行循环        {serial:7.2f} 局面/秒")
+
+    with EnginePool(args.engine, size=args.workers) as pool:
+        start = time.perf_counter()
+        count = sum(1 for _ in analyze_batch(fens, pool, time_limit=args.time_limit))
+        batch = count / (time.perf_counter() - start)
+    print(f"analyze_batch×{args.workers:<2d} {batch:7.2f} 局面/秒  加速比={batch / serial:.2f}x")
+    return 0
+
+
+def bench_profiles(args):
+    """各分析配置档达到的深度和nps"""
+    config = EngineConfig.from_env(args.engine)
+    config.pool_size = 1
+    with StockfishEngine(args.engine, options=config.uci_options()) as engine:
+        for name, profile in PROFILES.items():
+            depths, rates = [], []
+            for fen in SAMPLE_FENS[:args.positions]:
+                result = engine.analyze_position(
+                    fen,
+                    time_limit=profile.time_limit,
+                    multipv=profile.multipv
+                )
+                depths.append(result["depth"])
+                rates.append(result["nps"])
+            print(f"{name:<6} time={profile.time_limit:<4} multipv={profile.multipv} threads={config.threads:<3d} "
+                  f"平均深度={statistics.mean(depths):5.1f}  平均nps={statistics.mean(rates) / 1e6:6.2f}M")
+    return 0
+
+
+def bench_coalesce(args):
+    """同一局面的并发重复请求：实际搜索次数应保持为1，耗时不随重复数增长"""
+    async def run(duplicates: int, stream: bool):
+        pool = AsyncEnginePool(args.engine, size=2, options={"Threads": 1, "Hash": 16})
+        await pool.start()
+        fen = SAMPLE_FENS[1]
+
+        async def one():
+            if not stream:
+                return await pool.analyze_position(fen, time_limit=args.time_limit, multipv=3)
+            async for result in pool.analyze_stream(fen, time_limit=args.time_limit, multipv=3):
+                pass
+            return result
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one() for _ in range(duplicates)))
+        elapsed = time.perf_counter() - start
+        searches = duplicates - pool.coalesced
+        await pool.close()
+        failed = sum(1 for r in results if not r["success"])
+        return elapsed, searches, failed
+
+    for mode in ("analyze_position", "analyze_stream"):
+        print(mode)
+        for duplicates in args.duplicates:
+            elapsed, searches, failed = asyncio.run(run(duplicates, mode == "analyze_stream"))
+            print(f"  重复={duplicates:<4d} 实际搜索={searches:<3d} 耗时={elapsed:.3f}s  失败={failed}")
+    return 0
+
+
+def bench_mixed(args):
+    """批量任务占满引擎池时，交互请求的延迟和各优先级的排队耗时分位数"""
+    fens = [SAMPLE_FENS[i % len(SAMPLE_FENS)] for i in range(args.positions)]
+    with EnginePool(args.engine, size=args.workers, options={"Threads": 1, "Hash": 16}) as pool:
+        batch = threading.Thread(
+            target=lambda: sum(1 for _ in analyze_batch(fens, pool, time_limit=args.time_limit)),
+            daemon=True
+        )
+        batch.start()
+        time.sleep(args.time_limit)
+
+        latencies = []
+        while batch.is_alive():
+            start = time.perf_counter()
+            # 不同的multipv保证不会命中批量任务写入的缓存或与之合并
+            pool.analyze_position(fens[len(latencies) % len(fens)], time_limit=args.time_limit, multipv=2)
+            latencies.append(time.perf_counter() - start)
+            time.sleep(args.time_limit)
+        batch.join()
+        stats = pool.stats()["scheduler"]
+
+    print(f"交互请求 {len(latencies)} 次  p50={statistics.median(latencies):.3f}s  "
+          f"max={max(latencies):.3f}s  （time_limit={args.time_limit}s）")
+    for name, item in stats.items():
+        if item["granted"]:
+            print(f"  {name:<12} 分配={item['granted']:<5d} 排队p50={item['wait_p50_ms']:8.1f}ms  "
+                  f"p99={item['wait_p99_ms']:8.1f}ms")
+    return 0
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Stockfish引擎基准测试")
+    parser.add_argument("--engine", default=os.getenv("STOCKFISH_PATH"), help="Stockfish路径")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    latency = sub.add_parser("latency", help="单次分析延迟")
+    latency.add_argument("--time-limit", type=float, default=1.0)
+    latency.add_argument("--multipv", type=int, default=3)
+    latency.add_argument("--runs", type=int, default=5)
+    latency.set_defaults(func=bench_latency)
+
+    throughput = sub.add_parser("throughput", help="引擎池并发吞吐量")
+    throughput.add_argument("--pool-sizes", type=int, nargs="+", default=[1, 2, 4])
+    throughput.add_argument("--requests", type=int, default=32)
+    throughput.add_argument("--clients", type=int, default=16, help="并发请求线程数")
+    throughput.add_argument("--time-limit", type=float, default=0.2)
+    throughput.set_defaults(func=bench_throughput)
+
+    batch = sub.add_parser("batch", help="批量分析吞吐量")
+    batch.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    batch.add_argument("--positions", type=int, default=64)
+    batch.add_argument("--time-limit", type=float, default=0.1)
+    batch.set_defaults(func=bench_batch)
+
+    profiles = sub.add_parser("profiles", help="各分析配置档的深度和nps")
+    profiles.add_argument("--positions", type=int, default=len(SAMPLE_FENS))
+    profiles.set_defaults(func=bench_profiles)
+
+    coalesce = sub.add_parser("coalesce", help="并发重复请求的合并效果")
+    coalesce.add_argument("--duplicates", type=int, nargs="+", default=[1, 4, 16, 64])
+    coalesce.add_argument("--time-limit", type=float, default=0.5)
+    coalesce.set_defaults(func=bench_coalesce)
+
+    mixed = sub.add_parser("mixed", help="批量任务与交互请求混合负载")
+    mixed.add_argument("--workers", type=int, default=2)
+    mixed.add_argument("--positions", type=int, default=64)
+    mixed.add_argument("--time-limit", type=float, default=0.2)
+    mixed.set_defaults(func=bench_mixed)
+
+    args = parser.parse_args()
+    if not args.engine:
+        parser.error("请通过 --engine 或 STOCKFISH_PATH 指定引擎路径")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
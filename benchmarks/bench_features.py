@@ -0,0 +1,63 @@
+"""
+批量特征基准测试：逐个局面调用get_piece_value/get_game_phase与NumPy向量化版本对比
+
+用法：
+    python benchmarks/bench_features.py --positions 10000 100000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chess
+
+from chess_core.features import batch_features
+from chess_core.utils import get_game_phase, get_piece_value
+
+
+def sample_fens(count: int, seed: int = 0):
+    """随机对局中的局面"""
+    rng = random.Random(seed)
+    fens = []
+    while len(fens) < count:
+        board = chess.Board()
+        for _ in range(rng.randint(1, 120)):
+            if board.is_game_over():
+                break
+            board.push(rng.choice(list(board.legal_moves)))
+            if rng.random() < 0.1:
+                fens.append(board.fen())
+    return fens[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量特征基准测试")
+    parser.add_argument("--positions", type=int, nargs="+", default=[10000])
+    args = parser.parse_args()
+
+    fens = sample_fens(max(args.positions))
+    print(f"{'局面数':>8} {'逐个(s)':>9} {'向量化(s)':>10} {'加速':>7}")
+    for count in args.positions:
+        subset = fens[:count]
+
+        start = time.perf_counter()
+        for fen in subset:
+            board = chess.Board(fen)
+            get_piece_value(board)
+            get_game_phase(board)
+        naive = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch_features(subset)
+        vectorized = time.perf_counter() - start
+
+        print(f"{count:>8} {naive:>9.3f} {vectorized:>10.3f} {naive / vectorized:>6.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""
+会话管理器基准测试
+
+scale: 会话数量增长时每次get_session的耗时，对比按访问顺序过期（当前实现）与每次请求全量扫描（旧实现）
+contention: 多线程并发访问时的吞吐量，对比不同分片数，并检查同一会话的并发走子没有交错
+store: 会话存储后端的批量写回和懒加载耗时
+
+用法：
+    python benchmarks/bench_sessions.py scale --sizes 1000 10000 100000 --requests 20000
+    python benchmarks/bench_sessions.py contention --threads 1 4 16 64 --shards 1 16
+    python benchmarks/bench_sessions.py store --urls memory:// sqlite:///bench_sessions.db --sessions 5000
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sessions.manager import SessionManager
+from sessions.models import ChessSession
+from sessions.store import open_session_store
+
+
+class OrderedSessionManager(SessionManager):
+    """当前实现，补充与ScanningSessionManager相同的填充方法"""
+
+    def populate(self, ids):
+        for session_id in ids:
+            self.get_session(session_id)
+
+
+class ScanningSessionManager:
+    """旧实现：每次get_session都遍历全部会话检查是否过期"""
+
+    def __init__(self, session_timeout: int = 3600):
+        self._sessions = {}
+        self._last_access = {}
+        self._session_timeout = session_timeout
+
+    def populate(self, ids):
+        """直接填充会话（逐个get_session填充是O(n^2)）"""
+        now = time.monotonic()
+        for session_id in ids:
+            self._sessions[session_id] = ChessSession(session_id)
+            self._last_access[session_id] = now
+
+    def get_session(self, session_id: str = "default") -> ChessSession:
+        now = time.monotonic()
+        expired = [
+            sid for sid, last_time in self._last_access.items()
+            if now - last_time > self._session_timeout
+        ]
+        for sid in expired:
+            self._sessions.pop(sid, None)
+            self._last_access.pop(sid, None)
+        if session_id not in self._sessions:
+            self._sessions[session_id] = ChessSession(session_id)
+        self._last_access[session_id] = now
+        return self._sessions[session_id]
+
+
+def per_request_us(manager, ids, requests: int, seed: int = 0) -> float:
+    """随机访问已有会话，返回平均每次get_session的微秒数"""
+    rng = random.Random(seed)
+    picks = [rng.choice(ids) for _ in range(requests)]
+    start = time.perf_counter()
+    for session_id in picks:
+        manager.get_session(session_id)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def bench_scale(args):
+    """会话数量增长时的单次请求耗时"""
+    print(f"{'会话数':>8} {'顺序过期 us':>12} {'全量扫描 us':>12}")
+    for size in args.sizes:
+        ids = [f"session-{i}" for i in range(size)]
+        row = []
+        for manager in (
+            OrderedSessionManager(max_sessions=None, sweep_interval=None),
+            ScanningSessionManager()
+        ):
+            manager.populate(ids)
+            # 全量扫描在大规模时太慢，按会话数缩减请求次数
+            requests = args.requests if isinstance(manager, SessionManager) \
+                else max(50, args.requests * 1000 // size)
+            row.append(per_request_us(manager, ids, requests))
+        print(f"{size:>8} {row[0]:>12.2f} {row[1]:>12.2f}")
+
+    # 会话上限：持续创建新会话时的淘汰开销
+    manager = SessionManager(max_sessions=10000, sweep_interval=None)
+    start = time.perf_counter()
+    for i in range(args.requests * 5):
+        manager.get_session(f"new-{i}")
+    elapsed = (time.perf_counter() - start) / (args.requests * 5) * 1e6
+    print(f"上限10000时持续创建新会话: {elapsed:.2f} us/次, {manager.stats()}")
+    return 0
+
+
+def _contention_worker(manager, ids, requests, hot_every, seed, barrier):
+    """随机访问会话；每hot_every次独占共享会话走一步棋"""
+    rng = random.Random(seed)
+    barrier.wait()
+    for i in range(requests):
+        if i % hot_every == 0:
+            with manager.acquire("shared") as session:
+                if session.board.is_game_over() or len(session.history) >= 200:
+                    session.reset()
+                moves = list(session.board.legal_moves)
+                session.make_move(session.board.san(rng.choice(moves)))
+        else:
+            manager.get_session(rng.choice(ids))
+
+
+def bench_contention(args):
+    """多线程并发访问会话的吞吐量"""
+    ids = [f"session-{i}" for i in range(args.sessions)]
+    print(f"{args.sessions} 个会话，每线程 {args.requests} 次请求，每 {args.hot_every} 次独占共享会话走子")
+    print(f"{'线程':>6} {'分片':>6} {'请求/秒':>12} {'走法一致':>8}")
+    for threads in args.threads:
+        for shards in args.shards:
+            manager = SessionManager(max_sessions=None, sweep_interval=None, num_shards=shards)
+            for session_id in ids:
+                manager.get_session(session_id)
+            barrier = threading.Barrier(threads + 1)
+            workers = [
+                threading.Thread(
+                    target=_contention_worker,
+                    args=(manager, ids, args.requests, args.hot_every, seed, barrier)
+                )
+                for seed in range(threads)
+            ]
+            for worker in workers:
+                worker.start()
+            barrier.wait()
+            start = time.perf_counter()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+
+            # 走法历史与棋盘走法栈一致说明并发走子没有交错
+            shared = manager.get_session("shared")
+            consistent = len(shared.history) == len(shared.board.move_stack)
+            print(f"{threads:>6} {shards:>6} {threads * args.requests / elapsed:>12.0f} "
+                  f"{'是' if consistent else '否':>8}")
+    return 0
+
+
+def bench_store(args):
+    """各存储后端的写回与懒加载耗时"""
+    rng = random.Random(0)
+    ids = [f"session-{i}" for i in range(args.sessions)]
+    print(f"{args.sessions} 个会话，每个会话随机走 {args.plies} 步")
+    print(f"{'后端':<28} {'写回 us/会话':>12} {'续期 us/会话':>12} {'懒加载 us/会话':>14} {'平均字节':>9}")
+    for url in args.urls:
+        store = open_session_store(url, ttl=3600)
+        store.clear()
+        writer = SessionManager(max_sessions=None, sweep_interval=None, store=store)
+        for session_id in ids:
+            session = writer.get_session(session_id)
+            for _ in range(args.plies):
+                moves = list(session.board.legal_moves)
+                if not moves:
+                    break
+                session.make_move(session.board.san(rng.choice(moves)))
+        writer.flush()
+        # 再走一步：acquire结束时有条件写入（先比较版本号）
+        start = time.perf_counter()
+        for session_id in ids:
+            with writer.acquire(session_id) as session:
+                moves = list(session.board.legal_moves)
+                if moves:
+                    session.make_move(session.board.san(rng.choice(moves)))
+        write_us = (time.perf_counter() - start) / len(ids) * 1e6
+        # 只读访问：后台线程批量续期
+        for session_id in ids:
+            writer.get_session(session_id)
+        start = time.perf_counter()
+        writer.flush()
+        touch_us = (time.perf_counter() - start) / len(ids) * 1e6
+
+        # 另一个进程的管理器：首次访问时从存储加载
+        reader = SessionManager(max_sessions=None, sweep_interval=None, store=store)
+        start = time.perf_counter()
+        for session_id in ids:
+            reader.get_session(session_id)
+        load_us = (time.perf_counter() - start) / len(ids) * 1e6
+        size = sum(len(store.load(session_id)[0]) for session_id in ids[:1000]) / min(1000, len(ids))
+        print(f"{url:<28} {write_us:>12.1f} {touch_us:>12.1f} {load_us:>14.1f} {size:>9.1f}")
+        store.clear()
+        store.close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话管理器基准测试")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    scale = sub.add_parser("scale", help="会话数量增长时的单次请求耗时")
+    scale.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    scale.add_argument("--requests", type=int, default=20000)
+    scale.set_defaults(func=bench_scale)
+
+    contention = sub.add_parser("contention", help="多线程并发访问的吞吐量")
+    contention.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16, 64])
+    contention.add_argument("--shards", type=int, nargs="+", default=[1, 16])
+    contention.add_argument("--sessions", type=int, default=1000)
+    contention.add_argument("--requests", type=int, default=5000, help="每个线程的请求数")
+    contention.add_argument("--hot-every", type=int, default=10, help="每多少次请求独占共享会话走一步")
+    contention.set_defaults(func=bench_contention)
+
+    store = sub.add_parser("store", help="会话存储后端的写回与加载耗时")
+    store.add_argument("--urls", nargs="+", default=["memory://", "sqlite:///bench_sessions.db"],
+                       help="会话存储地址，见sessions/store.py")
+    store.add_argument("--sessions", type=int, default=5000)
+    store.add_argument("--plies", type=int, default=40, help="每个会话的走子步数")
+    store.set_defaults(func=bench_store)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,617 @@
+"""
+异步引擎池
+直接基于chess.engine.popen_uci的协议对象，在Gradio的事件循环里运行；
+等待中的请求只是挂起的协程，不占用线程
+"""
+
+import asyncio
+import contextlib
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import chess
+import chess.engine
+
+from .cache import AnalysisCache
+from .config import INFINITE_ANALYSIS_MAX
+from .engine import (
+    ENGINE_FAULTS, build_analysis_result, engine_pool_settings, get_analysis_cache,
+    lines_complete, make_limit, request_key, search_deadline, stream_result
+)
+from .opening import OpeningIndex, get_opening_index
+from .scheduler import INTERACTIVE, EngineScheduler, QueueFullError, Ticket
+from .tablebase import SyzygyTablebase, get_tablebase
+
+
+class StreamFlight:
+    """被多个订阅者共享的一次流式搜索"""
+
+    __slots__ = ("task", "ticket", "latest", "subscribers")
+
+    def __init__(self, ticket: Ticket):
+        self.task: Optional[asyncio.Task] = None
+        self.ticket = ticket
+        self.latest: Optional[Dict[str, Any]] = None
+        self.subscribers: List["asyncio.Queue[Optional[Dict[str, Any]]]"] = []
+
+
+class AsyncEnginePool:
+    """异步Stockfish引擎池类"""
+
+    def __init__(
+        self,
+        engine_path: str,
+        size: int = 1,
+        options: Optional[Dict[str, Any]] = None,
+        checkout_timeout: float = 30.0,
+        cache: Optional[AnalysisCache] = None,
+        min_engines: Optional[int] = None,
+        idle_timeout: Optional[float] = None,
+        queue_limits: Optional[Dict[int, int]] = None,
+        tablebase: Optional[SyzygyTablebase] = None,
+        openings: Optional[OpeningIndex] = None
+    ):
+        """
+        初始化引擎池（需再await start()启动进程）
+
+        Args:
+            engine_path: Stockfish可执行文件路径
+            size: 引擎进程数量
+            options: 每个进程的UCI选项（Threads、Hash等）
+            checkout_timeout: 默认借出等待时间（秒）
+            cache: 分析结果缓存，为None时不缓存
+            min_engines: 预先启动并始终保持运行的进程数量，默认等于size
+            idle_timeout: 进程空闲超过该秒数即关闭（保留min_engines个），为None或0时不回收
+            queue_limits: 各优先级的最大排队数（见scheduler.DEFAULT_QUEUE_LIMITS）
+            tablebase: Syzygy残局库，库中的局面直接查库不占用引擎
+            openings: 开局库，库中统计足够的局面直接返回走法统计
+        """
+        self.engine_path = engine_path
+        self.size = max(1, size)
+        self.options = dict(options or {})
+        self.checkout_timeout = checkout_timeout
+        self.cache = cache
+        self.tablebase = tablebase
+        self.openings = openings
+        self.min_engines = self.size if min_engines is None else max(0, min(min_engines, self.size))
+        self.idle_timeout = idle_timeout or None
+        self.restarts = 0
+        self.reaped = 0
+        self.coalesced = 0
+
+        # 按优先级分配空闲引擎；其中的None是尚未启动（或已被回收）的空位，借出时才启动进程
+        self.scheduler = EngineScheduler(queue_limits)
+        self._transports: Dict[chess.engine.UciProtocol, asyncio.SubprocessTransport] = {}
+        self._last_used: Dict[chess.engine.UciProtocol, float] = {}
+        self._reaper: Optional[asyncio.Task] = None
+        self._closed = False
+        # 正在进行的搜索及其借出请求，局面和参数都相同的并发请求共用
+        self._inflight: Dict[Tuple, Tuple["asyncio.Task[Dict[str, Any]]", Ticket]] = {}
+        self._streams: Dict[Tuple, StreamFlight] = {}
+
+    async def start(self):
+        """并发启动min_engines个引擎进程，其余进程按需启动"""
+        protocols = await asyncio.gather(*(self._spawn() for _ in range(self.min_engines)))
+        for _ in range(self.size - len(protocols)):
+            self.scheduler.release(None)
+        now = time.monotonic()
+        for protocol in protocols:
+            self._last_used[protocol] = now
+            self.scheduler.release(protocol)
+        if self.idle_timeout:
+            self._reaper = asyncio.get_running_loop().create_task(self._reap_loop())
+
+    async def _spawn(self) -> chess.engine.UciProtocol:
+        """启动一个引擎进程并设置UCI选项"""
+        transport, protocol = await chess.engine.popen_uci(self.engine_path)
+        if self.options:
+            await protocol.configure(self.options)
+        self._transports[protocol] = transport
+        return protocol
+
+    async def _respawn(self, protocol: chess.engine.UciProtocol) -> chess.engine.UciProtocol:
+        """强制结束已崩溃或卡死的引擎进程并替换为新进程"""
+        self._last_used.pop(protocol, None)
+        transport = self._transports.pop(protocol, None)
+        if transport is not None:
+            transport.close()
+        self.restarts += 1
+        return await self._spawn()
+
+    @property
+    def waiting(self) -> int:
+        """正在排队等待空闲引擎的请求数"""
+        return self.scheduler.waiting
+
+    async def checkout(
+        self,
+        timeout: Optional[float] = None,
+        priority: int = INTERACTIVE,
+        session: Optional[str] = None,
+        ticket: Optional[Ticket] = None
+    ) -> chess.engine.UciProtocol:
+        """
+        借出一个空闲引擎，必要时重启已崩溃的进程
+
+        Args:
+            timeout: 等待空闲引擎的最长时间（秒），默认使用checkout_timeout
+            priority: 调度优先级（scheduler.INTERACTIVE/BACKGROUND/BATCH）
+            session: 会话标识，同一优先级内按会话轮流分配
+            ticket: 排队期间可能被提升的优先级（合并的请求），给出时忽略priority
+
+        Raises:
+            asyncio.TimeoutError: 超时仍无空闲引擎
+            QueueFullError: 该优先级排队已满
+        """
+        if self._closed:
+            raise RuntimeError("引擎池已关闭")
+        protocol = await self.scheduler.acquire_async(
+            priority,
+            session,
+            timeout if timeout is not None else self.checkout_timeout,
+            ticket
+        )
+        try:
+            if protocol is None:
+                protocol = await self._spawn()
+            elif protocol.returncode.done():
+                protocol = await self._respawn(protocol)
+        except BaseException:
+            # 启动失败时归还空位，避免池子永久缩小
+            self.scheduler.release(None)
+            raise
+        return protocol
+
+    async def checkin(self, protocol: chess.engine.UciProtocol):
+        """归还引擎"""
+        if self._closed:
+            await self._quit(protocol)
+            return
+        if protocol.returncode.done():
+            protocol = await self._respawn(protocol)
+        self._last_used[protocol] = time.monotonic()
+        self.scheduler.release(protocol)
+
+    async def reap_idle(self) -> int:
+        """
+        关闭空闲超过idle_timeout的引擎进程，释放其置换表和NNUE权重占用的内存
+
+        至少保留min_engines个进程运行；被关闭的位置下次借出时重新启动
+
+        Returns:
+            本次关闭的进程数量
+        """
+        if not self.idle_timeout:
+            return 0
+        idle = self.scheduler.take_free()
+        now = time.monotonic()
+        running = len(self._transports)
+        expired = []
+        # 取出顺序是从最近使用到最久未用，倒序处理先回收最久未用的
+        for protocol in reversed(idle):
+            if (
+                protocol is not None and running > self.min_engines
+                and now - self._last_used.get(protocol, now) >= self.idle_timeout
+            ):
+                expired.append(protocol)
+                running -= 1
+                protocol = None
+            self.scheduler.release(protocol)
+
+        # 先把空位放回调度器再关闭进程，关闭期间不阻塞借出
+        for protocol in expired:
+            await self._quit(protocol)
+        self.reaped += len(expired)
+        return len(expired)
+
+    async def _reap_loop(self):
+        """后台回收任务"""
+        interval = max(1.0, self.idle_timeout / 4)
+        while not self._closed:
+            await asyncio.sleep(interval)
+            await self.reap_idle()
+
+    @contextlib.asynccontextmanager
+    async def engine(
+        self,
+        timeout: Optional[float] = None,
+        priority: int = INTERACTIVE,
+        session: Optional[str] = None
+    ) -> AsyncIterator[chess.engine.UciProtocol]:
+        """借出引擎的异步上下文管理器，退出时自动归还"""
+        protocol = await self.checkout(timeout, priority, session)
+        try:
+            yield protocol
+        finally:
+            await self.checkin(protocol)
+
+    async def analyze_position(
+        self,
+        fen: str,
+        time_limit: Optional[float] = 2.0,
+        multipv: int = 3,
+        timeout: Optional[float] = None,
+        options: Optional[Dict[str, Any]] = None,
+        depth: Optional[int] = None,
+        nodes: Optional[int] = None,
+        priority: int = INTERACTIVE,
+        session: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        异步分析局面，返回格式与StockfishEngine.analyze_position一致
+
+        与正在进行的搜索局面和参数都相同的请求直接等待那次搜索的结果，
+        优先级更高时把那次搜索提升到自己的优先级；单个请求被取消不会中断共享的搜索
+
+        Args:
+            fen: FEN格式的棋盘状态
+            time_limit: 分析时间限制（秒）
+            multipv: 返回的最佳走法数量
+            timeout: 等待空闲引擎的最长时间（秒）
+            options: 仅本次搜索生效的UCI选项（来自分析配置档）
+            depth: 搜索深度限制
+            nodes: 搜索节点数限制
+            priority: 调度优先级
+            session: 会话标识
+
+        Returns:
+            包含分析结果的字典
+        """
+        try:
+            key = request_key(fen, multipv, time_limit, depth, nodes, options)
+        except ValueError as e:
+            return {"success": False, "error": f"FEN格式错误: {str(e)}"}
+
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            ticket = Ticket(priority)
+            task = asyncio.get_running_loop().create_task(
+                self._analyze_position(
+                    fen, time_limit, multipv, timeout, options, depth, nodes, ticket, session
+                )
+            )
+            self._inflight[key] = (task, ticket)
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            task, ticket = inflight
+            self.coalesced += 1
+            self.scheduler.promote(ticket, priority)
+
+        result = dict(await asyncio.shield(task))
+        if result.get("success"):
+            result["fen"] = fen
+        return result
+
+    def _lookup(
+        self,
+        fen: str,
+        multipv: int,
+        depth: Optional[int],
+        time_limit: Optional[float],
+        nodes: Optional[int]
+    ) -> Optional[Dict[str, Any]]:
+        """依次查残局库、开局库和缓存，返回第一个命中的结果"""
+        if self.tablebase is not None:
+            probed = self.tablebase.analyze_position(fen, multipv)
+            if probed is not None:
+                return probed
+        if self.openings is not None:
+            booked = self.openings.analyze_position(fen, multipv)
+            if booked is not None:
+                return booked
+        if self.cache is not None and make_limit(time_limit, depth, nodes) is not None:
+            return self.cache.get(fen, multipv, depth, time_limit, nodes)
+        return None
+
+    async def _lookup_async(self, *args, **kwargs) -> Optional[Dict[str, Any]]:
+        """
+        在线程中执行_lookup：残局库探测、开局库和持久化缓存都可能读磁盘，
+        不能在事件循环上执行，否则所有界面请求都排在磁盘I/O后面
+        """
+        if self.tablebase is None and self.openings is None and self.cache is None:
+            return None
+        return await asyncio.to_thread(self._lookup, *args, **kwargs)
+
+    async def _analyze_position(
+        self,
+        fen: str,
+        time_limit: Optional[float],
+        multipv: int,
+        timeout: Optional[float],
+        options: Optional[Dict[str, Any]],
+        depth: Optional[int],
+        nodes: Optional[int],
+        ticket: Ticket,
+        session: Optional[str]
+    ) -> Dict[str, Any]:
+        """实际执行一次分析：依次查残局库、开局库和缓存，都未命中再借出引擎搜索"""
+        limit = make_limit(time_limit, depth, nodes)
+        if limit is None:
+            return {"success": False, "error": "分析失败: 需要时间、深度或节点数限制"}
+        try:
+            board = chess.Board(fen)
+            known = await self._lookup_async(fen, multipv, depth, time_limit, nodes)
+            if known is not None:
+                return known
+
+            try:
+                protocol = await self.checkout(timeout, session=session, ticket=ticket)
+            except asyncio.TimeoutError:
+                return {"success": False, "error": "引擎繁忙: 没有空闲引擎"}
+            except QueueFullError as e:
+                return {"success": False, "error": f"引擎繁忙: {str(e)}"}
+            try:
+                # 看门狗：崩溃、协议错误或超时未返回时换新进程重试一次
+                for attempt in range(2):
+                    try:
+                        info = await asyncio.wait_for(
+                            protocol.analyse(
+                                board,
+                                limit,
+                                multipv=multipv,
+                                info=chess.engine.INFO_ALL,
+                                options=options or {}
+                            ),
+                            search_deadline(limit)
+                        )
+                        break
+                    except ENGINE_FAULTS:
+                        protocol = await self._respawn(protocol)
+                        if attempt:
+                            raise
+            finally:
+                await self.checkin(protocol)
+            result = build_analysis_result(fen, info, multipv)
+
+            if self.cache is not None:
+                await asyncio.to_thread(
+                    self.cache.put, result, multipv=multipv, time_limit=None if depth or nodes else time_limit
+                )
+            return result
+        except ValueError as e:
+            return {"success": False, "error": f"FEN格式错误: {str(e)}"}
+        except ENGINE_FAULTS as e:
+            return {"success": False, "error": f"分析失败: {str(e) or '引擎无响应'}"}
+        except Exception as e:
+            return {"success": False, "error": f"分析失败: {str(e)}"}
+
+    async def analyze_stream(
+        self,
+        fen: str,
+        time_limit: Optional[float] = 2.0,
+        multipv: int = 3,
+        min_interval: float = 0.2,
+        timeout: Optional[float] = None,
+        options: Optional[Dict[str, Any]] = None,
+        depth: Optional[int] = None,
+        nodes: Optional[int] = None,
+        priority: int = INTERACTIVE,
+        session: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        异步流式分析，行为与StockfishEngine.analyze_stream一致
+
+        无限分析（不给任何限制）最长搜索INFINITE_ANALYSIS_MAX秒，客户端断开而生成器
+        没有被关闭时引擎最迟那时归还。
+        局面和参数都相同的并发请求订阅同一次搜索，后加入的订阅者先收到最近一次结果，
+        优先级更高时把还在排队的搜索提升到自己的优先级。
+        异步生成器被关闭（例如Gradio取消事件）时退订；最后一个订阅者退订时
+        立即停止搜索并归还引擎
+
+        Yields:
+            阶段性分析结果字典
+        """
+        try:
+            key = request_key(fen, multipv, time_limit, depth, nodes, options)
+        except ValueError as e:
+            yield {"success": False, "error": f"FEN格式错误: {str(e)}"}
+            return
+
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = StreamFlight(Ticket(priority))
+            self._streams[key] = flight
+            stream = self._analyze_stream(
+                fen, time_limit, multipv, min_interval, timeout, options, depth, nodes,
+                flight.ticket, session
+            )
+            flight.task = asyncio.get_running_loop().create_task(self._broadcast(key, flight, stream))
+        else:
+            self.coalesced += 1
+            self.scheduler.promote(flight.ticket, priority)
+
+        inbox: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+        if flight.latest is not None:
+            inbox.put_nowait(flight.latest)
+        flight.subscribers.append(inbox)
+        try:
+            while True:
+                result = await inbox.get()
+                if result is None:
+                    return
+                if result.get("success"):
+                    result = dict(result)
+                    result["fen"] = fen
+                yield result
+        finally:
+            flight.subscribers.remove(inbox)
+            if not flight.subscribers and not flight.task.done():
+                flight.task.cancel()
+
+    async def _broadcast(
+        self,
+        key: Tuple,
+        flight: StreamFlight,
+        stream: AsyncIterator[Dict[str, Any]]
+    ):
+        """把一次流式搜索的结果分发给全部订阅者，结束时发送None"""
+        try:
+            async for result in stream:
+                flight.latest = result
+                for inbox in flight.subscribers:
+                    inbox.put_nowait(result)
+        finally:
+            await stream.aclose()
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+            for inbox in flight.subscribers:
+                inbox.put_nowait(None)
+
+    async def _analyze_stream(
+        self,
+        fen: str,
+        time_limit: Optional[float],
+        multipv: int,
+        min_interval: float,
+        timeout: Optional[float],
+        options: Optional[Dict[str, Any]],
+        depth: Optional[int],
+        nodes: Optional[int],
+        ticket: Ticket,
+        session: Optional[str]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """实际执行一次流式分析：先查残局库、开局库和缓存，都未命中再借出引擎搜索"""
+        limit = make_limit(time_limit, depth, nodes)
+        finite = limit is not None
+        if not finite:
+            limit = chess.engine.Limit(time=INFINITE_ANALYSIS_MAX)
+        try:
+            board = chess.Board(fen)
+            known = await self._lookup_async(fen, multipv, depth, time_limit, nodes)
+            if known is not None:
+                known.update(final=True, stopped=False)
+                yield known
+                return
+            protocol = await self.checkout(timeout, session=session, ticket=ticket)
+        except ValueError as e:
+            yield {"success": False, "error": f"FEN格式错误: {str(e)}"}
+            return
+        except asyncio.TimeoutError:
+            yield {"success": False, "error": "引擎繁忙: 没有空闲引擎"}
+            return
+        except QueueFullError as e:
+            yield {"success": False, "error": f"引擎繁忙: {str(e)}"}
+            return
+
+        lines: List[Dict[str, Any]] = []
+        try:
+            for attempt in range(2):
+                try:
+                    analysis = await protocol.analysis(
+                        board,
+                        limit,
+                        multipv=multipv,
+                        info=chess.engine.INFO_ALL,
+                        options=options or {}
+                    )
+                except ENGINE_FAULTS:
+                    protocol = await self._respawn(protocol)
+                    if attempt:
+                        raise
+                    continue
+
+                last_yield = None
+                faulted = False
+                try:
+                    async for _ in analysis:
+                        if not lines_complete(analysis.multipv):
+                            continue
+                        lines = [line.copy() for line in analysis.multipv]
+                        now = time.monotonic()
+                        if last_yield is not None and now - last_yield < min_interval:
+                            continue
+                        last_yield = now
+                        yield stream_result(fen, lines, multipv, final=False, stopped=False)
+                except ENGINE_FAULTS:
+                    faulted = True
+                finally:
+                    with contextlib.suppress(Exception):
+                        analysis.stop()
+                        await analysis.wait()
+
+                if not faulted and not protocol.returncode.done():
+                    break
+                # 进程在搜索途中退出或出错：换新进程；还没有产出过结果时透明地重试一次
+                protocol = await self._respawn(protocol)
+                if lines or attempt:
+                    yield {"success": False, "error": "分析失败: 引擎进程意外退出"}
+                    return
+        except Exception as e:
+            yield {"success": False, "error": f"分析失败: {str(e)}"}
+            return
+        finally:
+            await self.checkin(protocol)
+
+        if lines:
+            result = stream_result(fen, lines, multipv, final=True, stopped=False)
+            if self.cache is not None and finite:
+                await asyncio.to_thread(
+                    self.cache.put, result, multipv=multipv, time_limit=None if depth or nodes else time_limit
+                )
+            yield result
+        else:
+            yield {"success": False, "error": "分析失败: 引擎没有返回结果"}
+
+    def stats(self) -> Dict[str, Any]:
+        """获取引擎池状态"""
+        stats = {
+            "size": self.size,
+            "running": len(self._transports),
+            "idle": self.scheduler.free_count,
+            "waiting": self.waiting,
+            "restarts": self.restarts,
+            "reaped": self.reaped,
+            "coalesced": self.coalesced,
+            "scheduler": self.scheduler.stats()
+        }
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        if self.tablebase is not None:
+            stats["tablebase"] = self.tablebase.stats()
+        if self.openings is not None:
+            stats["openings"] = self.openings.stats()
+        return stats
+
+    async def _quit(self, protocol: chess.engine.UciProtocol):
+        """关闭单个引擎进程"""
+        with contextlib.suppress(Exception):
+            await asyncio.wait_for(protocol.quit(), 5.0)
+        self._last_used.pop(protocol, None)
+        transport = self._transports.pop(protocol, None)
+        if transport is not None:
+            transport.close()
+
+    async def close(self):
+        """关闭全部空闲引擎；借出中的引擎在归还时关闭"""
+        self._closed = True
+        if self._reaper is not None:
+            self._reaper.cancel()
+        for protocol in self.scheduler.take_free():
+            if protocol is not None:
+                await self._quit(protocol)
+
+
+# 全局异步引擎池单例（必须在事件循环内创建）
+_async_instance: Optional[AsyncEnginePool] = None
+_async_lock: Optional[asyncio.Lock] = None
+
+async def get_async_engine(engine_path: str = None) -> AsyncEnginePool:
+    """
+    获取全局异步引擎池单例，首次调用时在当前事件循环中启动引擎进程
+
+    配置与get_engine相同（见engine_pool_settings），并共用同一个分析缓存
+    """
+    global _async_instance, _async_lock
+    if _async_lock is None:
+        _async_lock = asyncio.Lock()
+    async with _async_lock:
+        if _async_instance is None:
+            pool = AsyncEnginePool(
+                cache=get_analysis_cache(),
+                tablebase=get_tablebase(),
+                openings=get_opening_index(),
+                **engine_pool_settings(engine_path)
+            )
+            await pool.start()
+            _async_instance = pool
+    return _async_instance
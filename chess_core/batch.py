@@ -0,0 +1,173 @@
+"""
+批量局面分析
+把大量FEN分发到引擎池的多个Stockfish进程，按完成顺序流式返回结果
+
+命令行用法：
+    python -m chess_core.batch --input puzzles.txt --output results.jsonl --workers 4
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .pool import EnginePool
+from .scheduler import BATCH
+
+
+# 进度回调：(已完成数量, 已提交数量, 已用秒数)
+ProgressCallback = Callable[[int, int, float], None]
+
+
+def analyze_batch(
+    fens: Iterable[str],
+    pool: EnginePool,
+    time_limit: Optional[float] = 1.0,
+    multipv: int = 1,
+    progress: Optional[ProgressCallback] = None,
+    depth: Optional[int] = None,
+    nodes: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    并行分析一批局面，按完成顺序产出结果
+
+    输入按需读取，同时在途的任务不超过引擎数的两倍，适合很大的FEN文件；
+    任务按批量优先级排队，与交互请求共用引擎池时不会阻塞交互请求
+
+    Args:
+        fens: FEN的可迭代对象
+        pool: 引擎池，并行度等于池大小
+        time_limit: 每个局面的分析时间（秒）
+        multipv: 每个局面返回的最佳走法数量
+        progress: 每完成一个局面调用一次的进度回调
+        depth: 每个局面的搜索深度限制
+        nodes: 每个局面的搜索节点数限制；不设时间时结果可复现，便于缓存去重
+
+    Yields:
+        分析结果字典，额外包含输入序号index和原始fen
+    """
+    window = pool.size * 2
+    start = time.perf_counter()
+    submitted = completed = 0
+    pending: Dict[Future, Tuple[int, str]] = {}
+    source = iter(fens)
+
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        while True:
+            # 补足在途任务
+            while len(pending) < window:
+                fen = next(source, None)
+                if fen is None:
+                    break
+                fen = fen.strip()
+                if not fen:
+                    continue
+                future = executor.submit(
+                    pool.analyze_position, fen, time_limit, multipv,
+                    depth=depth, nodes=nodes, priority=BATCH, session="batch"
+                )
+                pending[future] = (submitted, fen)
+                submitted += 1
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, fen = pending.pop(future)
+                result = dict(future.result())
+                result["index"] = index
+                result["fen"] = fen
+                completed += 1
+                if progress is not None:
+                    progress(completed, submitted, time.perf_counter() - start)
+                yield result
+
+
+def _print_progress(total: Optional[int]) -> ProgressCallback:
+    """生成输出到stderr的进度回调"""
+    def report(completed: int, submitted: int, elapsed: float):
+        rate = completed / elapsed if elapsed > 0 else 0.0
+        target = total if total is not None else submitted
+        print(f"\r已完成 {completed}/{target}  {rate:.2f} 局面/秒", end="", file=sys.stderr, flush=True)
+    return report
+
+
+def _count_lines(path: str) -> int:
+    """统计文件中的非空行数，用于进度显示"""
+    with open(path, encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """批量分析命令行入口"""
+    from .cache import AnalysisCache
+    from .store import AnalysisStore
+    from .tablebase import get_tablebase
+
+    parser = argparse.ArgumentParser(description="批量分析FEN，结果以JSONL按完成顺序输出")
+    parser.add_argument("--input", "-i", default="-", help="FEN列表文件，每行一个；默认读取stdin")
+    parser.add_argument("--output", "-o", default="-", help="JSONL输出文件；默认写到stdout")
+    parser.add_argument("--engine", default=os.getenv("STOCKFISH_PATH"), help="Stockfish路径")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="并行的Stockfish进程数")
+    parser.add_argument("--time-limit", type=float, default=1.0, help="每个局面的分析时间（秒），0表示不限时间")
+    parser.add_argument("--depth", type=int, help="每个局面的搜索深度")
+    parser.add_argument("--nodes", type=int, help="每个局面的搜索节点数（配合 --time-limit 0 得到可复现的结果）")
+    parser.add_argument("--multipv", type=int, default=1)
+    parser.add_argument("--db", default=os.getenv("ANALYSIS_DB_PATH"), help="可选的持久化存储，跨运行复用已分析的局面")
+    parser.add_argument("--quiet", action="store_true", help="不显示进度")
+    args = parser.parse_args(argv)
+
+    if not args.engine:
+        parser.error("请通过 --engine 或 STOCKFISH_PATH 指定引擎路径")
+    if not (args.time_limit or args.depth or args.nodes):
+        parser.error("需要 --time-limit、--depth 或 --nodes 中至少一个限制")
+
+    total = None
+    if args.input == "-":
+        source = sys.stdin
+    else:
+        total = _count_lines(args.input)
+        source = open(args.input, encoding="utf-8")
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+
+    # 始终带内存缓存：输入里重复的局面（深度/节点数限制时结果可复现）只分析一次
+    store = AnalysisStore(args.db) if args.db else None
+    cache = AnalysisCache(store=store)
+    progress = None if args.quiet else _print_progress(total)
+    start = time.perf_counter()
+    count = failed = 0
+
+    try:
+        with EnginePool(args.engine, size=args.workers, cache=cache, tablebase=get_tablebase()) as pool:
+            results = analyze_batch(
+                source, pool, args.time_limit, args.multipv, progress,
+                depth=args.depth, nodes=args.nodes
+            )
+            for result in results:
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                output.flush()
+                count += 1
+                if not result["success"]:
+                    failed += 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+        if store is not None:
+            store.close()
+
+    elapsed = time.perf_counter() - start
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(f"共 {count} 个局面（失败 {failed}），耗时 {elapsed:.1f}s，"
+          f"{count / elapsed if elapsed > 0 else 0:.2f} 局面/秒", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
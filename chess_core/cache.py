@@ -0,0 +1,214 @@
+"""
+分析结果缓存
+按局面（Zobrist哈希）缓存引擎分析结果，同一局面经不同走法顺序到达也能命中
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+import chess
+
+from .utils import encode_position, position_hash
+
+if TYPE_CHECKING:
+    from .store import AnalysisStore
+
+
+def position_key(board: chess.Board) -> Optional[bytes]:
+    """局面的紧凑编码（不含回合计数），用于确认哈希命中的确是同一局面；Chess960易位权返回None"""
+    try:
+        return encode_position(board, clocks=False)
+    except ValueError:
+        return None
+
+
+class CacheEntry:
+    """单条缓存记录"""
+
+    __slots__ = ("result", "depth", "multipv", "time_limit", "nodes", "position", "size")
+
+    def __init__(
+        self,
+        result: Dict[str, Any],
+        depth: int,
+        multipv: int,
+        time_limit: float,
+        position: Optional[bytes] = None
+    ):
+        # FEN不随结果保存，命中时换成请求方的FEN；局面由紧凑编码position记录
+        self.result = {key: value for key, value in result.items() if key != "fen"}
+        self.position = position
+        self.depth = depth
+        self.multipv = multipv
+        # 按深度/节点数限制的搜索也实际花了时间，取两者较大值
+        self.time_limit = max(time_limit or 0.0, result.get("time", 0.0))
+        self.nodes = result.get("nodes", 0)
+        # 近似内存占用：序列化后的长度加上固定的对象开销
+        self.size = len(json.dumps(self.result, ensure_ascii=False)) + len(position or b"") + 200
+
+    def matches(self, position: Optional[bytes]) -> bool:
+        """是否是同一局面（排除64位哈希碰撞；任一方没有编码时只能信任哈希）"""
+        return self.position is None or position is None or self.position == position
+
+    def satisfies(self, multipv: int, depth: int, time_limit: float, nodes: int) -> bool:
+        """缓存的搜索是否至少和请求的一样深、一样宽"""
+        return (
+            self.multipv >= multipv
+            and self.depth >= depth
+            and self.time_limit >= time_limit
+            and self.nodes >= nodes
+        )
+
+
+class AnalysisCache:
+    """LRU分析缓存类，按内存上限淘汰"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, store: Optional["AnalysisStore"] = None):
+        """
+        初始化缓存
+
+        Args:
+            max_bytes: 缓存内存上限（字节，近似值）
+            store: 可选的持久化存储，内存未命中时回查，写入时同步写入
+        """
+        self.max_bytes = max_bytes
+        self.store = store
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key_for(fen: str) -> int:
+        """
+        计算FEN对应的缓存键
+
+        Raises:
+            ValueError: FEN格式错误
+        """
+        return position_hash(chess.Board(fen))
+
+    def get(
+        self,
+        fen: str,
+        multipv: int = 1,
+        depth: Optional[int] = 0,
+        time_limit: Optional[float] = 0.0,
+        nodes: Optional[int] = 0
+    ) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存，只有缓存的搜索在各项限制上都不低于请求时才算命中；
+        带深度/节点数限制的请求中时间只是上限，不参与比较
+
+        Args:
+            fen: FEN格式的棋盘状态
+            multipv: 请求的最佳走法数量
+            depth: 请求的搜索深度
+            time_limit: 请求的分析时间（秒）
+            nodes: 请求的搜索节点数
+
+        Returns:
+            分析结果字典，未命中返回None
+        """
+        board = chess.Board(fen)
+        key = position_hash(board)
+        position = position_key(board)
+        if depth or nodes:
+            time_limit = 0.0
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None and self.store is not None:
+            entry = self._load(key)
+
+        with self._lock:
+            if (
+                entry is None
+                or not entry.matches(position)
+                or not entry.satisfies(multipv, depth or 0, time_limit or 0.0, nodes or 0)
+            ):
+                self.misses += 1
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+
+        result = dict(entry.result)
+        result["fen"] = fen
+        result["best_moves"] = entry.result["best_moves"][:multipv]
+        result["cached"] = True
+        return result
+
+    def put(self, result: Dict[str, Any], multipv: int, time_limit: Optional[float] = 0.0):
+        """
+        写入一条成功的分析结果；已有更深的记录时不覆盖
+
+        深度和节点数取自结果本身，因此按深度/节点数限制的分析同样可以缓存
+
+        Args:
+            result: analyze_position返回的结果字典
+            multipv: 本次分析的multipv
+            time_limit: 本次分析的时间限制（秒）；同时带深度/节点数限制时搜索可能提前结束，
+                应传None，以结果中的实际用时为准
+        """
+        if not result.get("success"):
+            return
+        board = chess.Board(result["fen"])
+        key = position_hash(board)
+        entry = CacheEntry(result, result.get("depth", 0), multipv, time_limit, position_key(board))
+        if self.store is not None:
+            self.store.put(key, entry.result, entry.depth, multipv, entry.time_limit, entry.position)
+        self._insert(key, entry)
+
+    def _load(self, key: int) -> Optional[CacheEntry]:
+        """从持久化存储读取一条记录并放入内存"""
+        stored = self.store.get(key)
+        if stored is None:
+            return None
+        entry = CacheEntry(*stored)
+        self._insert(key, entry)
+        return entry
+
+    def _insert(self, key: int, entry: CacheEntry):
+        """放入内存LRU，按内存上限淘汰最久未用的记录"""
+        with self._lock:
+            old = self._entries.get(key)
+            if old is not None:
+                # 已有记录至少同样深、同样宽时保留，同深度但更窄的结果不会覆盖更宽的
+                if old.depth >= entry.depth and old.multipv >= entry.multipv:
+                    self._entries.move_to_end(key)
+                    return
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._bytes += entry.size
+
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """获取命中率等统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
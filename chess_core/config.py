@@ -0,0 +1,172 @@
+"""
+引擎配置与分析配置档
+UCI选项从环境变量读取；分析配置档（quick/deep/batch）供界面和对话工具按名称选择
+"""
+
+import os
+from typing import Any, Dict, List, Optional
+
+
+class EngineConfig:
+    """Stockfish进程配置类"""
+
+    def __init__(
+        self,
+        engine_path: Optional[str] = None,
+        pool_size: int = 2,
+        threads: Optional[int] = None,
+        hash_mb: int = 64,
+        eval_file: Optional[str] = None,
+        move_overhead: Optional[int] = None,
+        syzygy_path: Optional[str] = None,
+        syzygy_probe_limit: Optional[int] = None,
+        min_engines: int = 1,
+        idle_timeout: float = 300.0
+    ):
+        """
+        Args:
+            engine_path: Stockfish可执行文件路径
+            pool_size: 引擎进程数量
+            threads: 每个进程的搜索线程数，默认按CPU核数平均分给各进程
+            hash_mb: 每个进程的置换表大小（MB）
+            eval_file: NNUE网络文件路径
+            move_overhead: UCI Move Overhead（毫秒）
+            syzygy_path: Syzygy残局库目录
+            syzygy_probe_limit: 查询残局库的最大子力数，0表示不查询
+            min_engines: 始终保持运行（预热）的进程数量，其余进程按需启动
+            idle_timeout: 进程空闲超过该秒数即关闭以释放内存，0表示从不关闭
+        """
+        self.engine_path = engine_path
+        self.pool_size = max(1, pool_size)
+        self.threads = threads or max(1, (os.cpu_count() or 1) // self.pool_size)
+        self.hash_mb = hash_mb
+        self.eval_file = eval_file
+        self.move_overhead = move_overhead
+        self.syzygy_path = syzygy_path
+        self.syzygy_probe_limit = syzygy_probe_limit
+        self.min_engines = max(0, min(min_engines, self.pool_size))
+        self.idle_timeout = idle_timeout
+
+    @classmethod
+    def from_env(cls, engine_path: Optional[str] = None) -> "EngineConfig":
+        """
+        从环境变量读取配置：
+        STOCKFISH_PATH、STOCKFISH_POOL_SIZE、STOCKFISH_THREADS、STOCKFISH_HASH、
+        STOCKFISH_EVAL_FILE、STOCKFISH_MOVE_OVERHEAD、STOCKFISH_SYZYGY_PATH、
+        STOCKFISH_SYZYGY_PROBE_LIMIT、STOCKFISH_MIN_ENGINES、STOCKFISH_IDLE_TIMEOUT
+        """
+        def env_int(name: str) -> Optional[int]:
+            value = os.getenv(name)
+            return int(value) if value else None
+
+        min_engines = env_int("STOCKFISH_MIN_ENGINES")
+        return cls(
+            engine_path=engine_path or os.getenv("STOCKFISH_PATH"),
+            pool_size=env_int("STOCKFISH_POOL_SIZE") or 2,
+            threads=env_int("STOCKFISH_THREADS"),
+            hash_mb=env_int("STOCKFISH_HASH") or 64,
+            eval_file=os.getenv("STOCKFISH_EVAL_FILE") or None,
+            move_overhead=env_int("STOCKFISH_MOVE_OVERHEAD"),
+            syzygy_path=os.getenv("STOCKFISH_SYZYGY_PATH") or None,
+            syzygy_probe_limit=env_int("STOCKFISH_SYZYGY_PROBE_LIMIT"),
+            min_engines=1 if min_engines is None else min_engines,
+            idle_timeout=float(os.getenv("STOCKFISH_IDLE_TIMEOUT") or 300)
+        )
+
+    def uci_options(self) -> Dict[str, Any]:
+        """启动进程后要设置的UCI选项（未配置的项保持引擎默认值）"""
+        options: Dict[str, Any] = {
+            "Threads": self.threads,
+            "Hash": self.hash_mb
+        }
+        if self.eval_file:
+            options["EvalFile"] = self.eval_file
+        if self.move_overhead is not None:
+            options["Move Overhead"] = self.move_overhead
+        if self.syzygy_path:
+            options["SyzygyPath"] = self.syzygy_path
+            if self.syzygy_probe_limit is not None:
+                options["SyzygyProbeLimit"] = self.syzygy_probe_limit
+        return options
+
+    def pool_kwargs(self) -> Dict[str, Any]:
+        """可直接传给EnginePool/AsyncEnginePool的关键字参数"""
+        return {
+            "engine_path": self.engine_path,
+            "size": self.pool_size,
+            "options": self.uci_options(),
+            "min_engines": self.min_engines,
+            "idle_timeout": self.idle_timeout
+        }
+
+
+class AnalysisProfile:
+    """
+    分析配置档类
+
+    配置档只调整搜索限制和multipv，不在单次搜索中覆盖Threads：
+    Stockfish修改Threads会重建线程池并清空置换表，搜索前后各改一次，
+    每次都从冷置换表开始；需要更多线程时调整STOCKFISH_THREADS
+    """
+
+    def __init__(
+        self,
+        name: str,
+        label: str,
+        time_limit: float,
+        multipv: int
+    ):
+        """
+        Args:
+            name: 配置档名称（quick/deep/batch）
+            label: 界面显示名称
+            time_limit: 分析时间（秒）
+            multipv: 最佳走法数量
+        """
+        self.name = name
+        self.label = label
+        self.time_limit = time_limit
+        self.multipv = multipv
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        return {
+            "name": self.name,
+            "label": self.label,
+            "time_limit": self.time_limit,
+            "multipv": self.multipv
+        }
+
+
+PROFILES: Dict[str, AnalysisProfile] = {
+    "quick": AnalysisProfile("quick", "快速", time_limit=0.5, multipv=3),
+    "deep": AnalysisProfile("deep", "深入", time_limit=5.0, multipv=5),
+    "batch": AnalysisProfile("batch", "批量", time_limit=0.2, multipv=1),
+}
+
+DEFAULT_PROFILE = "quick"
+
+# 按深度/节点数限制的交互式分析仍附带的时间上限（秒），防止一次请求长期占用引擎
+MAX_ANALYSIS_TIME = 30.0
+
+# 无限分析在服务端的时间上限（秒）：客户端断开而生成器没有被关闭时，
+# 搜索最迟在此时结束并归还引擎，引擎池不会因此逐个流失
+INFINITE_ANALYSIS_MAX = float(os.getenv("INFINITE_ANALYSIS_MAX") or 600)
+
+
+def get_profile(name: Optional[str]) -> AnalysisProfile:
+    """
+    按名称获取分析配置档，名称未知或为空时返回默认配置档
+
+    Args:
+        name: 配置档名称
+
+    Returns:
+        分析配置档
+    """
+    return PROFILES.get(name or DEFAULT_PROFILE, PROFILES[DEFAULT_PROFILE])
+
+
+def profile_names() -> List[str]:
+    """全部配置档名称"""
+    return list(PROFILES)
@@ -3,25 +3,221 @@ Stockfish引擎封装
 提供棋局分析功能
 """
 
+import asyncio
+import atexit
 import chess
 import chess.engine
+import concurrent.futures
 import os
+import threading
 import time
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from .utils import position_hash
+
+
+# 视为引擎故障的异常：进程退出（EOF）、协议错误、搜索超时。出现后必须重启进程
+ENGINE_FAULTS = (
+    chess.engine.EngineError,
+    asyncio.TimeoutError,
+    concurrent.futures.TimeoutError
+)
+
+# 看门狗：搜索超过时间限制这么多秒仍未返回即视为卡死
+WATCHDOG_GRACE = 10.0
+# 看门狗：只按深度/节点数限制的搜索允许的最长时间（秒）
+WATCHDOG_UNTIMED = 600.0
+
+
+def format_score(score: chess.engine.Score) -> str:
+    """
+    格式化单个走法的评估值（白方视角）
+    
+    Args:
+        score: 白方视角的评估分数
+    
+    Returns:
+        评估字符串
+    """
+    if score.is_mate():
+        return f"马在{abs(score.mate())}步"
+    return f"{score.score()/100:+.2f}"
+
+
+def build_analysis_result(
+    fen: str,
+    info: List[Dict[str, Any]],
+    multipv: int = 3
+) -> Dict[str, Any]:
+    """
+    将引擎的multipv分析信息整理为统一的结果字典
+    
+    Args:
+        fen: 被分析局面的FEN
+        info: engine.analyse返回的multipv信息列表
+        multipv: 返回的最佳走法数量
+    
+    Returns:
+        包含分析结果的字典
+    """
+    board = chess.Board(fen)
+    main = info[0]
+    
+    # 获取评估值
+    score = main["score"].white()
+    if score.is_mate():
+        mate_in = score.mate()
+        eval_str = f"马在{abs(mate_in)}步内将死"
+        eval_value = 100.0 if mate_in > 0 else -100.0
+    else:
+        eval_value = score.score() / 100.0
+        eval_str = f"{eval_value:+.2f}"
+    
+    # 最佳走法即主变的第一步
+    pv = main.get("pv", [])
+    best_move = board.san(pv[0]) if pv else None
+    
+    # 获取后续变化
+    variations = []
+    if pv:
+        pv_board = board.copy(stack=False)
+        pv_moves = []
+        for move in pv[:8]:
+            try:
+                pv_moves.append(pv_board.san(move))
+                pv_board.push(move)
+            except Exception:
+                break
+        variations.append(" → ".join(pv_moves))
+    
+    # 获取多个最佳走法
+    best_moves = []
+    for i, analysis in enumerate(info[:multipv]):
+        move = analysis["pv"][0] if analysis.get("pv") else None
+        if move:
+            best_moves.append({
+                "rank": i + 1,
+                "move": board.san(move),
+                "evaluation": format_score(analysis["score"].white())
+            })
+    
+    return {
+        "success": True,
+        "fen": fen,
+        "best_move": best_move,
+        "evaluation": eval_str,
+        "eval_value": eval_value,
+        "variations": variations,
+        "best_moves": best_moves,
+        "depth": main.get("depth", 0),
+        "nodes": main.get("nodes", 0),
+        "nps": main.get("nps", 0),
+        "time": main.get("time", 0)
+    }
+
+
+def make_limit(
+    time_limit: Optional[float] = None,
+    depth: Optional[int] = None,
+    nodes: Optional[int] = None
+) -> Optional[chess.engine.Limit]:
+    """
+    组合时间、深度和节点数限制，任一条件达到即停止搜索
+    
+    只给深度/节点数（不给时间）时，单线程下的搜索结果可以在不同机器上复现
+    
+    Args:
+        time_limit: 分析时间（秒）
+        depth: 搜索深度
+        nodes: 搜索节点数
+    
+    Returns:
+        搜索限制；三者都为空（或0）时返回None，表示无限分析
+    """
+    if not (time_limit or depth or nodes):
+        return None
+    return chess.engine.Limit(
+        time=time_limit or None,
+        depth=depth or None,
+        nodes=nodes or None
+    )
+
+
+def request_key(
+    fen: str,
+    multipv: int,
+    time_limit: Optional[float] = None,
+    depth: Optional[int] = None,
+    nodes: Optional[int] = None,
+    options: Optional[Dict[str, Any]] = None
+) -> Tuple:
+    """
+    分析请求的合并键：局面（Zobrist哈希）和全部搜索参数都相同的并发请求共用一次搜索
+    
+    Raises:
+        ValueError: FEN格式错误
+    """
+    return (
+        position_hash(chess.Board(fen)),
+        multipv,
+        time_limit or None,
+        depth or None,
+        nodes or None,
+        tuple(sorted((options or {}).items()))
+    )
+
+
+def search_deadline(limit: Optional[chess.engine.Limit]) -> Optional[float]:
+    """
+    看门狗超时时间
+    
+    Args:
+        limit: 搜索限制
+    
+    Returns:
+        有时间限制时为时间加宽限，只有深度/节点数时为固定上限，无限分析返回None
+    """
+    if limit is None:
+        return None
+    if limit.time is not None:
+        return limit.time + WATCHDOG_GRACE
+    return WATCHDOG_UNTIMED
+
+
+def lines_complete(lines: List[Dict[str, Any]]) -> bool:
+    """所有主变都已有评估和走法时，才算一条可用的阶段性结果"""
+    return bool(lines) and all("score" in line and line.get("pv") for line in lines)
+
+
+def stream_result(
+    fen: str,
+    lines: List[Dict[str, Any]],
+    multipv: int,
+    final: bool,
+    stopped: bool
+) -> Dict[str, Any]:
+    """生成流式分析的阶段性结果"""
+    result = build_analysis_result(fen, lines, multipv)
+    result["final"] = final
+    result["stopped"] = stopped
+    return result
 
 
 class StockfishEngine:
     """Stockfish引擎封装类"""
     
-    def __init__(self, engine_path: str):
+    def __init__(self, engine_path: str, options: Optional[Dict[str, Any]] = None):
         """
         初始化引擎
         
         Args:
             engine_path: Stockfish可执行文件路径
+            options: 启动后设置的UCI选项，例如 {"Threads": 2, "Hash": 64}
         """
         self.engine_path = engine_path
+        self.options = dict(options or {})
         self.engine = None
+        self.restarts = 0
         self._check_engine()
     
     def _check_engine(self):
@@ -36,12 +232,112 @@ class StockfishEngine:
         """确保引擎已启动"""
         if self.engine is None:
             self.engine = chess.engine.SimpleEngine.popen_uci(self.engine_path)
+            if self.options:
+                self.engine.configure(self.options)
+    
+    def start(self):
+        """启动引擎进程（已启动时不做任何事）"""
+        self._ensure_engine()
+    
+    def is_started(self) -> bool:
+        """进程是否已启动（尚未启动或已关闭时为False）"""
+        return self.engine is not None
+    
+    def is_alive(self) -> bool:
+        """检查引擎进程是否仍在运行"""
+        if self.engine is None:
+            return False
+        return not self.engine.protocol.returncode.done()
+    
+    def ping(self) -> bool:
+        """
+        健康检查：发送isready并等待readyok
+        
+        Returns:
+            引擎是否正常响应
+        """
+        if not self.is_alive():
+            return False
+        try:
+            self.engine.ping()
+            return True
+        except Exception:
+            return False
+    
+    def restart(self):
+        """强制结束当前进程并重新启动引擎"""
+        self.kill()
+        self.restarts += 1
+        self._ensure_engine()
+    
+    def kill(self):
+        """强制关闭引擎进程（用于已崩溃或无响应的引擎）"""
+        if self.engine:
+            try:
+                self.engine.close()
+            except Exception:
+                pass
+            self.engine = None
+    
+    def search(
+        self,
+        board: chess.Board,
+        limit: chess.engine.Limit,
+        multipv: int = 1,
+        game: object = None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        执行一次搜索，返回引擎原始的multipv信息列表
+        
+        搜索受看门狗监督（见search_deadline）：引擎退出、协议出错或超时未返回时
+        强制重启进程并重试一次；重试仍失败则再次重启后抛出异常
+        
+        Args:
+            board: 棋盘对象（带走法栈时引擎会收到完整的走法序列）
+            limit: 搜索限制
+            multipv: 搜索的主变数量
+            game: 对局标识；连续搜索传入同一个对象时不发送ucinewgame，
+                  引擎的置换表得以保留
+            options: 仅本次搜索生效的UCI选项（例如Threads），搜索后自动恢复
+        
+        Returns:
+            每条主变一个信息字典
+        
+        Raises:
+            chess.engine.EngineError: 重启后引擎仍然出错
+            TimeoutError: 重启后搜索仍然超时
+        """
+        for attempt in range(2):
+            try:
+                self._ensure_engine()
+                protocol = self.engine.protocol
+                coro = asyncio.wait_for(
+                    protocol.analyse(
+                        board,
+                        limit,
+                        multipv=multipv,
+                        game=game,
+                        info=chess.engine.INFO_ALL,
+                        options=options or {}
+                    ),
+                    search_deadline(limit)
+                )
+                return asyncio.run_coroutine_threadsafe(coro, protocol.loop).result()
+            except ENGINE_FAULTS:
+                # 崩溃或卡死的进程不能再用，无论是否重试都先换一个新进程
+                self.restart()
+                if attempt:
+                    raise
     
     def analyze_position(
         self, 
         fen: str, 
-        time_limit: float = 2.0,
-        multipv: int = 3
+        time_limit: Optional[float] = 2.0,
+        multipv: int = 3,
+        options: Optional[Dict[str, Any]] = None,
+        depth: Optional[int] = None,
+        nodes: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         分析棋盘位置
@@ -50,6 +346,9 @@ class StockfishEngine:
             fen: FEN格式的棋盘状态
             time_limit: 分析时间限制（秒）
             multipv: 返回的最佳走法数量
+            options: 仅本次搜索生效的UCI选项（来自分析配置档）
+            depth: 搜索深度限制
+            nodes: 搜索节点数限制
         
         Returns:
             包含分析结果的字典
@@ -58,74 +357,19 @@ class StockfishEngine:
             # 验证FEN
             board = chess.Board(fen)
             
-            # 启动引擎
-            self._ensure_engine()
-            
-            # 设置分析限制
-            limit = chess.engine.Limit(time=time_limit)
-            
-            # 获取最佳走法
-            result = self.engine.play(board, limit)
+            # 设置分析限制：时间/深度/节点数任一达到即停止
+            limit = make_limit(time_limit, depth, nodes)
+            if limit is None:
+                return {
+                    "success": False,
+                    "error": "分析失败: 需要时间、深度或节点数限制"
+                }
             
-            # 获取详细分析
-            info = self.engine.analyse(
-                board, 
-                limit,
-                multipv=multipv,
-                info=chess.engine.INFO_ALL
-            )
-            
-            # 获取评估值
-            score = info[0]["score"].white()
-            if score.is_mate():
-                mate_in = score.mate()
-                eval_str = f"马在{abs(mate_in)}步内将死"
-                eval_value = 100.0 if mate_in > 0 else -100.0
-            else:
-                eval_value = score.score() / 100.0
-                eval_str = f"{eval_value:+.2f}"
-            
-            # 获取后续变化
-            variations = []
-            if "pv" in info[0]:
-                pv_moves = []
-                for move in info[0]["pv"][:8]:
-                    try:
-                        pv_moves.append(board.san(move))
-                        board.push(move)
-                    except:
-                        break
-                variations.append(" → ".join(pv_moves))
-            
-            # 获取多个最佳走法
-            best_moves = []
-            for i, analysis in enumerate(info[:multipv]):
-                move = analysis["pv"][0] if "pv" in analysis else None
-                if move:
-                    move_san = chess.Board(fen).san(move)
-                    score = analysis["score"].white()
-                    if score.is_mate():
-                        move_eval = f"马在{abs(score.mate())}步"
-                    else:
-                        move_eval = f"{score.score()/100:+.2f}"
-                    best_moves.append({
-                        "rank": i + 1,
-                        "move": move_san,
-                        "evaluation": move_eval
-                    })
+            # 单次搜索：最佳走法、多PV、评估、深度和节点数都取自同一次analyse，
+            # 不再额外调用play()，每次请求只消耗一份time_limit
+            info = self.search(board, limit, multipv=multipv, options=options)
             
-            return {
-                "success": True,
-                "fen": fen,
-                "best_move": chess.Board(fen).san(result.move),
-                "evaluation": eval_str,
-                "eval_value": eval_value,
-                "variations": variations,
-                "best_moves": best_moves,
-                "depth": info[0].get("depth", 0),
-                "nodes": info[0].get("nodes", 0),
-                "time": info[0].get("time", 0)
-            }
+            return build_analysis_result(fen, info, multipv)
             
         except ValueError as e:
             return {
@@ -138,6 +382,105 @@ class StockfishEngine:
                 "error": f"分析失败: {str(e)}"
             }
     
+    def analyze_stream(
+        self,
+        fen: str,
+        time_limit: Optional[float] = 2.0,
+        multipv: int = 3,
+        min_interval: float = 0.2,
+        stop_event: Optional[threading.Event] = None,
+        options: Optional[Dict[str, Any]] = None,
+        depth: Optional[int] = None,
+        nodes: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        流式分析：随搜索加深不断产出阶段性结果
+        
+        第一条完整的主变出现后立即产出，之后最多每min_interval秒产出一次，
+        搜索结束（或被停止）时再产出一次final为True的最终结果。
+        提前关闭生成器、设置stop_event都会立刻停止搜索。
+        
+        Args:
+            fen: FEN格式的棋盘状态
+            time_limit: 分析时间限制（秒）；与depth、nodes都为空时表示无限分析直到被停止
+            multipv: 返回的最佳走法数量
+            min_interval: 两次产出之间的最短间隔（秒）
+            stop_event: 外部停止信号
+            options: 仅本次搜索生效的UCI选项
+            depth: 搜索深度限制
+            nodes: 搜索节点数限制
+        
+        Yields:
+            与analyze_position格式相同的结果字典，额外包含nps、final和stopped
+        """
+        try:
+            board = chess.Board(fen)
+        except ValueError as e:
+            yield {"success": False, "error": f"FEN格式错误: {str(e)}"}
+            return
+        limit = make_limit(time_limit, depth, nodes)
+        
+        lines: List[Dict[str, Any]] = []
+        stopped = False
+        for attempt in range(2):
+            try:
+                self._ensure_engine()
+                analysis = self.engine.analysis(
+                    board,
+                    limit,
+                    multipv=multipv,
+                    info=chess.engine.INFO_ALL,
+                    options=options or {}
+                )
+            except ENGINE_FAULTS as e:
+                self.restart()
+                if attempt:
+                    yield {"success": False, "error": f"分析失败: {str(e)}"}
+                    return
+                continue
+            except Exception as e:
+                yield {"success": False, "error": f"分析失败: {str(e)}"}
+                return
+            
+            last_yield = None
+            faulted = False
+            try:
+                for _ in analysis:
+                    if stop_event is not None and stop_event.is_set():
+                        stopped = True
+                        break
+                    current = analysis.multipv
+                    if not lines_complete(current):
+                        continue
+                    lines = current
+                    now = time.monotonic()
+                    if last_yield is not None and now - last_yield < min_interval:
+                        continue
+                    last_yield = now
+                    yield stream_result(fen, lines, multipv, final=False, stopped=False)
+            except ENGINE_FAULTS:
+                faulted = True
+            finally:
+                # 生成器被提前关闭时同样会走到这里，确保引擎回到空闲状态
+                try:
+                    analysis.stop()
+                    analysis.wait()
+                except Exception:
+                    pass
+            
+            if not faulted and self.is_alive():
+                break
+            # 进程在搜索途中退出或出错：重启；还没有产出过结果时透明地重试一次
+            self.restart()
+            if lines or attempt:
+                yield {"success": False, "error": "分析失败: 引擎进程意外退出"}
+                return
+        
+        if lines:
+            yield stream_result(fen, lines, multipv, final=True, stopped=stopped)
+        else:
+            yield {"success": False, "error": "分析失败: 引擎没有返回结果"}
+    
     def quit(self):
         """关闭引擎"""
         if self.engine:
@@ -152,14 +495,64 @@ class StockfishEngine:
         self.quit()
 
 
-# 全局单例
+def engine_pool_settings(engine_path: str = None) -> Dict[str, Any]:
+    """
+    从环境变量读取引擎池配置（详见config.EngineConfig.from_env）
+    
+    Returns:
+        可直接传给EnginePool/AsyncEnginePool的关键字参数
+    """
+    from .config import EngineConfig
+    
+    return EngineConfig.from_env(engine_path).pool_kwargs()
+
+
+# 全局分析缓存单例（同步引擎池和异步引擎池共用）
+_cache_instance = None
+_cache_lock = threading.Lock()
+
+def get_analysis_cache() -> "AnalysisCache":
+    """
+    获取全局分析缓存单例
+    
+    内存上限由ANALYSIS_CACHE_MB设置；设置ANALYSIS_DB_PATH时
+    分析结果还会持久化到该SQLite文件
+    """
+    from .cache import AnalysisCache
+    from .store import AnalysisStore
+    
+    global _cache_instance
+    with _cache_lock:
+        if _cache_instance is None:
+            store = None
+            db_path = os.getenv("ANALYSIS_DB_PATH")
+            if db_path:
+                store = AnalysisStore(db_path)
+                atexit.register(store.close)
+            _cache_instance = AnalysisCache(
+                int(os.getenv("ANALYSIS_CACHE_MB", "64")) * 1024 * 1024,
+                store=store
+            )
+    return _cache_instance
+
+
+# 全局引擎池单例
 _engine_instance = None
+_engine_lock = threading.Lock()
 
-def get_engine(engine_path: str = None) -> StockfishEngine:
-    """获取引擎单例"""
+def get_engine(engine_path: str = None) -> "EnginePool":
+    """获取全局（同步）引擎池单例，配置见engine_pool_settings"""
+    from .opening import get_opening_index
+    from .pool import EnginePool
+    from .tablebase import get_tablebase
+    
     global _engine_instance
-    if _engine_instance is None:
-        if engine_path is None:
-            engine_path = os.getenv("STOCKFISH_PATH")
-        _engine_instance = StockfishEngine(engine_path)
-    return _engine_instance
\ No newline at end of file
+    with _engine_lock:
+        if _engine_instance is None:
+            _engine_instance = EnginePool(
+                cache=get_analysis_cache(),
+                tablebase=get_tablebase(),
+                openings=get_opening_index(),
+                **engine_pool_settings(engine_path)
+            )
+    return _engine_instance
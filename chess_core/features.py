@@ -0,0 +1,243 @@
+"""
+批量局面特征
+把大量局面一次性转换为 (N, 12, 64) 的位平面数组，用NumPy向量化计算子力、对局阶段等特征，
+代替逐个局面调用get_piece_value/get_game_phase；需要安装numpy（可选依赖）
+
+命令行用法：
+    python -m chess_core.features --input puzzles.txt --output features.jsonl
+"""
+
+import argparse
+import json
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import chess
+
+from .utils import ENDGAME_PIECES, OPENING_PIECES, PIECE_VALUES
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# 12个位平面的顺序：白方兵马象车后王，黑方兵马象车后王
+PLANE_SYMBOLS = "PNBRQKpnbrqk"
+
+# 对局阶段编号，与get_game_phase的返回值对应
+PHASE_NAMES = ["开局", "中局", "残局"]
+
+# FEN棋盘字段展开：数字换成对应个数的空格占位符，斜线保留，合法的字段展开后为71个字符
+_EXPAND_FEN = {ord(str(n)): "." * n for n in range(1, 9)}
+# 棋盘字段中允许的字符（棋子字母、空格数字、横排分隔符）全部删除，剩下的就是无效字符
+_DROP_PLACEMENT = str.maketrans("", "", PLANE_SYMBOLS + "12345678/")
+
+Position = Union[str, chess.Board]
+
+
+def _require_numpy():
+    """未安装numpy时给出明确的错误"""
+    if np is None:
+        raise ImportError("批量特征需要numpy: pip install numpy")
+
+
+def _placement(position: Position) -> str:
+    """
+    局面的棋盘字段展开为64个字符（从a8到h1，与FEN顺序相同）
+
+    Raises:
+        ValueError: 棋盘字段不是8个横排、某一横排不是8格，或含有棋子字母以外的字符
+    """
+    if isinstance(position, chess.Board):
+        return position.board_fen().translate(_EXPAND_FEN).replace("/", "")
+    fen = position.strip().split(" ", 1)[0]
+    expanded = fen.translate(_EXPAND_FEN)
+    # 每个横排恰好8格时，7个斜线依次落在第9、18……个字符上
+    if len(expanded) != 71 or expanded[8::9] != "///////" or fen.translate(_DROP_PLACEMENT):
+        raise ValueError(f"FEN棋盘字段无效: {fen}")
+    return expanded.replace("/", "")
+
+
+def positions_to_planes(positions: Sequence[Position]) -> "np.ndarray":
+    """
+    把一批局面转换为位平面数组
+
+    FEN只解析棋盘字段，不构造chess.Board，也不校验局面是否合法
+
+    Args:
+        positions: FEN字符串或棋盘对象
+
+    Returns:
+        形状为(N, 12, 64)的bool数组，平面顺序见PLANE_SYMBOLS，格子序号与chess.SQUARES相同
+
+    Raises:
+        ValueError: FEN棋盘字段无效
+    """
+    _require_numpy()
+    if not positions:
+        return np.zeros((0, 12, 64), dtype=bool)
+    text = "".join(_placement(position) for position in positions).encode("ascii")
+    chars = np.frombuffer(text, dtype=np.uint8).reshape(len(positions), 8, 8)
+    # FEN从第8横排开始，翻转横排后即为a1..h8的格子顺序
+    chars = chars[:, ::-1, :].reshape(len(positions), 64)
+    symbols = np.frombuffer(PLANE_SYMBOLS.encode("ascii"), dtype=np.uint8)
+    return chars[:, None, :] == symbols[None, :, None]
+
+
+def pack_planes(planes: "np.ndarray") -> "np.ndarray":
+    """
+    把位平面压缩为位棋盘
+
+    Args:
+        planes: positions_to_planes的结果
+
+    Returns:
+        形状为(N, 12)的uint64数组，与chess.Board.pieces_mask的位序相同
+    """
+    _require_numpy()
+    packed = np.packbits(planes, axis=-1, bitorder="little")
+    return np.ascontiguousarray(packed).view("<u8").reshape(planes.shape[0], 12)
+
+
+def piece_counts(planes: "np.ndarray") -> "np.ndarray":
+    """每个局面每种棋子的数量，形状(N, 12)"""
+    _require_numpy()
+    return planes.sum(axis=-1, dtype=np.int32)
+
+
+def batch_piece_values(positions: Sequence[Position]) -> "np.ndarray":
+    """
+    批量版get_piece_value
+
+    Returns:
+        形状为(N, 2)的数组：白方子力价值、黑方子力价值
+    """
+    counts = piece_counts(positions_to_planes(positions))
+    return _piece_values(counts)
+
+
+def batch_game_phase(positions: Sequence[Position]) -> List[str]:
+    """批量版get_game_phase，返回每个局面的开局/中局/残局"""
+    counts = piece_counts(positions_to_planes(positions))
+    return [PHASE_NAMES[code] for code in _phase_codes(counts)]
+
+
+def _piece_values(counts: "np.ndarray") -> "np.ndarray":
+    """由棋子数量计算双方子力价值"""
+    values = np.array([PIECE_VALUES[piece_type] for piece_type in chess.PIECE_TYPES], dtype=np.int32)
+    return np.stack([counts[:, :6] @ values, counts[:, 6:] @ values], axis=1)
+
+
+def _phase_codes(counts: "np.ndarray") -> "np.ndarray":
+    """由棋子总数计算对局阶段编号（见PHASE_NAMES）"""
+    total = counts.sum(axis=1)
+    return np.where(total > OPENING_PIECES, 0, np.where(total > ENDGAME_PIECES, 1, 2))
+
+
+def batch_features(positions: Sequence[Position]) -> Dict[str, "np.ndarray"]:
+    """
+    一次计算一批局面的常用特征
+
+    Args:
+        positions: FEN字符串或棋盘对象
+
+    Returns:
+        特征名 -> 长度为N的数组：white_value、black_value、material_balance、
+        piece_count、phase（见PHASE_NAMES）、white_pawns、black_pawns、
+        white_bishop_pair、black_bishop_pair、queens、white_to_move
+    """
+    planes = positions_to_planes(positions)
+    counts = piece_counts(planes)
+    values = _piece_values(counts)
+    white_to_move = np.array([
+        position.turn == chess.WHITE if isinstance(position, chess.Board)
+        else position.split()[1:2] != ["b"]
+        for position in positions
+    ], dtype=bool)
+    return {
+        "white_value": values[:, 0],
+        "black_value": values[:, 1],
+        "material_balance": values[:, 0] - values[:, 1],
+        "piece_count": counts.sum(axis=1),
+        "phase": _phase_codes(counts),
+        "white_pawns": counts[:, 0],
+        "black_pawns": counts[:, 6],
+        "white_bishop_pair": counts[:, 2] >= 2,
+        "black_bishop_pair": counts[:, 8] >= 2,
+        "queens": counts[:, 4] + counts[:, 10],
+        "white_to_move": white_to_move
+    }
+
+
+def iter_feature_rows(fens: Iterable[str], chunk_size: int = 10000) -> Iterator[Dict[str, Any]]:
+    """
+    按块计算特征，逐个局面产出字典（输入按需读取，内存占用与chunk_size成正比）
+
+    无效的FEN产出带error的字典，不影响同一块中的其他局面
+
+    Args:
+        fens: FEN的可迭代对象
+        chunk_size: 每次向量化计算的局面数
+
+    Yields:
+        特征字典，额外包含fen和阶段名称phase_name
+    """
+    chunk: List[str] = []
+    for fen in fens:
+        fen = fen.strip()
+        if fen:
+            chunk.append(fen)
+        if len(chunk) >= chunk_size:
+            yield from _feature_rows(chunk)
+            chunk = []
+    if chunk:
+        yield from _feature_rows(chunk)
+
+
+def _feature_rows(fens: List[str]) -> Iterator[Dict[str, Any]]:
+    """计算一块局面的特征并拆成逐行字典"""
+    valid, rows = [], []
+    for fen in fens:
+        try:
+            _placement(fen)
+            valid.append(fen)
+            rows.append(None)
+        except ValueError as e:
+            rows.append({"fen": fen, "error": str(e)})
+    features = batch_features(valid)
+    index = 0
+    for row in rows:
+        if row is not None:
+            yield row
+            continue
+        row = {name: values[index].item() for name, values in features.items()}
+        row["fen"] = valid[index]
+        row["phase_name"] = PHASE_NAMES[row["phase"]]
+        index += 1
+        yield row
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """批量特征命令行入口"""
+    parser = argparse.ArgumentParser(description="批量计算局面的子力、阶段等特征，结果以JSONL输出")
+    parser.add_argument("--input", "-i", default="-", help="FEN列表文件，每行一个；默认读取stdin")
+    parser.add_argument("--output", "-o", default="-", help="JSONL输出文件；默认写到stdout")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="每次向量化计算的局面数")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        for row in iter_feature_rows(source, args.chunk_size):
+            output.write(json.dumps(row, ensure_ascii=False) + "\n")
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
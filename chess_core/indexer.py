@@ -0,0 +1,423 @@
+"""
+离线PGN语料索引
+把GB级的PGN按对局边界切块，多进程并行解析；每个进程汇总
+(局面哈希, 走法) -> 胜/和/负 计数，超过内存上限就把排好序的分段写到磁盘，
+最后多路归并成开局库索引（格式见opening.write_index）
+
+命令行用法：
+    python -m chess_core.indexer lichess_2024-01.pgn --out openings.idx --workers 8
+"""
+
+import argparse
+import heapq
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import chess
+import chess.polyglot
+
+from .opening import (
+    MAX_COUNT, RECORD, IndexRecord, encode_move, iter_polyglot, record_count, write_index
+)
+
+
+# 每个任务处理的PGN字节数
+DEFAULT_CHUNK_BYTES = 32 * 1024 * 1024
+# 单个进程内存中最多汇总的(哈希, 走法)条数，超过即落盘
+DEFAULT_MAX_ENTRIES = 2_000_000
+# 一次归并最多同时打开的分段文件数，超过时分多轮归并
+MERGE_FANOUT = 64
+# 分段文件的读写缓冲
+RUN_BUFFER = 1024 * 1024
+
+RESULTS = {
+    "1-0": (1, 0, 0),
+    "1/2-1/2": (0, 1, 0),
+    "0-1": (0, 0, 1),
+}
+
+# 棋谱正文中要去掉的注释、NAG和回合编号
+_COMMENT = re.compile(r"\{[^}]*\}|;[^\n]*")
+_VARIATION = re.compile(r"\([^()]*\)")
+_TOKEN_NOISE = re.compile(r"^\d+\.+|[!?]+$")
+
+
+def chunk_ranges(path: str, chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> List[Tuple[int, int]]:
+    """
+    把PGN文件按对局边界（以[Event开头的行）切成若干字节区间
+
+    Args:
+        path: PGN文件路径
+        chunk_bytes: 每块的目标大小
+
+    Returns:
+        [(起始偏移, 结束偏移)]
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    start = 0
+    with open(path, "rb") as f:
+        while start < size:
+            end = start + chunk_bytes
+            if end >= size:
+                ranges.append((start, size))
+                break
+            f.seek(end)
+            f.readline()
+            while True:
+                position = f.tell()
+                line = f.readline()
+                if not line:
+                    position = size
+                    break
+                if line.startswith(b"[Event "):
+                    break
+            ranges.append((start, position))
+            start = position
+    return ranges
+
+
+def _split_games(text: str) -> Iterator[Tuple[Dict[str, str], str]]:
+    """把一段PGN文本拆成(标签, 棋谱正文)"""
+    headers: Dict[str, str] = {}
+    movetext: List[str] = []
+    for line in text.splitlines():
+        if line.startswith("["):
+            if movetext:
+                yield headers, "\n".join(movetext)
+                headers, movetext = {}, []
+            name, _, value = line[1:].partition(" ")
+            headers[name] = value.rstrip().rstrip("]").strip('"')
+        elif line.strip() and not line.startswith("%"):
+            movetext.append(line)
+    if headers or movetext:
+        yield headers, "\n".join(movetext)
+
+
+def _mainline_sans(movetext: str, max_plies: int) -> List[str]:
+    """取出主线的前max_plies个SAN（去掉注释、变着、NAG和回合编号）"""
+    movetext = _COMMENT.sub(" ", movetext)
+    while "(" in movetext:
+        stripped = _VARIATION.sub(" ", movetext)
+        if stripped == movetext:
+            break
+        movetext = stripped
+    sans = []
+    for token in movetext.split():
+        token = _TOKEN_NOISE.sub("", token)
+        if not token or token.startswith("$") or token in ("1-0", "0-1", "1/2-1/2", "*"):
+            continue
+        sans.append(token)
+        if len(sans) >= max_plies:
+            break
+    return sans
+
+
+class _IncrementalHash:
+    """
+    增量计算的Zobrist哈希（与utils.position_hash结果相同）
+
+    每步只异或走动、被吃和升变的棋子，避免每个局面重新扫描全部棋子；
+    易位权、吃过路兵和轮到谁三项开销很小，每步重新计算
+    """
+
+    _hasher = chess.polyglot.ZobristHasher(chess.polyglot.POLYGLOT_RANDOM_ARRAY)
+    _array = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+
+    def __init__(self, board: chess.Board):
+        self.pieces = self._hasher.hash_board(board)
+
+    def _piece(self, piece_type: chess.PieceType, color: chess.Color, square: chess.Square) -> int:
+        return self._array[64 * ((piece_type - 1) * 2 + color) + square]
+
+    def value(self, board: chess.Board) -> int:
+        """当前局面的哈希"""
+        return (
+            self.pieces ^ self._hasher.hash_castling(board)
+            ^ self._hasher.hash_ep_square(board) ^ self._hasher.hash_turn(board)
+        )
+
+    def push(self, board: chess.Board, move: chess.Move):
+        """走子（先更新哈希，再在棋盘上走子）"""
+        color = board.turn
+        piece_type = board.piece_type_at(move.from_square)
+        pieces = self.pieces ^ self._piece(piece_type, color, move.from_square)
+        if board.is_castling(move):
+            rank = chess.square_rank(move.from_square)
+            kingside = chess.square_file(move.to_square) > chess.square_file(move.from_square)
+            rook_from = chess.square(7 if kingside else 0, rank)
+            rook_to = chess.square(5 if kingside else 3, rank)
+            pieces ^= self._piece(chess.ROOK, color, rook_from) ^ self._piece(chess.ROOK, color, rook_to)
+        elif board.is_en_passant(move):
+            captured = move.to_square - 8 if color == chess.WHITE else move.to_square + 8
+            pieces ^= self._piece(chess.PAWN, not color, captured)
+        else:
+            captured_type = board.piece_type_at(move.to_square)
+            if captured_type:
+                pieces ^= self._piece(captured_type, not color, move.to_square)
+        self.pieces = pieces ^ self._piece(move.promotion or piece_type, color, move.to_square)
+        board.push(move)
+
+
+class _Aggregator:
+    """进程内的汇总表，超过上限时把排好序的分段写入临时目录"""
+
+    def __init__(self, spill_dir: str, max_entries: int):
+        self.spill_dir = spill_dir
+        self.max_entries = max_entries
+        self.counts: Dict[Tuple[int, int], List[int]] = {}
+        self.runs: List[str] = []
+
+    def add(self, key: int, move: int, result: Tuple[int, int, int]):
+        counts = self.counts.get((key, move))
+        if counts is None:
+            if len(self.counts) >= self.max_entries:
+                self.spill()
+            counts = self.counts[key, move] = [0, 0, 0, 0]
+        counts[1] += result[0]
+        counts[2] += result[1]
+        counts[3] += result[2]
+
+    def spill(self):
+        """把当前汇总排序后写成一个分段文件"""
+        if not self.counts:
+            return
+        records = (
+            (key, move) + tuple(min(value, MAX_COUNT) for value in counts)
+            for (key, move), counts in sorted(self.counts.items())
+        )
+        self.runs.append(write_run(self.spill_dir, records))
+        self.counts = {}
+
+
+def write_run(spill_dir: str, records: Iterable[IndexRecord]) -> str:
+    """把按(哈希, 走法)排序的记录写成分段文件（无文件头）"""
+    fd, path = tempfile.mkstemp(suffix=".run", dir=spill_dir)
+    with os.fdopen(fd, "wb", buffering=RUN_BUFFER) as f:
+        for record in records:
+            f.write(RECORD.pack(*record))
+    return path
+
+
+def read_run(path: str) -> Iterator[IndexRecord]:
+    """顺序读取分段文件"""
+    with open(path, "rb", buffering=RUN_BUFFER) as f:
+        while True:
+            block = f.read(RECORD.size * 4096)
+            if not block:
+                return
+            yield from RECORD.iter_unpack(block)
+
+
+def index_chunk(
+    path: str,
+    start: int,
+    end: int,
+    max_plies: int,
+    spill_dir: str,
+    max_entries: int = DEFAULT_MAX_ENTRIES
+) -> Tuple[List[str], int, int]:
+    """
+    解析PGN文件的一个字节区间（在子进程中运行）
+
+    没有结果（*）、带FEN标签或非标准变体的对局跳过；走法非法时只统计非法走法之前的部分
+
+    Args:
+        path: PGN文件路径
+        start: 起始偏移（对局边界）
+        end: 结束偏移（对局边界）
+        max_plies: 每局统计的半回合数
+        spill_dir: 分段文件目录
+        max_entries: 内存中最多汇总的条数
+
+    Returns:
+        (分段文件列表, 统计的对局数, 跳过的对局数)
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        text = f.read(end - start).decode("utf-8", errors="replace")
+
+    aggregator = _Aggregator(spill_dir, max_entries)
+    games = skipped = 0
+    for headers, movetext in _split_games(text):
+        result = RESULTS.get(headers.get("Result", "*"))
+        variant = headers.get("Variant", "Standard").lower()
+        if result is None or "FEN" in headers or variant not in ("standard", "chess"):
+            skipped += 1
+            continue
+        board = chess.Board()
+        zobrist = _IncrementalHash(board)
+        for san in _mainline_sans(movetext, max_plies):
+            try:
+                move = board.parse_san(san)
+            except ValueError:
+                break
+            aggregator.add(zobrist.value(board), encode_move(board, move), result)
+            zobrist.push(board, move)
+        games += 1
+    aggregator.spill()
+    return aggregator.runs, games, skipped
+
+
+def merge_runs(runs: List[str], spill_dir: str, min_count: int = 1) -> Iterator[IndexRecord]:
+    """
+    多路归并分段文件，相同的(哈希, 走法)累加
+
+    分段过多时先分批归并成较大的中间分段，同时打开的文件不超过MERGE_FANOUT
+
+    Args:
+        runs: 分段文件列表
+        spill_dir: 中间分段目录
+        min_count: 出现次数少于该值的走法不输出（只在最后一轮过滤）
+
+    Yields:
+        按(哈希, 走法)严格递增的记录
+    """
+    while len(runs) > MERGE_FANOUT:
+        merged = []
+        for i in range(0, len(runs), MERGE_FANOUT):
+            group = runs[i:i + MERGE_FANOUT]
+            merged.append(write_run(spill_dir, _merge(group, 1)))
+            for run in group:
+                os.remove(run)
+        runs = merged
+    yield from _merge(runs, min_count)
+
+
+def _merge(runs: List[str], min_count: int) -> Iterator[IndexRecord]:
+    """一轮多路归并"""
+    current: Optional[Tuple[int, int]] = None
+    counts = [0, 0, 0, 0]
+    for key, move, *values in heapq.merge(*(read_run(run) for run in runs)):
+        if (key, move) != current:
+            if current is not None and record_count(counts) >= min_count:
+                yield current + tuple(min(value, MAX_COUNT) for value in counts)
+            current = (key, move)
+            counts = [0, 0, 0, 0]
+        for i, value in enumerate(values):
+            counts[i] += value
+    if current is not None and record_count(counts) >= min_count:
+        yield current + tuple(min(value, MAX_COUNT) for value in counts)
+
+
+def build_index(
+    out_path: str,
+    pgn_paths: List[str],
+    polyglot_paths: Iterable[str] = (),
+    workers: int = 1,
+    max_plies: int = 30,
+    min_count: int = 1,
+    chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+    max_entries: int = DEFAULT_MAX_ENTRIES,
+    tmp_dir: Optional[str] = None,
+    progress: bool = True
+) -> Dict[str, float]:
+    """
+    多进程索引PGN语料并写出开局库索引
+
+    Args:
+        out_path: 输出的索引文件路径
+        pgn_paths: PGN文件
+        polyglot_paths: 一并合入的Polyglot开局库
+        workers: 解析进程数
+        max_plies: 每局统计的半回合数
+        min_count: 出现次数少于该值的走法不写入
+        chunk_bytes: 每个任务处理的PGN字节数
+        max_entries: 每个进程内存中最多汇总的条数
+        tmp_dir: 分段文件的父目录，默认与输出文件相同
+        progress: 是否在stderr显示进度
+
+    Returns:
+        统计信息：games、skipped、records、runs、seconds、games_per_second
+    """
+    start = time.perf_counter()
+    spill_dir = tempfile.mkdtemp(
+        prefix="opening-runs-",
+        dir=tmp_dir or os.path.dirname(os.path.abspath(out_path))
+    )
+    runs: List[str] = []
+    games = skipped = 0
+    try:
+        tasks = [
+            (path, chunk_start, chunk_end)
+            for path in pgn_paths
+            for chunk_start, chunk_end in chunk_ranges(path, chunk_bytes)
+        ]
+        with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = [
+                executor.submit(index_chunk, path, chunk_start, chunk_end, max_plies, spill_dir, max_entries)
+                for path, chunk_start, chunk_end in tasks
+            ]
+            for done, future in enumerate(as_completed(futures), 1):
+                chunk_runs, chunk_games, chunk_skipped = future.result()
+                runs.extend(chunk_runs)
+                games += chunk_games
+                skipped += chunk_skipped
+                if progress:
+                    elapsed = time.perf_counter() - start
+                    print(f"\r已完成 {done}/{len(tasks)} 块  {games:,} 局  "
+                          f"{games / elapsed if elapsed > 0 else 0:,.0f} 局/秒",
+                          end="", file=sys.stderr, flush=True)
+        if progress:
+            print(file=sys.stderr)
+
+        for book_path in polyglot_paths:
+            runs.append(write_run(spill_dir, sorted(iter_polyglot(book_path))))
+
+        parsed = time.perf_counter() - start
+        records = write_index(out_path, merge_runs(runs, spill_dir, min_count))
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "games": games,
+        "skipped": skipped,
+        "records": records,
+        "runs": len(runs),
+        "parse_seconds": parsed,
+        "seconds": elapsed,
+        "games_per_second": games / elapsed if elapsed > 0 else 0.0
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """PGN索引命令行入口"""
+    parser = argparse.ArgumentParser(description="多进程索引PGN语料，生成开局库索引")
+    parser.add_argument("pgn", nargs="+", help="PGN文件")
+    parser.add_argument("--out", "-o", default=os.getenv("OPENING_INDEX_PATH", "openings.idx"))
+    parser.add_argument("--polyglot", nargs="*", default=[], help="一并合入的Polyglot开局库(.bin)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="解析进程数")
+    parser.add_argument("--max-plies", type=int, default=30, help="每局统计的半回合数")
+    parser.add_argument("--min-count", type=int, default=1, help="出现次数少于该值的走法不写入")
+    parser.add_argument("--chunk-mb", type=int, default=DEFAULT_CHUNK_BYTES // (1024 * 1024), help="每个任务的PGN大小（MB）")
+    parser.add_argument("--max-entries", type=int, default=DEFAULT_MAX_ENTRIES, help="每个进程内存中最多汇总的条数，超过即落盘")
+    parser.add_argument("--tmp-dir", help="分段文件目录，默认与输出文件相同")
+    parser.add_argument("--quiet", action="store_true", help="不显示进度")
+    args = parser.parse_args(argv)
+
+    stats = build_index(
+        args.out,
+        args.pgn,
+        polyglot_paths=args.polyglot,
+        workers=args.workers,
+        max_plies=args.max_plies,
+        min_count=args.min_count,
+        chunk_bytes=args.chunk_mb * 1024 * 1024,
+        max_entries=args.max_entries,
+        tmp_dir=args.tmp_dir,
+        progress=not args.quiet
+    )
+    print(f"索引 {stats['games']:,} 局（跳过 {stats['skipped']:,}），写入 {stats['records']:,} 条记录，"
+          f"{stats['runs']} 个分段，耗时 {stats['seconds']:.1f}s，{stats['games_per_second']:,.0f} 局/秒")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
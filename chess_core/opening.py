@@ -0,0 +1,487 @@
+"""
+开局库（开局浏览器）
+按Zobrist哈希索引局面，记录每个走法的胜/和/负局数（来自PGN）和Polyglot权重，两者分开保存；
+索引文件是按(哈希, 走法)排序的定长记录，查询时内存映射后二分查找，不需要整体载入
+
+构建用法：
+    python -m chess_core.opening build --pgn games.pgn --polyglot book.bin --out openings.idx
+    python -m chess_core.opening probe --index openings.idx --fen "<FEN>"
+"""
+
+import argparse
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+from .utils import position_hash
+
+
+# 文件头：魔数 + 记录数
+INDEX_MAGIC = b"HCAOPEN1"
+HEADER = struct.Struct(">8sQ")
+# 记录：局面哈希、走法（Polyglot编码）、Polyglot权重、白胜、和棋、黑胜；局数即胜和负之和
+RECORD = struct.Struct(">QHIIII")
+
+# 变化中最多展示的半回合数，与build_analysis_result一致
+MAX_PV_PLIES = 8
+
+# lichess胜率模型的系数：胜率 = 1 / (1 + exp(-k * 厘兵))，用于把得分率换算为近似评估
+WIN_RATE_K = 0.00368208
+
+# (哈希, 走法, 权重, 白胜, 和棋, 黑胜)
+IndexRecord = Tuple[int, int, int, int, int, int]
+
+# 统计计数的上限（记录中的计数是无符号32位）
+MAX_COUNT = 0xFFFFFFFF
+
+
+def record_count(counts) -> int:
+    """
+    走法的出现次数，用于构建索引时按min_count过滤
+
+    Args:
+        counts: (权重, 白胜, 和棋, 黑胜)
+
+    Returns:
+        PGN局数与Polyglot权重中较大的一个
+    """
+    return max(counts[0], counts[1] + counts[2] + counts[3])
+
+
+def encode_move(board: chess.Board, move: chess.Move) -> int:
+    """
+    按Polyglot格式编码走法（易位记为王走到本方车所在格）
+
+    Args:
+        board: 走子前的棋盘
+        move: 合法走法
+
+    Returns:
+        16位走法编码
+    """
+    to_square = move.to_square
+    if board.is_castling(move):
+        rook_file = 7 if chess.square_file(move.to_square) > chess.square_file(move.from_square) else 0
+        to_square = chess.square(rook_file, chess.square_rank(move.from_square))
+    promotion = move.promotion - 1 if move.promotion else 0
+    return to_square | (move.from_square << 6) | (promotion << 12)
+
+
+def decode_move(board: chess.Board, raw: int) -> chess.Move:
+    """
+    解码Polyglot格式的走法（王走到本方车所在格还原为标准易位）
+
+    Args:
+        board: 走子前的棋盘
+        raw: 16位走法编码
+
+    Returns:
+        走法（不保证合法）
+    """
+    to_square = raw & 0x3F
+    from_square = (raw >> 6) & 0x3F
+    promotion = (raw >> 12) & 0x7
+    if (
+        board.kings & chess.BB_SQUARES[from_square]
+        and board.rooks & board.occupied_co[board.turn] & chess.BB_SQUARES[to_square]
+    ):
+        king_file = 6 if to_square > from_square else 2
+        to_square = chess.square(king_file, chess.square_rank(from_square))
+    return chess.Move(from_square, to_square, promotion + 1 if promotion else None)
+
+
+def game_result(headers: chess.pgn.Headers) -> Optional[Tuple[int, int, int]]:
+    """PGN的Result转为(白胜, 和棋, 黑胜)计数，未结束的对局返回None"""
+    return {
+        "1-0": (1, 0, 0),
+        "1/2-1/2": (0, 1, 0),
+        "0-1": (0, 0, 1),
+    }.get(headers.get("Result", "*"))
+
+
+def score_to_pawns(score: float) -> float:
+    """把白方得分率换算为白方视角的近似评估（兵）"""
+    score = min(max(score, 0.01), 0.99)
+    return round(math.log(score / (1 - score)) / WIN_RATE_K / 100, 2)
+
+
+class OpeningIndex:
+    """开局库查询类"""
+
+    def __init__(self, path: str, min_games: int = 10, min_book_weight: Optional[int] = None):
+        """
+        内存映射打开索引文件
+
+        Args:
+            path: 索引文件路径（由write_index生成）
+            min_games: 局面至少出现这么多局才用开局库回答分析请求
+            min_book_weight: 只在Polyglot开局库中（没有对局统计）的局面，走法权重之和
+                至少为该值才用开局库回答；None表示这类局面一律交给引擎
+
+        Raises:
+            ValueError: 文件不是开局库索引
+        """
+        self.path = path
+        self.min_games = min_games
+        self.min_book_weight = min_book_weight
+        self.lookups = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, count = HEADER.unpack_from(self._mmap, 0)
+        except struct.error:
+            magic, count = b"", 0
+        if magic != INDEX_MAGIC or HEADER.size + count * RECORD.size != len(self._mmap):
+            self._mmap.close()
+            raise ValueError(f"不是有效的开局库索引: {path}")
+        self.count = count
+        try:
+            self._mmap.madvise(mmap.MADV_RANDOM)
+        except AttributeError:
+            pass
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _record(self, index: int) -> IndexRecord:
+        """读取第index条记录"""
+        return RECORD.unpack_from(self._mmap, HEADER.size + index * RECORD.size)
+
+    def _bisect(self, key: int) -> int:
+        """第一条哈希不小于key的记录序号"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._record(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def lookup(self, board: chess.Board) -> List[Dict[str, Any]]:
+        """
+        查询局面的全部开局库走法
+
+        Args:
+            board: 棋盘对象
+
+        Returns:
+            走法统计列表（按出现次数/权重从多到少），每项包含move、san、uci、
+            games、white、draws、black、weight（Polyglot权重）和score（走子方得分率，无胜负统计时为None）
+        """
+        key = position_hash(board)
+        moves = []
+        index = self._bisect(key)
+        while index < self.count:
+            record_key, raw, weight, white, draws, black = self._record(index)
+            index += 1
+            if record_key != key:
+                break
+            move = decode_move(board, raw)
+            if not board.is_legal(move):
+                # 哈希碰撞或损坏的记录
+                continue
+            games = white + draws + black
+            wins = white if board.turn == chess.WHITE else black
+            moves.append({
+                "move": move,
+                "san": board.san(move),
+                "uci": move.uci(),
+                "games": games,
+                "white": white,
+                "draws": draws,
+                "black": black,
+                "weight": weight,
+                "score": (wins + draws / 2) / games if games else None
+            })
+        moves.sort(key=lambda item: (item["games"], item["weight"]), reverse=True)
+        return moves
+
+    def _answerable(self, moves: List[Dict[str, Any]]) -> bool:
+        """
+        局面的统计是否足以回答分析请求：有对局统计时按局数，
+        只有Polyglot权重时按权重之和，两种来源各用各的门槛
+        """
+        if not moves:
+            return False
+        games = sum(item["games"] for item in moves)
+        if games:
+            return games >= self.min_games
+        if self.min_book_weight is None:
+            return False
+        return sum(item["weight"] for item in moves) >= self.min_book_weight
+
+    def _main_line(self, board: chess.Board, first: chess.Move) -> List[str]:
+        """从first开始沿最常见的走法走下去，直到离开开局库或统计不足以回答"""
+        line = [board.san(first)]
+        board = board.copy(stack=False)
+        board.push(first)
+        while len(line) < MAX_PV_PLIES:
+            moves = self.lookup(board)
+            if not self._answerable(moves):
+                break
+            line.append(moves[0]["san"])
+            board.push(moves[0]["move"])
+        return line
+
+    def analyze_position(self, fen: str, multipv: int = 3) -> Optional[Dict[str, Any]]:
+        """
+        用开局库回答分析请求
+
+        评估值由白方得分率按lichess胜率模型换算，仅供参考；
+        只有Polyglot权重（没有胜负统计）时评估值为0，且只在设置了min_book_weight时回答
+
+        Args:
+            fen: FEN格式的棋盘状态
+            multipv: 返回的最佳走法数量
+
+        Returns:
+            与StockfishEngine.analyze_position格式相同的结果字典（额外包含opening），
+            局面不在库中、局数不足min_games（只有Polyglot权重时权重不足min_book_weight）
+            或FEN格式错误时返回None
+        """
+        try:
+            board = chess.Board(fen)
+        except ValueError:
+            return None
+        with self._lock:
+            self.lookups += 1
+        moves = self.lookup(board)
+        if not self._answerable(moves):
+            return None
+        games = sum(item["games"] for item in moves)
+        weight = sum(item["weight"] for item in moves)
+        with self._lock:
+            self.hits += 1
+
+        if games:
+            white = sum(item["white"] for item in moves)
+            draws = sum(item["draws"] for item in moves)
+            white_score = (white + draws / 2) / games
+            evaluation = f"开局库: 白方得分 {white_score:.1%}（{games:,}局）"
+            eval_value = score_to_pawns(white_score)
+        else:
+            evaluation = "开局库: 书内局面"
+            eval_value = 0.0
+
+        best_moves = []
+        for rank, item in enumerate(moves[:multipv], 1):
+            if games:
+                share = item["games"] / games
+                text = f"{share:.0%} · {item['games']:,}局"
+                if item["games"]:
+                    move_white = (item["white"] + item["draws"] / 2) / item["games"]
+                    text += f" · 白方得分 {move_white:.0%}"
+            else:
+                text = f"权重 {item['weight'] / weight:.0%}" if weight else "书内走法"
+            best_moves.append({"rank": rank, "move": item["san"], "evaluation": text})
+
+        return {
+            "success": True,
+            "fen": fen,
+            "best_move": moves[0]["san"],
+            "evaluation": evaluation,
+            "eval_value": eval_value,
+            "variations": [" → ".join(self._main_line(board, moves[0]["move"]))],
+            "best_moves": best_moves,
+            "depth": 0,
+            "nodes": 0,
+            "nps": 0,
+            "time": 0,
+            "opening": {
+                "games": games,
+                "moves": [
+                    {key: value for key, value in item.items() if key != "move"}
+                    for item in moves
+                ]
+            }
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """获取开局库统计信息"""
+        return {
+            "records": self.count,
+            "lookups": self.lookups,
+            "hits": self.hits
+        }
+
+    def close(self):
+        """关闭内存映射"""
+        self._mmap.close()
+
+
+def write_index(path: str, records: Iterable[IndexRecord]) -> int:
+    """
+    写入索引文件（先写临时文件再替换，查询中的旧文件不受影响）
+
+    Args:
+        path: 索引文件路径
+        records: 按(哈希, 走法)严格递增的记录
+
+    Returns:
+        写入的记录数
+    """
+    tmp_path = f"{path}.tmp"
+    count = 0
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(INDEX_MAGIC, 0))
+        for record in records:
+            f.write(RECORD.pack(*record))
+            count += 1
+        f.seek(0)
+        f.write(HEADER.pack(INDEX_MAGIC, count))
+    os.replace(tmp_path, path)
+    return count
+
+
+def iter_polyglot(path: str) -> Iterator[IndexRecord]:
+    """读取Polyglot开局库，产出(哈希, 走法, 权重, 0, 0, 0)"""
+    with chess.polyglot.open_reader(path) as reader:
+        for entry in reader:
+            if entry.weight:
+                yield entry.key, entry.raw_move, entry.weight, 0, 0, 0
+
+
+def iter_pgn_moves(path: str, max_plies: int) -> Iterator[Tuple[int, int, Tuple[int, int, int]]]:
+    """
+    读取PGN文件，逐个产出对局前max_plies个半回合的(哈希, 走法, 对局结果)
+
+    未结束（Result为*）的对局和非标准起始局面的对局被跳过
+    """
+    with open(path, encoding="utf-8", errors="replace") as f:
+        while True:
+            game = chess.pgn.read_game(f)
+            if game is None:
+                break
+            result = game_result(game.headers)
+            if result is None or "FEN" in game.headers:
+                continue
+            board = game.board()
+            for ply, move in enumerate(game.mainline_moves()):
+                if ply >= max_plies:
+                    break
+                yield position_hash(board), encode_move(board, move), result
+                board.push(move)
+
+
+def build_index(
+    path: str,
+    pgn_paths: Iterable[str] = (),
+    polyglot_paths: Iterable[str] = (),
+    max_plies: int = 30,
+    min_count: int = 1
+) -> int:
+    """
+    在内存中汇总PGN和Polyglot开局库，写出索引文件
+
+    适合小语料；GB级的PGN改用chess_core.indexer（多进程解析、分段落盘后归并）
+
+    Args:
+        path: 输出的索引文件路径
+        pgn_paths: PGN文件（计入胜/和/负局数）
+        polyglot_paths: Polyglot开局库文件（计入权重）
+        max_plies: 每局只统计前这么多个半回合
+        min_count: 出现次数（见record_count）少于该值的走法不写入
+
+    Returns:
+        写入的记录数
+    """
+    totals: Dict[Tuple[int, int], List[int]] = defaultdict(lambda: [0, 0, 0, 0])
+    for pgn_path in pgn_paths:
+        for key, move, (white, draws, black) in iter_pgn_moves(pgn_path, max_plies):
+            counts = totals[key, move]
+            counts[1] += white
+            counts[2] += draws
+            counts[3] += black
+    for book_path in polyglot_paths:
+        for key, move, weight, _, _, _ in iter_polyglot(book_path):
+            totals[key, move][0] += weight
+
+    records = (
+        (key, move) + tuple(min(value, MAX_COUNT) for value in counts)
+        for (key, move), counts in sorted(totals.items())
+        if record_count(counts) >= min_count
+    )
+    return write_index(path, records)
+
+
+# 全局开局库单例
+_opening_index: Optional[OpeningIndex] = None
+_opening_loaded = False
+_opening_lock = threading.Lock()
+
+def get_opening_index() -> Optional[OpeningIndex]:
+    """
+    获取全局开局库单例
+
+    索引文件由OPENING_INDEX_PATH指定，OPENING_MIN_GAMES设置回答分析请求所需的最少局数，
+    OPENING_MIN_BOOK_WEIGHT设置只在Polyglot开局库中的局面所需的最小权重之和（未设置时不回答）；
+    未配置或文件无效时返回None
+    """
+    global _opening_index, _opening_loaded
+    with _opening_lock:
+        if not _opening_loaded:
+            _opening_loaded = True
+            path = os.getenv("OPENING_INDEX_PATH")
+            if path:
+                book_weight = os.getenv("OPENING_MIN_BOOK_WEIGHT")
+                try:
+                    _opening_index = OpeningIndex(
+                        path,
+                        int(os.getenv("OPENING_MIN_GAMES", "10")),
+                        int(book_weight) if book_weight else None
+                    )
+                except (OSError, ValueError):
+                    _opening_index = None
+    return _opening_index
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """开局库命令行入口"""
+    parser = argparse.ArgumentParser(description="构建和查询开局库索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="从PGN和/或Polyglot开局库构建索引")
+    build.add_argument("--out", "-o", default=os.getenv("OPENING_INDEX_PATH", "openings.idx"))
+    build.add_argument("--pgn", nargs="*", default=[], help="PGN文件")
+    build.add_argument("--polyglot", nargs="*", default=[], help="Polyglot开局库(.bin)")
+    build.add_argument("--max-plies", type=int, default=30, help="每局统计的半回合数")
+    build.add_argument("--min-count", type=int, default=1, help="出现次数少于该值的走法不写入")
+
+    probe = sub.add_parser("probe", help="查询一个局面")
+    probe.add_argument("--index", default=os.getenv("OPENING_INDEX_PATH", "openings.idx"))
+    probe.add_argument("--fen", default=chess.STARTING_FEN)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        if not args.pgn and not args.polyglot:
+            parser.error("至少需要 --pgn 或 --polyglot 之一")
+        count = build_index(args.out, args.pgn, args.polyglot, args.max_plies, args.min_count)
+        print(f"写入 {count} 条记录到 {args.out}")
+        return 0
+
+    index = OpeningIndex(args.index)
+    try:
+        for item in index.lookup(chess.Board(args.fen)):
+            score = f"{item['score']:.1%}" if item["score"] is not None else "-"
+            print(f"{item['san']:<8} 局数 {item['games']:<8} 权重 {item['weight']:<8} "
+                  f"+{item['white']} ={item['draws']} -{item['black']}  走子方得分 {score}")
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
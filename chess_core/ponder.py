@@ -0,0 +1,192 @@
+"""
+后台预分析（ponder）
+对话中走子成功后立即在后台搜索新局面，随后的分析请求直接取用已经搜得较深的结果
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+
+from .async_engine import AsyncEnginePool, get_async_engine
+from .config import MAX_ANALYSIS_TIME
+from .scheduler import BACKGROUND, INTERACTIVE
+
+
+class PonderEntry:
+    """单个会话的后台分析任务"""
+
+    __slots__ = ("fen", "started", "latest", "task")
+
+    def __init__(self, fen: str):
+        self.fen = fen
+        self.started = time.monotonic()
+        self.latest: Optional[Dict[str, Any]] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class Ponderer:
+    """后台预分析类，按会话维护最多一个分析任务"""
+
+    def __init__(
+        self,
+        pool: AsyncEnginePool,
+        time_limit: float = MAX_ANALYSIS_TIME,
+        multipv: int = 3,
+        max_active: Optional[int] = None
+    ):
+        """
+        Args:
+            pool: 异步引擎池
+            time_limit: 每个局面最长的后台分析时间（秒）
+            multipv: 后台分析的主变数量，更大的请求不会取用后台结果
+            max_active: 同时进行的后台分析数量，默认给交互请求至少留出一个引擎
+        """
+        self.pool = pool
+        self.time_limit = time_limit
+        self.multipv = multipv
+        self.max_active = max_active or max(1, pool.size - 1)
+        self.started = 0
+        self.served = 0
+        self.yielded = 0
+        self._entries: Dict[str, PonderEntry] = {}
+
+    def _active(self) -> int:
+        """正在运行的后台分析数量"""
+        return sum(1 for entry in self._entries.values() if not entry.task.done())
+
+    def start(self, key: str, fen: str) -> bool:
+        """
+        开始后台分析一个局面，同时取消该会话之前的后台分析
+
+        低优先级：有交互请求排队或后台分析已达上限时直接放弃；
+        借出引擎时按BACKGROUND优先级排队，只在短时间内拿不到引擎时放弃
+
+        Args:
+            key: 会话ID
+            fen: 走子后的局面
+
+        Returns:
+            是否启动了后台分析
+        """
+        self.cancel(key)
+        if self._active() >= self.max_active or self._interactive_waiting():
+            return False
+        entry = PonderEntry(fen)
+        entry.task = asyncio.get_running_loop().create_task(self._run(key, entry))
+        self._entries[key] = entry
+        self.started += 1
+        return True
+
+    def cancel(self, key: str):
+        """取消会话的后台分析（下一步走子或重置棋盘时调用）"""
+        entry = self._entries.pop(key, None)
+        if entry is not None and not entry.task.done():
+            entry.task.cancel()
+
+    def _interactive_waiting(self) -> bool:
+        """是否有交互请求在排队等待引擎"""
+        return self.pool.scheduler.waiting_at_or_above(INTERACTIVE) > 0
+
+    async def _run(self, key: str, entry: PonderEntry):
+        """后台搜索，不断记录最新结果；有交互请求排队等待引擎时主动让出"""
+        stream = self.pool.analyze_stream(
+            entry.fen,
+            time_limit=self.time_limit,
+            multipv=self.multipv,
+            min_interval=0.1,
+            timeout=0.05,
+            priority=BACKGROUND,
+            session=key
+        )
+        try:
+            async for result in stream:
+                if not result["success"]:
+                    break
+                entry.latest = result
+                if self._interactive_waiting():
+                    self.yielded += 1
+                    break
+        finally:
+            # 显式关闭生成器，取消时也能立刻停止搜索并归还引擎
+            await stream.aclose()
+
+    async def analyze(
+        self,
+        key: str,
+        fen: str,
+        multipv: int = 3,
+        time_limit: Optional[float] = 2.0,
+        depth: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        尝试用后台分析结果回答分析请求
+
+        不指定深度时，后台已搜索的时间不足time_limit则等到满time_limit为止，
+        因此结果不会比直接搜索更浅；指定深度时只有已达到该深度才返回。
+        无论能否取用，该会话的后台分析都到此结束并归还引擎：
+        取用后再搜下去没有请求会用到，不能取用时调用方会自己搜索
+
+        Args:
+            key: 会话ID
+            fen: 请求分析的局面
+            multipv: 请求的最佳走法数量
+            time_limit: 请求的分析时间（秒）
+            depth: 请求的搜索深度
+
+        Returns:
+            与analyze_position格式相同的结果字典（pondered为True），无可用结果时返回None
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        try:
+            if entry.fen != fen or multipv > self.multipv:
+                return None
+            if not depth:
+                remaining = (time_limit or 0.0) - (time.monotonic() - entry.started)
+                if remaining > 0 and not entry.task.done():
+                    await asyncio.wait({entry.task}, timeout=remaining)
+            latest = entry.latest
+        finally:
+            if not entry.task.done():
+                entry.task.cancel()
+
+        if latest is None or (depth and latest.get("depth", 0) < depth):
+            return None
+
+        self.served += 1
+        result = dict(latest)
+        result["best_moves"] = latest["best_moves"][:multipv]
+        result["pondered"] = True
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """获取后台分析统计信息"""
+        return {
+            "active": self._active(),
+            "started": self.started,
+            "served": self.served,
+            "yielded": self.yielded
+        }
+
+
+# 全局后台分析单例（必须在事件循环内创建）
+_ponderer: Optional[Ponderer] = None
+_ponderer_lock: Optional[asyncio.Lock] = None
+
+async def get_ponderer() -> Optional[Ponderer]:
+    """
+    获取全局后台分析单例
+
+    需设置环境变量CHAT_PONDER=1开启；未开启时返回None
+    """
+    global _ponderer, _ponderer_lock
+    if os.getenv("CHAT_PONDER", "0").lower() not in ("1", "true", "yes"):
+        return None
+    if _ponderer_lock is None:
+        _ponderer_lock = asyncio.Lock()
+    async with _ponderer_lock:
+        if _ponderer is None:
+            _ponderer = Ponderer(await get_async_engine())
+    return _ponderer
@@ -0,0 +1,486 @@
+"""
+Stockfish引擎池
+预先启动部分引擎进程，供并发请求借出/归还；其余进程按需启动，空闲过久时关闭
+"""
+
+import contextlib
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .cache import AnalysisCache
+from .config import INFINITE_ANALYSIS_MAX
+from .engine import StockfishEngine, make_limit, request_key
+from .opening import OpeningIndex
+from .scheduler import BATCH, INTERACTIVE, EngineScheduler, QueueFullError, Ticket
+from .tablebase import SyzygyTablebase
+
+
+class EnginePoolTimeout(TimeoutError):
+    """在超时时间内没有空闲引擎"""
+
+
+class EnginePool:
+    """Stockfish引擎池类"""
+
+    def __init__(
+        self,
+        engine_path: str,
+        size: int = 1,
+        options: Optional[Dict[str, Any]] = None,
+        checkout_timeout: float = 30.0,
+        cache: Optional[AnalysisCache] = None,
+        min_engines: Optional[int] = None,
+        idle_timeout: Optional[float] = None,
+        queue_limits: Optional[Dict[int, int]] = None,
+        tablebase: Optional[SyzygyTablebase] = None,
+        openings: Optional[OpeningIndex] = None
+    ):
+        """
+        初始化引擎池并预先启动min_engines个引擎进程
+
+        Args:
+            engine_path: Stockfish可执行文件路径
+            size: 引擎进程数量
+            options: 每个进程的UCI选项（Threads、Hash等）
+            checkout_timeout: 默认借出等待时间（秒）
+            cache: 分析结果缓存，为None时不缓存
+            min_engines: 预先启动并始终保持运行的进程数量，默认等于size
+            idle_timeout: 进程空闲超过该秒数即关闭（保留min_engines个），为None或0时不回收
+            queue_limits: 各优先级的最大排队数（见scheduler.DEFAULT_QUEUE_LIMITS）
+            tablebase: Syzygy残局库，库中的局面直接查库不占用引擎
+            openings: 开局库，库中统计足够的局面直接返回走法统计
+        """
+        self.engine_path = engine_path
+        self.size = max(1, size)
+        self.options = dict(options or {})
+        self.checkout_timeout = checkout_timeout
+        self.cache = cache
+        self.tablebase = tablebase
+        self.openings = openings
+        self.min_engines = self.size if min_engines is None else max(0, min(min_engines, self.size))
+        self.idle_timeout = idle_timeout or None
+        self.reaped = 0
+        self.coalesced = 0
+
+        # 按优先级分配空闲引擎；空闲引擎后进先出，优先复用哈希表仍然温热的引擎
+        self.scheduler = EngineScheduler(queue_limits)
+        self._engines: List[StockfishEngine] = []
+        self._last_used: Dict[StockfishEngine, float] = {}
+        self._closed = False
+        self._stop_reaper = threading.Event()
+        # 正在进行的搜索及其借出请求，相同的并发请求等待同一个结果
+        self._inflight: Dict[Tuple, Tuple["Future[Dict[str, Any]]", Ticket]] = {}
+        self._inflight_lock = threading.Lock()
+
+        for index in range(self.size):
+            engine = StockfishEngine(engine_path, options=self.options)
+            if index < self.min_engines:
+                engine.start()
+                self._last_used[engine] = time.monotonic()
+            self._engines.append(engine)
+        # 未启动的引擎排在栈底，只有预热的引擎都被借出时才会启动
+        for engine in reversed(self._engines):
+            self.scheduler.release(engine)
+
+        if self.idle_timeout:
+            threading.Thread(target=self._reap_loop, name="engine-reaper", daemon=True).start()
+
+    def checkout(
+        self,
+        timeout: Optional[float] = None,
+        priority: int = INTERACTIVE,
+        session: Optional[str] = None,
+        ticket: Optional[Ticket] = None
+    ) -> StockfishEngine:
+        """
+        借出一个空闲引擎，必要时重启已崩溃的进程
+
+        Args:
+            timeout: 等待空闲引擎的最长时间（秒），默认使用checkout_timeout
+            priority: 调度优先级（scheduler.INTERACTIVE/BACKGROUND/BATCH）
+            session: 会话标识，同一优先级内按会话轮流分配
+            ticket: 排队期间可能被提升的优先级（合并的请求），给出时忽略priority
+
+        Returns:
+            可用的引擎
+
+        Raises:
+            EnginePoolTimeout: 超时仍无空闲引擎
+            QueueFullError: 该优先级排队已满
+        """
+        if self._closed:
+            raise RuntimeError("引擎池已关闭")
+        if timeout is None:
+            timeout = self.checkout_timeout
+        try:
+            engine = self.scheduler.acquire(priority, session, timeout, ticket)
+        except TimeoutError:
+            raise EnginePoolTimeout(f"{timeout:.1f}秒内没有空闲引擎")
+
+        try:
+            if not engine.is_started():
+                engine.start()
+            elif not engine.is_alive():
+                self._respawn(engine)
+        except Exception:
+            # 启动失败时归还引擎，避免池子永久缩小
+            engine.kill()
+            self.scheduler.release(engine)
+            raise
+        return engine
+
+    def checkin(self, engine: StockfishEngine):
+        """
+        归还引擎
+
+        Args:
+            engine: 之前借出的引擎
+        """
+        if self._closed:
+            engine.quit()
+            return
+        if engine.is_started() and not engine.is_alive():
+            self._respawn(engine)
+        self._last_used[engine] = time.monotonic()
+        self.scheduler.release(engine)
+
+    @contextlib.contextmanager
+    def engine(
+        self,
+        timeout: Optional[float] = None,
+        priority: int = INTERACTIVE,
+        session: Optional[str] = None,
+        ticket: Optional[Ticket] = None
+    ) -> Iterator[StockfishEngine]:
+        """借出引擎的上下文管理器，退出时自动归还"""
+        engine = self.checkout(timeout, priority, session, ticket)
+        try:
+            yield engine
+        finally:
+            self.checkin(engine)
+
+    def _respawn(self, engine: StockfishEngine):
+        """重启已崩溃的引擎进程"""
+        engine.restart()
+
+    @property
+    def restarts(self) -> int:
+        """引擎进程累计重启次数（包括搜索中途崩溃/卡死后由看门狗触发的重启）"""
+        return sum(engine.restarts for engine in self._engines)
+
+    def health_check(self) -> int:
+        """
+        对当前空闲的引擎逐个ping，重启无响应的进程
+
+        Returns:
+            本次重启的引擎数量
+        """
+        idle = self.scheduler.take_free()
+        restarted = 0
+        for engine in reversed(idle):
+            if engine.is_started() and not engine.ping():
+                self._respawn(engine)
+                restarted += 1
+            self.scheduler.release(engine)
+        return restarted
+
+    def reap_idle(self) -> int:
+        """
+        关闭空闲超过idle_timeout的引擎进程，释放其置换表和NNUE权重占用的内存
+
+        至少保留min_engines个进程运行；被关闭的引擎下次借出时重新启动
+
+        Returns:
+            本次关闭的进程数量
+        """
+        if not self.idle_timeout:
+            return 0
+        idle = self.scheduler.take_free()
+        now = time.monotonic()
+        running = sum(1 for engine in self._engines if engine.is_started())
+        reaped = 0
+        # 取出顺序是从最近使用到最久未用，倒序处理先回收最久未用的
+        for engine in reversed(idle):
+            if (
+                engine.is_started() and running > self.min_engines
+                and now - self._last_used.get(engine, now) >= self.idle_timeout
+            ):
+                engine.kill()
+                running -= 1
+                reaped += 1
+            self.scheduler.release(engine)
+        self.reaped += reaped
+        return reaped
+
+    def _reap_loop(self):
+        """后台回收线程"""
+        interval = max(1.0, self.idle_timeout / 4)
+        while not self._stop_reaper.wait(interval):
+            self.reap_idle()
+
+    def analyze_position(
+        self,
+        fen: str,
+        time_limit: Optional[float] = 2.0,
+        multipv: int = 3,
+        timeout: Optional[float] = None,
+        options: Optional[Dict[str, Any]] = None,
+        depth: Optional[int] = None,
+        nodes: Optional[int] = None,
+        priority: int = INTERACTIVE,
+        session: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        借出一个引擎分析局面，接口与StockfishEngine.analyze_position一致
+
+        配置了缓存时先查缓存，命中则不占用引擎；与正在进行的搜索局面和参数
+        都相同的请求不再借出引擎，直接等待那次搜索的结果，优先级更高时
+        把那次搜索提升到自己的优先级，不会排在低优先级的搜索后面
+
+        Args:
+            fen: FEN格式的棋盘状态
+            time_limit: 分析时间限制（秒）
+            multipv: 返回的最佳走法数量
+            timeout: 等待空闲引擎的最长时间（秒）
+            options: 仅本次搜索生效的UCI选项（来自分析配置档）
+            depth: 搜索深度限制
+            nodes: 搜索节点数限制
+            priority: 调度优先级
+            session: 会话标识
+
+        Returns:
+            包含分析结果的字典
+        """
+        try:
+            key = request_key(fen, multipv, time_limit, depth, nodes, options)
+        except ValueError as e:
+            return {
+                "success": False,
+                "error": f"FEN格式错误: {str(e)}"
+            }
+
+        with self._inflight_lock:
+            inflight = self._inflight.get(key)
+            leader = inflight is None
+            if leader:
+                flight, ticket = self._inflight[key] = (Future(), Ticket(priority))
+            else:
+                flight, ticket = inflight
+                self.coalesced += 1
+        if not leader:
+            self.scheduler.promote(ticket, priority)
+            result = dict(flight.result())
+            result["fen"] = fen
+            return result
+
+        try:
+            result = self._analyze_position(
+                fen, time_limit, multipv, timeout, options, depth, nodes, ticket, session
+            )
+            flight.set_result(result)
+            return result
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+
+    def _analyze_position(
+        self,
+        fen: str,
+        time_limit: Optional[float],
+        multipv: int,
+        timeout: Optional[float],
+        options: Optional[Dict[str, Any]],
+        depth: Optional[int],
+        nodes: Optional[int],
+        ticket: Ticket,
+        session: Optional[str]
+    ) -> Dict[str, Any]:
+        """实际执行一次分析：依次查残局库、开局库和缓存，都未命中再借出引擎搜索"""
+        try:
+            if self.tablebase is not None:
+                probed = self.tablebase.analyze_position(fen, multipv)
+                if probed is not None:
+                    return probed
+            if self.openings is not None:
+                booked = self.openings.analyze_position(fen, multipv)
+                if booked is not None:
+                    return booked
+            if self.cache is not None:
+                cached = self.cache.get(fen, multipv, depth, time_limit, nodes)
+                if cached is not None:
+                    return cached
+
+            with self.engine(timeout, session=session, ticket=ticket) as engine:
+                result = engine.analyze_position(
+                    fen,
+                    time_limit=time_limit,
+                    multipv=multipv,
+                    options=options,
+                    depth=depth,
+                    nodes=nodes
+                )
+
+            if self.cache is not None:
+                self.cache.put(result, multipv=multipv, time_limit=None if depth or nodes else time_limit)
+            return result
+        except ValueError as e:
+            return {
+                "success": False,
+                "error": f"FEN格式错误: {str(e)}"
+            }
+        except (EnginePoolTimeout, QueueFullError) as e:
+            return {
+                "success": False,
+                "error": f"引擎繁忙: {str(e)}"
+            }
+
+    def analyze_stream(
+        self,
+        fen: str,
+        time_limit: Optional[float] = 2.0,
+        multipv: int = 3,
+        min_interval: float = 0.2,
+        stop_event: Optional[threading.Event] = None,
+        timeout: Optional[float] = None,
+        options: Optional[Dict[str, Any]] = None,
+        depth: Optional[int] = None,
+        nodes: Optional[int] = None,
+        priority: int = INTERACTIVE,
+        session: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        借出一个引擎做流式分析，详见StockfishEngine.analyze_stream
+
+        引擎在生成器结束或被关闭时立即归还；有限分析完整跑完的最终结果写入缓存，
+        残局库或开局库中的局面、缓存中已有足够深的结果时直接产出该结果。
+        无限分析（不给任何限制）最长搜索INFINITE_ANALYSIS_MAX秒
+
+        Yields:
+            阶段性分析结果字典
+        """
+        finite = make_limit(time_limit, depth, nodes) is not None
+        try:
+            if self.tablebase is not None:
+                probed = self.tablebase.analyze_position(fen, multipv)
+                if probed is not None:
+                    probed.update(final=True, stopped=False)
+                    yield probed
+                    return
+            if self.openings is not None:
+                booked = self.openings.analyze_position(fen, multipv)
+                if booked is not None:
+                    booked.update(final=True, stopped=False)
+                    yield booked
+                    return
+            if self.cache is not None and finite:
+                cached = self.cache.get(fen, multipv, depth, time_limit, nodes)
+                if cached is not None:
+                    cached.update(final=True, stopped=False)
+                    yield cached
+                    return
+            engine = self.checkout(timeout, priority, session)
+        except ValueError as e:
+            yield {"success": False, "error": f"FEN格式错误: {str(e)}"}
+            return
+        except (EnginePoolTimeout, QueueFullError) as e:
+            yield {"success": False, "error": f"引擎繁忙: {str(e)}"}
+            return
+
+        try:
+            stream = engine.analyze_stream(
+                fen, time_limit if finite else INFINITE_ANALYSIS_MAX,
+                multipv, min_interval, stop_event, options, depth, nodes
+            )
+            for result in stream:
+                if (
+                    self.cache is not None and finite
+                    and result.get("final") and not result.get("stopped")
+                ):
+                    self.cache.put(result, multipv=multipv, time_limit=None if depth or nodes else time_limit)
+                yield result
+        finally:
+            self.checkin(engine)
+
+    def review_game(
+        self,
+        pgn_text: str,
+        time_limit: float = 0.5,
+        depth: Optional[int] = 18,
+        timeout: Optional[float] = None,
+        priority: int = BATCH,
+        session: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        借出一个引擎复盘整盘PGN对局，详见review.review_game
+
+        复盘长时间占用引擎，默认按批量优先级排队，不抢占交互请求
+
+        Args:
+            pgn_text: PGN文本（只分析第一局）
+            time_limit: 每个局面的最长分析时间（秒）
+            depth: 每个局面的目标深度
+            timeout: 等待空闲引擎的最长时间（秒）
+            priority: 调度优先级
+            session: 会话标识
+
+        Returns:
+            复盘结果字典
+        """
+        from .review import read_pgn, review_game
+
+        try:
+            game = read_pgn(pgn_text)
+            with self.engine(timeout, priority, session) as engine:
+                return review_game(game, engine, time_limit=time_limit, depth=depth)
+        except ValueError as e:
+            return {
+                "success": False,
+                "error": f"PGN格式错误: {str(e)}"
+            }
+        except (EnginePoolTimeout, QueueFullError) as e:
+            return {
+                "success": False,
+                "error": f"引擎繁忙: {str(e)}"
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"复盘失败: {str(e)}"
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        """获取引擎池状态"""
+        stats = {
+            "size": self.size,
+            "running": sum(1 for engine in self._engines if engine.is_started()),
+            "idle": self.scheduler.free_count,
+            "restarts": self.restarts,
+            "reaped": self.reaped,
+            "coalesced": self.coalesced,
+            "scheduler": self.scheduler.stats()
+        }
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        if self.tablebase is not None:
+            stats["tablebase"] = self.tablebase.stats()
+        if self.openings is not None:
+            stats["openings"] = self.openings.stats()
+        return stats
+
+    def close(self):
+        """关闭全部引擎"""
+        self._closed = True
+        self._stop_reaper.set()
+        for engine in self._engines:
+            engine.quit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
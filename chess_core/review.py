@@ -0,0 +1,218 @@
+"""
+整盘对局复盘
+沿PGN主线逐步分析，根据评估值变化标记严重失误、错误和不精确
+
+命令行用法：
+    python -m chess_core.review game.pgn --time-limit 0.5 --depth 18
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import chess
+import chess.engine
+import chess.pgn
+
+from .config import MAX_ANALYSIS_TIME
+from .engine import StockfishEngine
+
+
+# 评估损失（厘兵）阈值，从高到低匹配
+CLASSIFICATIONS = [
+    (300, "严重失误"),
+    (100, "错误"),
+    (50, "不精确"),
+]
+
+# 将杀折算成的厘兵数，避免一步杀棋的评估差淹没其他走法
+MATE_SCORE = 1000
+
+
+def classify_loss(loss: int) -> Optional[str]:
+    """
+    根据评估损失对走法分类
+
+    Args:
+        loss: 走子方损失的厘兵数
+
+    Returns:
+        分类名称，损失很小时返回None
+    """
+    for threshold, label in CLASSIFICATIONS:
+        if loss >= threshold:
+            return label
+    return None
+
+
+def _terminal_eval(board: chess.Board) -> int:
+    """对局结束局面的白方视角评估"""
+    if board.is_checkmate():
+        return -MATE_SCORE if board.turn == chess.WHITE else MATE_SCORE
+    return 0
+
+
+def review_game(
+    game: chess.pgn.Game,
+    engine: StockfishEngine,
+    time_limit: Optional[float] = 0.5,
+    depth: Optional[int] = 18,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> Dict[str, Any]:
+    """
+    逐步分析对局主线
+
+    每个局面只搜索一次：走法前后的评估差即可得到该走法的损失。
+    所有搜索在同一个引擎上以同一个game标识进行，上一步的置换表
+    直接延续到下一步，因此配合深度上限，大多数局面远早于time_limit结束。
+    只有一个合法走法的局面不搜索，评估取自下一个局面。
+
+    Args:
+        game: PGN对局
+        engine: 专用于本次复盘的引擎
+        time_limit: 每个局面的最长分析时间（秒）；为None或0时以MAX_ANALYSIS_TIME为上限，
+            不会出现不限时的搜索
+        depth: 每个局面的目标深度，达到即停止；为None时只按时间限制
+        progress: 每完成一个局面调用一次，参数为(已完成局面数, 总局面数)
+
+    Returns:
+        复盘结果字典
+    """
+    start = time.perf_counter()
+    board = game.board()
+    moves = list(game.mainline_moves())
+    total = len(moves) + 1
+    limit = chess.engine.Limit(time=time_limit or MAX_ANALYSIS_TIME, depth=depth)
+    continuity = object()
+
+    # 每个局面的白方视角评估（厘兵）和最佳走法
+    evals: List[Optional[int]] = []
+    best_moves: List[Optional[str]] = []
+    searched = 0
+
+    for ply in range(total):
+        if board.is_game_over():
+            evals.append(_terminal_eval(board))
+            best_moves.append(None)
+        elif ply < len(moves) and board.legal_moves.count() == 1:
+            evals.append(None)
+            best_moves.append(board.san(moves[ply]))
+        else:
+            info = engine.search(board, limit, game=continuity)[0]
+            evals.append(info["score"].white().score(mate_score=MATE_SCORE))
+            pv = info.get("pv")
+            best_moves.append(board.san(pv[0]) if pv else None)
+            searched += 1
+
+        if progress is not None:
+            progress(ply + 1, total)
+        if ply < len(moves):
+            board.push(moves[ply])
+
+    # 被迫走法的局面沿用下一局面的评估
+    for ply in range(total - 2, -1, -1):
+        if evals[ply] is None:
+            evals[ply] = evals[ply + 1]
+
+    board = game.board()
+    reviewed = []
+    summary = {
+        color: {"moves": 0, "total_loss": 0, "严重失误": 0, "错误": 0, "不精确": 0}
+        for color in ("white", "black")
+    }
+
+    for ply, move in enumerate(moves):
+        mover = board.turn
+        sign = 1 if mover == chess.WHITE else -1
+        loss = max(0, sign * (evals[ply] - evals[ply + 1]))
+        label = classify_loss(loss)
+        color = "white" if mover == chess.WHITE else "black"
+
+        reviewed.append({
+            "ply": ply + 1,
+            "move_number": board.fullmove_number,
+            "color": color,
+            "move": board.san(move),
+            "best_move": best_moves[ply],
+            "eval_before": evals[ply] / 100.0,
+            "eval_after": evals[ply + 1] / 100.0,
+            "loss": loss,
+            "classification": label
+        })
+
+        side = summary[color]
+        side["moves"] += 1
+        side["total_loss"] += loss
+        if label:
+            side[label] += 1
+        board.push(move)
+
+    for side in summary.values():
+        side["acpl"] = round(side.pop("total_loss") / side["moves"]) if side["moves"] else 0
+
+    return {
+        "success": True,
+        "headers": dict(game.headers),
+        "moves": reviewed,
+        "summary": summary,
+        "positions": total,
+        "searched": searched,
+        "time": time.perf_counter() - start
+    }
+
+
+def read_pgn(pgn_text: str) -> chess.pgn.Game:
+    """
+    解析PGN文本中的第一局
+
+    Raises:
+        ValueError: 文本中没有合法对局或对局没有走法
+    """
+    game = chess.pgn.read_game(io.StringIO(pgn_text))
+    if game is None:
+        raise ValueError("未找到PGN对局")
+    if game.errors:
+        raise ValueError(str(game.errors[0]))
+    if game.next() is None:
+        raise ValueError("PGN中没有走法")
+    return game
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """复盘命令行入口"""
+    parser = argparse.ArgumentParser(description="整盘PGN复盘，标记失误")
+    parser.add_argument("pgn", help="PGN文件（只分析第一局）")
+    parser.add_argument("--engine", default=os.getenv("STOCKFISH_PATH"), help="Stockfish路径")
+    parser.add_argument("--time-limit", type=float, default=0.5, help="每个局面的最长分析时间（秒），0表示以MAX_ANALYSIS_TIME为上限")
+    parser.add_argument("--depth", type=int, default=18, help="每个局面的目标深度")
+    args = parser.parse_args(argv)
+
+    if not args.engine:
+        parser.error("请通过 --engine 或 STOCKFISH_PATH 指定引擎路径")
+
+    with open(args.pgn, encoding="utf-8", errors="replace") as f:
+        game = read_pgn(f.read())
+
+    with StockfishEngine(args.engine) as engine:
+        report = review_game(game, engine, args.time_limit, args.depth)
+
+    for item in report["moves"]:
+        prefix = f"{item['move_number']}." if item["color"] == "white" else f"{item['move_number']}..."
+        mark = f"  {item['classification']}（最佳 {item['best_move']}）" if item["classification"] else ""
+        print(f"{prefix:<6}{item['move']:<8}{item['eval_after']:+6.2f}{mark}")
+
+    for color, name in (("white", "白方"), ("black", "黑方")):
+        side = report["summary"][color]
+        print(f"{name}: 平均损失 {side['acpl']}cp，严重失误 {side['严重失误']}，"
+              f"错误 {side['错误']}，不精确 {side['不精确']}")
+    naive = (report["positions"] - 1) * args.time_limit
+    print(f"{report['positions']} 个局面（实际搜索 {report['searched']}），耗时 {report['time']:.1f}s，"
+          f"每步按时间冷启动分析约需 {naive:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+"""
+引擎任务调度
+按优先级分配空闲引擎：交互请求优先于后台预分析，后台预分析优先于批量任务；
+同一优先级内按会话轮转，避免单个会话的大量请求饿死其他会话
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+
+# 优先级，数值越小越优先
+INTERACTIVE = 0
+BACKGROUND = 1
+BATCH = 2
+
+PRIORITY_NAMES = {
+    INTERACTIVE: "interactive",
+    BACKGROUND: "background",
+    BATCH: "batch",
+}
+
+# 每个优先级最多排队的请求数，超出时立即拒绝
+DEFAULT_QUEUE_LIMITS = {
+    INTERACTIVE: 256,
+    BACKGROUND: 16,
+    BATCH: 4096,
+}
+
+# 每个优先级保留最近多少次排队耗时用于统计分位数
+WAIT_SAMPLES = 1000
+
+
+class QueueFullError(Exception):
+    """该优先级的等待队列已满"""
+
+
+class Waiter:
+    """一个排队中的借出请求"""
+
+    __slots__ = ("priority", "session", "enqueued", "granted", "resource", "wake")
+
+    def __init__(self, priority: int, session: str, wake: Callable[[], None]):
+        self.priority = priority
+        self.session = session
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.resource: Any = None
+        self.wake = wake
+
+
+class Ticket:
+    """
+    可提升优先级的借出请求
+
+    被合并的相同请求共用一次搜索，这次搜索按加入者中最高的优先级排队：
+    排队期间有更高优先级的请求加入时用EngineScheduler.promote提升
+    """
+
+    __slots__ = ("priority", "waiter")
+
+    def __init__(self, priority: int = INTERACTIVE):
+        self.priority = priority
+        self.waiter: Optional[Waiter] = None
+
+
+class EngineScheduler:
+    """优先级调度类，管理一组可借出的资源（引擎）"""
+
+    def __init__(self, queue_limits: Optional[Dict[int, int]] = None):
+        """
+        Args:
+            queue_limits: 各优先级的最大排队数，未给出的优先级使用DEFAULT_QUEUE_LIMITS
+        """
+        self.queue_limits = dict(DEFAULT_QUEUE_LIMITS)
+        self.queue_limits.update(queue_limits or {})
+        self._lock = threading.Lock()
+        # 空闲资源栈：后进先出，优先复用刚归还的引擎
+        self._free: List[Any] = []
+        # 每个优先级：会话 -> 该会话的等待队列，OrderedDict的顺序即轮转顺序
+        self._queues: Dict[int, "OrderedDict[str, Deque[Waiter]]"] = {
+            priority: OrderedDict() for priority in PRIORITY_NAMES
+        }
+        self._depth = {priority: 0 for priority in PRIORITY_NAMES}
+        self._waits = {priority: deque(maxlen=WAIT_SAMPLES) for priority in PRIORITY_NAMES}
+        self._granted = {priority: 0 for priority in PRIORITY_NAMES}
+        self._rejected = {priority: 0 for priority in PRIORITY_NAMES}
+
+    @property
+    def free_count(self) -> int:
+        """空闲资源数量"""
+        return len(self._free)
+
+    @property
+    def waiting(self) -> int:
+        """全部优先级的排队请求数"""
+        return sum(self._depth.values())
+
+    def waiting_at_or_above(self, priority: int) -> int:
+        """优先级不低于priority的排队请求数"""
+        return sum(depth for level, depth in self._depth.items() if level <= priority)
+
+    def release(self, resource: Any):
+        """
+        归还资源：有排队请求时直接交给优先级最高的请求，否则放回空闲栈
+
+        Args:
+            resource: 借出的资源
+        """
+        with self._lock:
+            waiter = self._pop_waiter()
+            if waiter is None:
+                self._free.append(resource)
+                return
+            waiter.granted = True
+            waiter.resource = resource
+        waiter.wake()
+
+    def take_free(self) -> List[Any]:
+        """
+        取出全部空闲资源（用于健康检查、回收），处理完后需逐个release
+
+        Returns:
+            空闲资源列表，从最近归还到最久未用
+        """
+        with self._lock:
+            free = self._free[::-1]
+            self._free.clear()
+        return free
+
+    def acquire(
+        self,
+        priority: int = INTERACTIVE,
+        session: Optional[str] = None,
+        timeout: Optional[float] = None,
+        ticket: Optional[Ticket] = None
+    ) -> Any:
+        """
+        同步借出一个资源
+
+        Args:
+            priority: 优先级
+            session: 会话标识，同一优先级内按会话轮转
+            timeout: 最长等待时间（秒）
+            ticket: 排队期间可能被提升的优先级，给出时忽略priority
+
+        Returns:
+            借出的资源
+
+        Raises:
+            QueueFullError: 排队数已达上限
+            TimeoutError: 超时仍未分配到资源
+        """
+        event = threading.Event()
+        waiter = self._enqueue(priority, session, event.set, ticket)
+        if waiter.granted or event.wait(timeout):
+            return waiter.resource
+        if self._cancel(waiter):
+            return waiter.resource
+        raise TimeoutError(f"{timeout:.1f}秒内没有空闲引擎")
+
+    async def acquire_async(
+        self,
+        priority: int = INTERACTIVE,
+        session: Optional[str] = None,
+        timeout: Optional[float] = None,
+        ticket: Optional[Ticket] = None
+    ) -> Any:
+        """
+        异步借出一个资源，参数与acquire相同
+
+        Raises:
+            QueueFullError: 排队数已达上限
+            asyncio.TimeoutError: 超时仍未分配到资源
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._enqueue(priority, session, wake, ticket)
+        if waiter.granted:
+            return waiter.resource
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException:
+            # 超时或被取消：若恰好已分配到资源则归还，否则退出队列
+            if self._cancel(waiter):
+                self.release(waiter.resource)
+            raise
+        return waiter.resource
+
+    def _enqueue(
+        self,
+        priority: int,
+        session: Optional[str],
+        wake: Callable[[], None],
+        ticket: Optional[Ticket] = None
+    ) -> Waiter:
+        """有空闲资源时直接分配，否则加入排队（超出上限时拒绝）"""
+        with self._lock:
+            if ticket is not None:
+                priority = ticket.priority
+            waiter = Waiter(priority, session or "", wake)
+            if ticket is not None:
+                ticket.waiter = waiter
+            if self._free:
+                waiter.granted = True
+                waiter.resource = self._free.pop()
+                self._record(waiter)
+                return waiter
+            if self._depth[priority] >= self.queue_limits[priority]:
+                self._rejected[priority] += 1
+                raise QueueFullError(f"{PRIORITY_NAMES[priority]}队列已满（{self._depth[priority]}）")
+            self._queues[priority].setdefault(waiter.session, deque()).append(waiter)
+            self._depth[priority] += 1
+        return waiter
+
+    def promote(self, ticket: Ticket, priority: int):
+        """
+        把借出请求提升到更高的优先级；已在排队的请求移到新优先级的队列，
+        已分配到资源的请求只记录新优先级
+
+        Args:
+            ticket: 借出请求
+            priority: 新优先级，不高于当前优先级时不做任何事
+        """
+        with self._lock:
+            if priority >= ticket.priority:
+                return
+            ticket.priority = priority
+            waiter = ticket.waiter
+            if waiter is None or not self._dequeue(waiter):
+                return
+            waiter.priority = priority
+            self._queues[priority].setdefault(waiter.session, deque()).append(waiter)
+            self._depth[priority] += 1
+
+    def _dequeue(self, waiter: Waiter) -> bool:
+        """把未分配的请求移出队列，返回它是否在排队（需持有锁）"""
+        queue = self._queues[waiter.priority]
+        pending = queue.get(waiter.session)
+        if pending is None or waiter not in pending:
+            return False
+        pending.remove(waiter)
+        self._depth[waiter.priority] -= 1
+        if not pending:
+            del queue[waiter.session]
+        return True
+
+    def _cancel(self, waiter: Waiter) -> bool:
+        """
+        撤销排队
+
+        Returns:
+            撤销前是否已经分配到资源
+        """
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._dequeue(waiter)
+            return False
+
+    def _pop_waiter(self) -> Optional[Waiter]:
+        """取出优先级最高的排队请求；同一优先级内轮到的会话取其最早的请求（需持有锁）"""
+        for priority in sorted(self._queues):
+            queue = self._queues[priority]
+            if not queue:
+                continue
+            session, pending = queue.popitem(last=False)
+            waiter = pending.popleft()
+            if pending:
+                queue[session] = pending
+            self._depth[priority] -= 1
+            self._record(waiter)
+            return waiter
+        return None
+
+    def _record(self, waiter: Waiter):
+        """记录排队耗时（需持有锁）"""
+        self._waits[waiter.priority].append(time.monotonic() - waiter.enqueued)
+        self._granted[waiter.priority] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """各优先级的排队数、分配数、拒绝数和排队耗时分位数（毫秒）"""
+        with self._lock:
+            stats = {}
+            for priority, name in PRIORITY_NAMES.items():
+                waits = sorted(self._waits[priority])
+                stats[name] = {
+                    "waiting": self._depth[priority],
+                    "granted": self._granted[priority],
+                    "rejected": self._rejected[priority],
+                    "wait_p50_ms": _percentile(waits, 0.50) * 1000,
+                    "wait_p99_ms": _percentile(waits, 0.99) * 1000
+                }
+            return stats
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """已排序列表的分位数，空列表返回0"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
@@ -0,0 +1,239 @@
+"""
+持久化分析存储
+把分析结果按局面哈希写入本地SQLite文件，重启后仍可直接命中
+
+预热用法：
+    python -m chess_core.store --db analysis.db --fens positions.txt --pgn games.pgn
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import chess
+import chess.pgn
+
+
+# (结果字典, 深度, multipv, 时间限制, 局面紧凑编码)
+StoredAnalysis = Tuple[Dict[str, Any], int, int, float, Optional[bytes]]
+
+
+def _to_signed(key: int) -> int:
+    """SQLite的INTEGER是有符号64位，把无符号Zobrist哈希映射过去"""
+    return key - (1 << 64) if key >= (1 << 63) else key
+
+
+class AnalysisStore:
+    """SQLite分析存储类，批量写入、按哈希主键查询"""
+
+    def __init__(self, path: str, batch_size: int = 64, flush_interval: float = 5.0):
+        """
+        打开（必要时创建）存储文件
+
+        Args:
+            path: SQLite文件路径
+            batch_size: 累计多少条写入后批量提交
+            flush_interval: 距上次提交超过该秒数时也会提交
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending: Dict[int, StoredAnalysis] = {}
+        self._last_flush = time.monotonic()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS analyses (
+                hash INTEGER PRIMARY KEY,
+                depth INTEGER NOT NULL,
+                multipv INTEGER NOT NULL,
+                time_limit REAL NOT NULL,
+                result TEXT NOT NULL,
+                position BLOB
+            )
+        """)
+        # 旧版本创建的文件没有position列
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(analyses)")}
+        if "position" not in columns:
+            self._conn.execute("ALTER TABLE analyses ADD COLUMN position BLOB")
+        self._conn.commit()
+
+    def get(self, key: int) -> Optional[StoredAnalysis]:
+        """
+        按局面哈希查询
+
+        Args:
+            key: 局面的Zobrist哈希
+
+        Returns:
+            (结果字典, 深度, multipv, 时间限制, 局面紧凑编码)，不存在返回None
+        """
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            row = self._conn.execute(
+                "SELECT result, depth, multipv, time_limit, position FROM analyses WHERE hash = ?",
+                (_to_signed(key),)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], row[2], row[3], row[4]
+
+    def put(
+        self,
+        key: int,
+        result: Dict[str, Any],
+        depth: int,
+        multipv: int,
+        time_limit: float,
+        position: Optional[bytes] = None
+    ):
+        """
+        写入一条分析结果（先进入缓冲区，按批提交）
+
+        Args:
+            key: 局面的Zobrist哈希
+            result: 分析结果字典
+            depth: 搜索深度
+            multipv: 最佳走法数量
+            time_limit: 分析时间限制（秒）
+            position: 局面的紧凑编码（utils.encode_position），用于排除哈希碰撞
+        """
+        with self._lock:
+            pending = self._pending.get(key)
+            # 与AnalysisCache相同：已有记录至少同样深、同样宽时保留
+            if pending is None or depth > pending[1] or multipv > pending[2]:
+                self._pending[key] = (result, depth, multipv, time_limit, position)
+            due = (
+                len(self._pending) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """把缓冲区中的记录一次性写入数据库；已有至少同样深、同样宽的记录不会被覆盖"""
+        with self._lock:
+            if not self._pending:
+                return
+            rows = [
+                (_to_signed(key), depth, multipv, time_limit, json.dumps(result, ensure_ascii=False), position)
+                for key, (result, depth, multipv, time_limit, position) in self._pending.items()
+            ]
+            self._pending.clear()
+            self._last_flush = time.monotonic()
+            self._conn.executemany("""
+                INSERT INTO analyses (hash, depth, multipv, time_limit, result, position)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(hash) DO UPDATE SET
+                    depth = excluded.depth,
+                    multipv = excluded.multipv,
+                    time_limit = excluded.time_limit,
+                    result = excluded.result,
+                    position = excluded.position
+                WHERE excluded.depth > analyses.depth
+                   OR excluded.multipv > analyses.multipv
+            """, rows)
+            self._conn.commit()
+
+    def count(self) -> int:
+        """已持久化的局面数量"""
+        self.flush()
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+    def close(self):
+        """提交剩余写入并关闭数据库"""
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+
+def _iter_positions(fen_path: Optional[str], pgn_path: Optional[str], max_plies: int) -> Iterator[str]:
+    """从FEN列表（每行一个）和PGN文件中依次产出待预热的FEN"""
+    if fen_path:
+        with open(fen_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield line
+
+    if pgn_path:
+        with open(pgn_path, encoding="utf-8", errors="replace") as f:
+            while True:
+                game = chess.pgn.read_game(f)
+                if game is None:
+                    break
+                board = game.board()
+                yield board.fen()
+                for ply, move in enumerate(game.mainline_moves()):
+                    if ply >= max_plies:
+                        break
+                    board.push(move)
+                    yield board.fen()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """预热命令行入口"""
+    from .batch import analyze_batch
+    from .cache import AnalysisCache
+    from .pool import EnginePool
+
+    parser = argparse.ArgumentParser(description="用FEN/PGN列表预热持久化分析存储")
+    parser.add_argument("--db", default=os.getenv("ANALYSIS_DB_PATH", "analysis.db"), help="SQLite文件路径")
+    parser.add_argument("--engine", default=os.getenv("STOCKFISH_PATH"), help="Stockfish路径")
+    parser.add_argument("--fens", help="FEN列表文件，每行一个")
+    parser.add_argument("--pgn", help="PGN文件，预热每局主线的前若干步")
+    parser.add_argument("--max-plies", type=int, default=20, help="每局PGN预热的半回合数")
+    parser.add_argument("--time-limit", type=float, default=2.0, help="每个局面的分析时间（秒），0表示不限时间")
+    parser.add_argument("--depth", type=int, help="每个局面的搜索深度")
+    parser.add_argument("--nodes", type=int, help="每个局面的搜索节点数")
+    parser.add_argument("--multipv", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=1, help="并行的Stockfish进程数")
+    args = parser.parse_args(argv)
+
+    if not args.fens and not args.pgn:
+        parser.error("至少需要 --fens 或 --pgn 之一")
+    if not args.engine:
+        parser.error("请通过 --engine 或 STOCKFISH_PATH 指定引擎路径")
+    if not (args.time_limit or args.depth or args.nodes):
+        parser.error("需要 --time-limit、--depth 或 --nodes 中至少一个限制")
+
+    store = AnalysisStore(args.db)
+    cache = AnalysisCache(store=store)
+    analyzed = skipped = failed = 0
+    start = time.perf_counter()
+
+    with EnginePool(args.engine, size=args.workers, cache=cache) as pool:
+        positions = _iter_positions(args.fens, args.pgn, args.max_plies)
+        results = analyze_batch(
+            positions, pool, args.time_limit, args.multipv,
+            depth=args.depth, nodes=args.nodes
+        )
+        for result in results:
+            if not result["success"]:
+                failed += 1
+                print(f"跳过 {result['fen']}: {result['error']}", file=sys.stderr)
+            elif result.get("cached"):
+                skipped += 1
+            else:
+                analyzed += 1
+
+    total = store.count()
+    store.close()
+    elapsed = time.perf_counter() - start
+    print(f"新分析 {analyzed}，已存在 {skipped}，失败 {failed}，耗时 {elapsed:.1f}s，"
+          f"存储共 {total} 个局面")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
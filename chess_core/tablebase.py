@@ -0,0 +1,301 @@
+"""
+Syzygy残局库
+子力足够少的残局直接查库得到胜/和/负（WDL）和距离归零步数（DTZ），不再启动搜索；
+残局库文件在进程内只打开一次，以内存映射方式常驻，供所有请求共用
+"""
+
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import chess
+import chess.syzygy
+
+
+# 残局库覆盖的最大子力数（含双王）
+MAX_TABLEBASE_PIECES = 7
+
+# 变化中最多展示的半回合数，与build_analysis_result一致
+MAX_PV_PLIES = 8
+
+# (走法, 走子方视角的WDL, 走子后对方视角的DTZ, 是否将死, 是否归零走法)
+RankedMove = Tuple[chess.Move, int, int, bool, bool]
+
+
+def _wdl_text(wdl: int) -> str:
+    """白方视角的WDL转为文字"""
+    return {
+        2: "白方必胜",
+        1: "白方胜（50步规则下和棋）",
+        0: "和棋",
+        -1: "黑方胜（50步规则下和棋）",
+        -2: "黑方必胜",
+    }[wdl]
+
+
+def _white_wdl(board: chess.Board, wdl: int) -> int:
+    """走子方视角的WDL转为白方视角"""
+    return wdl if board.turn == chess.WHITE else -wdl
+
+
+# 终局局面的和棋原因
+_DRAW_REASONS = {
+    chess.Termination.STALEMATE: "逼和",
+    chess.Termination.INSUFFICIENT_MATERIAL: "子力不足",
+    chess.Termination.SEVENTYFIVE_MOVES: "75步规则",
+    chess.Termination.FIVEFOLD_REPETITION: "五次重复",
+}
+
+
+class SyzygyTablebase:
+    """Syzygy残局库查询类"""
+
+    def __init__(self, path: str, probe_limit: Optional[int] = None):
+        """
+        打开残局库目录（与Stockfish的SyzygyPath格式相同，多个目录用os.pathsep分隔）
+
+        Args:
+            path: 残局库目录
+            probe_limit: 只查询子力数不超过该值的局面，默认为库中最大的表
+
+        Raises:
+            FileNotFoundError: 目录中没有任何残局库文件
+        """
+        self.path = path
+        # max_fds=None：不按LRU关闭文件，查询过的表保持内存映射
+        self._tables = chess.syzygy.Tablebase(max_fds=None)
+        count = 0
+        for directory in path.split(os.pathsep):
+            if directory and os.path.isdir(directory):
+                count += self._tables.add_directory(directory)
+        if not self._tables.wdl:
+            self._tables.close()
+            raise FileNotFoundError(f"残局库目录中没有Syzygy文件: {path}")
+
+        self.files = count
+        # 表名形如KQvKR，字符数减去分隔符v即子力数
+        largest = max(len(name) - 1 for name in self._tables.wdl)
+        self.max_pieces = min(largest, probe_limit or MAX_TABLEBASE_PIECES)
+        self.has_dtz = bool(self._tables.dtz)
+        self.probes = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    def covers(self, board: chess.Board) -> bool:
+        """
+        局面是否可能在库中（子力数足够少，且没有易位权）
+
+        Args:
+            board: 棋盘对象
+
+        Returns:
+            是否值得查询
+        """
+        return (
+            chess.popcount(board.occupied) <= self.max_pieces
+            and not board.castling_rights
+        )
+
+    def _rank_moves(self, board: chess.Board) -> Optional[List[RankedMove]]:
+        """
+        查询全部合法走法并按走子方的最优顺序排列
+
+        胜：先将死，再优先吃子/兵步（归零50步计数），再按DTZ从小到大；
+        负：按DTZ从大到小尽量拖延；任一走法查不到时返回None
+        """
+        ranked = []
+        for move in board.legal_moves:
+            zeroing = board.is_zeroing(move)
+            board.push(move)
+            try:
+                mate = board.is_checkmate()
+                if mate:
+                    wdl, dtz = 2, 0
+                else:
+                    wdl = -self._tables.probe_wdl(board)
+                    dtz = self._tables.probe_dtz(board) if self.has_dtz else 0
+            except KeyError:
+                return None
+            finally:
+                board.pop()
+            ranked.append((move, wdl, dtz, mate, zeroing))
+
+        def order(item: RankedMove):
+            _, wdl, dtz, mate, zeroing = item
+            if wdl > 0:
+                return (-wdl, not mate, not zeroing, abs(dtz))
+            if wdl < 0:
+                return (-wdl, False, zeroing, -abs(dtz))
+            return (0, False, False, 0)
+
+        ranked.sort(key=order)
+        return ranked
+
+    def _principal_variation(self, board: chess.Board, first: chess.Move) -> List[str]:
+        """从first开始沿最优走法走下去，得到SAN格式的变化"""
+        line = [board.san(first)]
+        board = board.copy(stack=False)
+        board.push(first)
+        while len(line) < MAX_PV_PLIES and not board.is_game_over():
+            ranked = self._rank_moves(board)
+            if not ranked:
+                break
+            move = ranked[0][0]
+            line.append(board.san(move))
+            board.push(move)
+        return line
+
+    def probe(self, board: chess.Board) -> Optional[Tuple[int, int]]:
+        """
+        查询单个局面
+
+        Args:
+            board: 棋盘对象
+
+        Returns:
+            走子方视角的(WDL, DTZ)，不在库中返回None
+        """
+        if not self.covers(board):
+            return None
+        try:
+            wdl = self._tables.probe_wdl(board)
+            dtz = self._tables.probe_dtz(board) if self.has_dtz else 0
+        except KeyError:
+            return None
+        return wdl, dtz
+
+    def analyze_position(self, fen: str, multipv: int = 3) -> Optional[Dict[str, Any]]:
+        """
+        用残局库回答分析请求
+
+        Args:
+            fen: FEN格式的棋盘状态
+            multipv: 返回的最佳走法数量
+
+        Returns:
+            与StockfishEngine.analyze_position格式相同的结果字典（额外包含tablebase），
+            局面不在库中或FEN格式错误时返回None，由引擎搜索；
+            已经终局（将死、逼和、子力不足等）的局面不查库，直接返回结果
+        """
+        try:
+            board = chess.Board(fen)
+        except ValueError:
+            return None
+        outcome = board.outcome()
+        if outcome is not None:
+            return self._terminal_result(board, fen, outcome)
+        if not self.covers(board):
+            return None
+
+        with self._lock:
+            self.probes += 1
+        root = self.probe(board)
+        ranked = self._rank_moves(board) if root is not None else None
+        if not ranked:
+            return None
+        with self._lock:
+            self.hits += 1
+
+        wdl, dtz = root
+        white = _white_wdl(board, wdl)
+        evaluation = f"残局库: {_wdl_text(white)}"
+        if self.has_dtz and wdl:
+            evaluation += f"（DTZ {abs(dtz)}）"
+
+        best_moves = []
+        for rank, (move, move_wdl, move_dtz, mate, _) in enumerate(ranked[:multipv], 1):
+            text = "立即将死" if mate else _wdl_text(_white_wdl(board, move_wdl))
+            if self.has_dtz and move_wdl and not mate:
+                text += f"（DTZ {abs(move_dtz)}）"
+            best_moves.append({"rank": rank, "move": board.san(move), "evaluation": text})
+
+        best = ranked[0][0]
+        return {
+            "success": True,
+            "fen": fen,
+            "best_move": board.san(best),
+            "evaluation": evaluation,
+            "eval_value": 100.0 if white == 2 else -100.0 if white == -2 else 0.0,
+            "variations": [" → ".join(self._principal_variation(board, best))],
+            "best_moves": best_moves,
+            "depth": 0,
+            "nodes": 0,
+            "nps": 0,
+            "time": 0,
+            "tablebase": {"wdl": wdl, "dtz": dtz if self.has_dtz else None}
+        }
+
+    def _terminal_result(self, board: chess.Board, fen: str, outcome: chess.Outcome) -> Dict[str, Any]:
+        """
+        终局局面的结果：将死时走子方负（WDL -2），其余为和棋（WDL 0），没有后续走法
+
+        Args:
+            board: 棋盘对象
+            fen: FEN格式的棋盘状态
+            outcome: board.outcome()的结果
+
+        Returns:
+            与analyze_position格式相同的结果字典
+        """
+        if outcome.termination == chess.Termination.CHECKMATE:
+            wdl = -2
+            evaluation = f"终局: 已将死，{_wdl_text(_white_wdl(board, wdl))}"
+        else:
+            wdl = 0
+            reason = _DRAW_REASONS.get(outcome.termination)
+            evaluation = f"终局: 和棋（{reason}）" if reason else "终局: 和棋"
+        white = _white_wdl(board, wdl)
+        return {
+            "success": True,
+            "fen": fen,
+            "best_move": None,
+            "evaluation": evaluation,
+            "eval_value": 100.0 if white == 2 else -100.0 if white == -2 else 0.0,
+            "variations": [],
+            "best_moves": [],
+            "depth": 0,
+            "nodes": 0,
+            "nps": 0,
+            "time": 0,
+            "tablebase": {"wdl": wdl, "dtz": 0 if self.has_dtz else None}
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """获取残局库统计信息"""
+        return {
+            "files": self.files,
+            "max_pieces": self.max_pieces,
+            "probes": self.probes,
+            "hits": self.hits
+        }
+
+    def close(self):
+        """关闭全部残局库文件"""
+        self._tables.close()
+
+
+# 全局残局库单例
+_tablebase: Optional[SyzygyTablebase] = None
+_tablebase_loaded = False
+_tablebase_lock = threading.Lock()
+
+def get_tablebase() -> Optional[SyzygyTablebase]:
+    """
+    获取全局残局库单例
+
+    目录与引擎共用STOCKFISH_SYZYGY_PATH，查询上限与引擎共用STOCKFISH_SYZYGY_PROBE_LIMIT；
+    未配置、目录中没有文件或上限设为0时返回None
+    """
+    from .config import EngineConfig
+
+    global _tablebase, _tablebase_loaded
+    with _tablebase_lock:
+        if not _tablebase_loaded:
+            _tablebase_loaded = True
+            config = EngineConfig.from_env()
+            if config.syzygy_path and config.syzygy_probe_limit != 0:
+                try:
+                    _tablebase = SyzygyTablebase(config.syzygy_path, config.syzygy_probe_limit)
+                except FileNotFoundError:
+                    _tablebase = None
+    return _tablebase
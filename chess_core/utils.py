@@ -2,8 +2,10 @@
 Chess Core 工具函数
 """
 
+import struct
 import chess
-from typing import Optional, Tuple
+import chess.polyglot
+from typing import Iterable, List, Optional, Tuple
 
 
 def validate_fen(fen: str) -> Tuple[bool, Optional[str]]:
@@ -39,6 +41,21 @@ def fen_to_board(fen: str) -> Optional[chess.Board]:
         return None
 
 
+# 子力价值（兵=1）
+PIECE_VALUES = {
+    chess.PAWN: 1,
+    chess.KNIGHT: 3,
+    chess.BISHOP: 3,
+    chess.ROOK: 5,
+    chess.QUEEN: 9,
+    chess.KING: 0
+}
+
+# 对局阶段按棋盘上的棋子总数划分：多于OPENING_PIECES为开局，多于ENDGAME_PIECES为中局，否则为残局
+OPENING_PIECES = 28
+ENDGAME_PIECES = 12
+
+
 def get_game_phase(board: chess.Board) -> str:
     """
     判断对局阶段
@@ -51,9 +68,9 @@ def get_game_phase(board: chess.Board) -> str:
     """
     piece_count = len(board.piece_map())
     
-    if piece_count > 28:
+    if piece_count > OPENING_PIECES:
         return "开局"
-    elif piece_count > 12:
+    elif piece_count > ENDGAME_PIECES:
         return "中局"
     else:
         return "残局"
@@ -69,20 +86,11 @@ def get_piece_value(board: chess.Board) -> Tuple[int, int]:
     Returns:
         (白方子力价值, 黑方子力价值)
     """
-    piece_values = {
-        chess.PAWN: 1,
-        chess.KNIGHT: 3,
-        chess.BISHOP: 3,
-        chess.ROOK: 5,
-        chess.QUEEN: 9,
-        chess.KING: 0
-    }
-    
     white_value = 0
     black_value = 0
     
     for square, piece in board.piece_map().items():
-        value = piece_values.get(piece.piece_type, 0)
+        value = PIECE_VALUES.get(piece.piece_type, 0)
         if piece.color == chess.WHITE:
             white_value += value
         else:
@@ -91,6 +99,29 @@ def get_piece_value(board: chess.Board) -> Tuple[int, int]:
     return white_value, black_value
 
 
+def material_delta(board: chess.Board, move: chess.Move) -> Tuple[int, int]:
+    """
+    计算走法造成的双方子力变化，用于走子时增量维护get_piece_value的结果
+
+    Args:
+        board: 走子前的棋盘
+        move: 将要走出的合法走法
+
+    Returns:
+        (白方子力变化, 黑方子力变化)
+    """
+    if board.is_castling(move):
+        return 0, 0
+    if board.is_en_passant(move):
+        captured = PIECE_VALUES[chess.PAWN]
+    else:
+        captured = PIECE_VALUES.get(board.piece_type_at(move.to_square), 0)
+    promoted = PIECE_VALUES[move.promotion] - PIECE_VALUES[chess.PAWN] if move.promotion else 0
+    if board.turn == chess.WHITE:
+        return promoted, -captured
+    return -captured, promoted
+
+
 def simplify_fen(fen: str) -> str:
     """
     简化FEN（只保留棋盘位置和轮到谁）
@@ -104,4 +135,165 @@ def simplify_fen(fen: str) -> str:
     parts = fen.split()
     if len(parts) >= 2:
         return f"{parts[0]} {parts[1]}"
-    return fen
\ No newline at end of file
+    return fen
+
+
+# 紧凑局面编码：占用位棋盘(8字节) + 标志(2字节) + 半回合计数(1字节) + 回合数(2字节)，
+# 之后每个棋子4位（按格子从a1到h8的顺序）；满盘32子共29字节
+_POSITION_HEADER = struct.Struct(">QHBH")
+# 易位权在标志位中的顺序：白短、白长、黑短、黑长
+_CASTLING_SQUARES = (chess.H1, chess.A1, chess.H8, chess.A8)
+
+
+def encode_position(board: chess.Board, clocks: bool = True) -> bytes:
+    """
+    把局面编码为紧凑的二进制（约24~29字节），不含走法栈
+    
+    Args:
+        board: 棋盘对象（标准国际象棋）
+        clocks: 是否包含半回合计数和回合数；用作缓存键时传False，
+                同一局面不同回合数得到相同的编码
+    
+    Returns:
+        编码后的字节串
+    
+    Raises:
+        ValueError: 易位权不是标准的a/h线车（Chess960）
+    """
+    flags = int(board.turn == chess.WHITE)
+    castling = board.castling_rights
+    for bit, square in enumerate(_CASTLING_SQUARES):
+        if castling & chess.BB_SQUARES[square]:
+            flags |= 1 << (bit + 1)
+            castling &= ~chess.BB_SQUARES[square]
+    if castling:
+        raise ValueError("不支持非标准易位权（Chess960）")
+    # 只记录确实能吃过路兵的格子，与Polyglot哈希一致：
+    # 双步走兵后没有兵能吃过路兵时，编码与没有过路兵格的同一局面相同
+    if board.ep_square is not None and board.has_legal_en_passant():
+        flags |= (chess.square_file(board.ep_square) + 1) << 5
+    
+    halfmove = min(board.halfmove_clock, 255) if clocks else 0
+    fullmove = min(board.fullmove_number, 0xFFFF) if clocks else 1
+    
+    # 按棋子种类遍历位棋盘，比逐格查询piece_type_at快
+    codes = [0] * 64
+    black = board.occupied_co[chess.BLACK]
+    for piece_type, mask in (
+        (chess.PAWN, board.pawns), (chess.KNIGHT, board.knights), (chess.BISHOP, board.bishops),
+        (chess.ROOK, board.rooks), (chess.QUEEN, board.queens), (chess.KING, board.kings)
+    ):
+        for square in chess.scan_forward(mask):
+            codes[square] = piece_type | (8 if black >> square & 1 else 0)
+    nibbles = [codes[square] for square in chess.scan_forward(board.occupied)]
+    if len(nibbles) % 2:
+        nibbles.append(0)
+    packed = bytes(nibbles[i] << 4 | nibbles[i + 1] for i in range(0, len(nibbles), 2))
+    return _POSITION_HEADER.pack(board.occupied, flags, halfmove, fullmove) + packed
+
+
+def encoded_position_size(data: bytes) -> int:
+    """编码后局面占用的字节数（data之后可以跟其他数据）"""
+    occupied = _POSITION_HEADER.unpack_from(data)[0]
+    return _POSITION_HEADER.size + (chess.popcount(occupied) + 1) // 2
+
+
+def decode_position(data: bytes) -> chess.Board:
+    """
+    把encode_position的结果还原为棋盘对象（走法栈为空）
+    
+    Args:
+        data: 编码后的字节串（末尾多余的数据被忽略）
+    
+    Returns:
+        棋盘对象
+    
+    Raises:
+        ValueError: 数据长度不足或内容无效
+    """
+    try:
+        occupied, flags, halfmove, fullmove = _POSITION_HEADER.unpack_from(data)
+    except struct.error as e:
+        raise ValueError(f"局面编码长度不足: {len(data)}字节") from e
+    squares = list(chess.scan_forward(occupied))
+    end = _POSITION_HEADER.size + (len(squares) + 1) // 2
+    if len(data) < end:
+        raise ValueError(f"局面编码长度不足: {len(data)}字节")
+    
+    # 先按棋子种类汇总位棋盘，再一次性写入棋盘对象
+    masks = [0] * 7
+    black = 0
+    for index, square in enumerate(squares):
+        byte = data[_POSITION_HEADER.size + index // 2]
+        nibble = byte & 0x0F if index % 2 else byte >> 4
+        piece_type = nibble & 7
+        if not chess.PAWN <= piece_type <= chess.KING:
+            raise ValueError(f"局面编码中的棋子无效: {nibble}")
+        masks[piece_type] |= 1 << square
+        if nibble & 8:
+            black |= 1 << square
+    
+    board = chess.Board.empty()
+    board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings = masks[1:]
+    board.occupied = occupied
+    board.occupied_co[chess.WHITE] = occupied & ~black
+    board.occupied_co[chess.BLACK] = black
+    board.turn = bool(flags & 1)
+    board.castling_rights = 0
+    for bit, square in enumerate(_CASTLING_SQUARES):
+        if flags & (1 << (bit + 1)):
+            board.castling_rights |= chess.BB_SQUARES[square]
+    ep_file = (flags >> 5) & 0x0F
+    if ep_file:
+        board.ep_square = chess.square(ep_file - 1, 5 if board.turn == chess.WHITE else 2)
+    board.halfmove_clock = halfmove
+    board.fullmove_number = fullmove
+    return board
+
+
+def pack_moves(moves: Iterable[chess.Move]) -> bytes:
+    """
+    把走法序列编码为每步2字节（起点6位、终点6位、升变3位）
+    
+    Args:
+        moves: 走法序列
+    
+    Returns:
+        编码后的字节串
+    """
+    return b"".join(
+        (move.from_square | move.to_square << 6 | (move.promotion or 0) << 12).to_bytes(2, "big")
+        for move in moves
+    )
+
+
+def unpack_moves(data: bytes) -> List[chess.Move]:
+    """
+    把pack_moves的结果还原为走法列表
+    
+    Args:
+        data: 编码后的字节串
+    
+    Returns:
+        走法列表
+    """
+    moves = []
+    for offset in range(0, len(data) - 1, 2):
+        raw = int.from_bytes(data[offset:offset + 2], "big")
+        moves.append(chess.Move(raw & 0x3F, (raw >> 6) & 0x3F, (raw >> 12) or None))
+    return moves
+
+
+def position_hash(board: chess.Board) -> int:
+    """
+    计算局面的Zobrist哈希（棋子位置+轮到谁+易位权+吃过路兵，忽略回合计数）
+    
+    不同走法顺序到达的同一局面得到相同的哈希，可用作分析缓存的键
+    
+    Args:
+        board: 棋盘对象
+    
+    Returns:
+        64位Zobrist哈希
+    """
+    return chess.polyglot.zobrist_hash(board)
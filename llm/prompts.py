@@ -63,7 +63,7 @@ def get_analysis_prompt(
     for r in results:
         if "best_move" in r:
             results_desc.append(
-                f"- 分析结果：最佳走法 {r['best_move']}，评估 {r['evaluation']}"
+                f"- 分析结果：最佳走法 {r['best_move'] or '无（已终局）'}，评估 {r['evaluation']}"
             )
         elif "move" in r and r.get("success"):
             results_desc.append(f"- 执行走法：{r['move']}")
@@ -40,6 +40,11 @@ tools = [
                     "depth": {
                         "type": "integer",
                         "description": "分析深度，默认为中等"
+                    },
+                    "profile": {
+                        "type": "string",
+                        "enum": ["quick", "deep", "batch"],
+                        "description": "分析配置：quick快速（默认），deep深入分析，batch批量粗略评估"
                     }
                 },
                 "required": ["question"]
@@ -57,6 +62,38 @@ tools = [
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "undo_move",
+            "description": "悔棋：撤销最近的若干步，撤销的走法保留为变着，可以重做",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "steps": {
+                        "type": "integer",
+                        "description": "撤销的半回合数，默认为1"
+                    }
+                }
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "redo_move",
+            "description": "重做：恢复刚才撤销的走法",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "steps": {
+                        "type": "integer",
+                        "description": "恢复的半回合数，默认为1"
+                    }
+                }
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
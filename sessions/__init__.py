@@ -5,5 +5,15 @@ Sessions Module
 
 from .models import ChessSession
 from .manager import SessionManager, session_manager
+from .store import (
+    MemorySessionStore,
+    RedisSessionStore,
+    SessionStore,
+    SQLiteSessionStore,
+    open_session_store,
+)
 
-__all__ = ['ChessSession', 'SessionManager', 'session_manager']
\ No newline at end of file
+__all__ = [
+    'ChessSession', 'SessionManager', 'session_manager',
+    'SessionStore', 'MemorySessionStore', 'SQLiteSessionStore', 'RedisSessionStore', 'open_session_store'
+]
\ No newline at end of file
@@ -1,90 +1,590 @@
 """
 会话管理器
 管理所有活跃会话
+
+会话按ID哈希分散到多个分片，每个分片有自己的锁，不同会话的请求很少竞争同一把锁；
+同一会话的并发修改由会话自身的锁（ChessSession.lock）串行化
+
+配置了会话存储（SESSION_STORE_URL，见store.py）时，进程内的会话只是缓存：
+首次访问时从存储加载，acquire开始时比较存储中的版本号、已被其他进程更新时重新加载，
+acquire结束时立即把修改写回存储（有条件写入，存储中的版本已变化时放弃本地修改）；
+只读访问的续期由后台线程批量进行。多个进程可共享同一存储
 """
 
-from typing import Dict, Optional
-from .models import ChessSession
+import asyncio
+import os
+import threading
 import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+
+from .models import ChessSession
+from .store import SessionStore, get_session_store
+
+# (会话, 与存储同步时的序列化结果, 存储中的版本号)
+_Loaded = Tuple[ChessSession, Optional[bytes], Optional[int]]
+
+# 新建会话的序列化结果：新建后没有走子的会话不必写回，也不会覆盖其他进程写入的版本
+_NEW_SESSION = ChessSession().to_bytes()
+
+# 清理存储中过期会话的间隔（秒）
+_PURGE_INTERVAL = 60.0
+
+
+class _Shard:
+    """会话分片：一部分会话及其访问顺序，由分片锁保护"""
+
+    def __init__(self, max_sessions: Optional[int], persistent: bool = False):
+        self.lock = threading.Lock()
+        self.max_sessions = max_sessions
+        # 是否记录需要写回存储的会话
+        self.persistent = persistent
+        self.sessions: Dict[str, ChessSession] = {}
+        # 会话ID -> 最近访问时间，按访问顺序排列（最久未访问的在最前）
+        self.last_access: "OrderedDict[str, float]" = OrderedDict()
+        # 会话ID -> 正在使用该会话的请求数；使用中的会话不会过期或被淘汰
+        self.in_use: Dict[str, int] = {}
+        # 会话ID -> 串行化异步请求的asyncio锁（按需创建）
+        self.async_locks: Dict[str, asyncio.Lock] = {}
+        # 以下只在persistent时使用：
+        # 会话ID -> 最近一次与存储同步时的序列化结果
+        self.synced: Dict[str, Optional[bytes]] = {}
+        # 会话ID -> 最近一次与存储同步时存储中的版本号，None表示存储中没有该会话
+        self.versions: Dict[str, Optional[int]] = {}
+        # 上次写回后访问过的会话
+        self.dirty: Set[str] = set()
+        # 已移出内存、但还没写回的会话
+        self.retired: Dict[str, _Loaded] = {}
+        self.expired = 0
+        self.evicted = 0
+        # 写回时存储中的版本已被其他进程更新的次数
+        self.conflicts = 0
+
+    def touch(self, session_id: str, now: float, loaded: Optional[_Loaded] = None) -> ChessSession:
+        """
+        获取或创建会话并移到最近访问的一端（需持有分片锁）
+
+        Args:
+            session_id: 会话ID
+            now: 当前时间
+            loaded: 会话不在内存中时使用的、从存储加载的会话
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            if session_id in self.retired:
+                loaded = self.retired.pop(session_id)
+            session, synced, version = loaded or (ChessSession(session_id), _NEW_SESSION, None)
+            self.sessions[session_id] = session
+            if self.persistent:
+                self.synced[session_id] = synced
+                self.versions[session_id] = version
+        if self.persistent:
+            self.dirty.add(session_id)
+        self.last_access[session_id] = now
+        self.last_access.move_to_end(session_id)
+
+        # 超出上限时淘汰最久未访问的会话
+        if self.max_sessions is not None:
+            for _ in range(len(self.last_access)):
+                if len(self.sessions) <= self.max_sessions:
+                    break
+                oldest = next(iter(self.last_access))
+                if oldest in self.in_use:
+                    self.last_access.move_to_end(oldest)
+                    continue
+                self.remove(oldest)
+                self.evicted += 1
+        return session
+
+    def remove(self, session_id: str, retire: bool = True):
+        """
+        从内存中删除会话（需持有分片锁）
+
+        Args:
+            session_id: 会话ID
+            retire: 访问过但还没写回的会话是否留待下次写回
+        """
+        session = self.sessions.pop(session_id, None)
+        self.last_access.pop(session_id, None)
+        # 使用中的会话保留asyncio锁（由_unpin在最后一个请求结束时删除），
+        # 否则之后的请求会新建一把锁，与仍持有旧锁的请求同时修改会话
+        if session_id not in self.in_use:
+            self.async_locks.pop(session_id, None)
+        synced = self.synced.pop(session_id, None)
+        version = self.versions.pop(session_id, None)
+        if session_id in self.dirty:
+            self.dirty.discard(session_id)
+            if retire and session is not None:
+                self.retired[session_id] = (session, synced, version)
+        if not retire:
+            self.retired.pop(session_id, None)
+
+    def clean_expired(self, deadline: float, now: float) -> int:
+        """
+        清理最近访问早于deadline的会话（需持有分片锁）
+
+        最前面的会话未过期时，后面的也都未过期，因此只需从最前面开始检查；
+        使用中的会话视为刚被访问，移到末尾
+
+        Returns:
+            清理的会话数量
+        """
+        removed = 0
+        for _ in range(len(self.last_access)):
+            session_id, last_time = next(iter(self.last_access.items()))
+            if last_time > deadline:
+                break
+            if session_id in self.in_use:
+                self.last_access[session_id] = now
+                self.last_access.move_to_end(session_id)
+                continue
+            self.remove(session_id)
+            removed += 1
+        self.expired += removed
+        return removed
 
 
 class SessionManager:
-    """会话管理器类"""
-    
-    def __init__(self, session_timeout: int = 3600):
+    """会话管理器类（线程安全）"""
+
+    def __init__(
+        self,
+        session_timeout: int = 3600,
+        max_sessions: Optional[int] = 10000,
+        sweep_interval: Optional[float] = 60.0,
+        num_shards: int = 16,
+        store: Optional[SessionStore] = None,
+        flush_interval: float = 5.0
+    ):
         """
         初始化会话管理器
-        
+
+        会话按最近访问顺序保存在OrderedDict中（最久未访问的在最前），
+        访问只需移到末尾，过期和淘汰都只看最前面的几项，均摊O(1)
+
         Args:
             session_timeout: 会话超时时间（秒）
+            max_sessions: 最多保留的会话数量，超出时淘汰最久未访问的会话；None表示不限。
+                上限按分片平均分配，每个分片各自淘汰
+            sweep_interval: 后台清理过期会话的间隔（秒）；None或0表示只在访问时顺带清理
+            num_shards: 分片数量；越多锁竞争越少
+            store: 会话存储；None表示会话只保存在进程内。内存中的会话过期或被淘汰后，
+                再次访问时从存储重新加载
+            flush_interval: 批量续期只读访问过的会话、重试写回失败的会话的间隔（秒）
         """
-        self._sessions: Dict[str, ChessSession] = {}
         self._session_timeout = session_timeout
-        self._last_access: Dict[str, float] = {}
-    
+        self._max_sessions = max_sessions
+        num_shards = max(1, num_shards)
+        shard_max = None if max_sessions is None else max(1, -(-max_sessions // num_shards))
+        self._store = store
+        self._shards: List[_Shard] = [_Shard(shard_max, store is not None) for _ in range(num_shards)]
+        self._stop_sweeper = threading.Event()
+        self._flush_lock = threading.Lock()
+        self.flush_errors = 0
+
+        if store is not None:
+            sweep_interval = min(sweep_interval or flush_interval, flush_interval)
+        if sweep_interval:
+            threading.Thread(
+                target=self._sweep_loop,
+                args=(sweep_interval,),
+                name="session-sweeper",
+                daemon=True
+            ).start()
+
+    def _shard(self, session_id: str) -> _Shard:
+        """会话所在的分片"""
+        return self._shards[hash(session_id) % len(self._shards)]
+
     def get_session(self, session_id: str = "default") -> ChessSession:
         """
         获取或创建会话
-        
+
+        返回的会话之后仍可能过期；需要在一段操作中保持会话并防止并发修改时用acquire。
+        配置了存储时，内存中已有的会话直接返回，不检查其他进程的更新；
+        通过get_session做的修改只由后台线程写回
+
         Args:
             session_id: 会话ID
-        
+
         Returns:
             会话对象
         """
-        # 清理过期会话
-        self._clean_expired()
-        
-        # 获取或创建会话
-        if session_id not in self._sessions:
-            self._sessions[session_id] = ChessSession(session_id)
-        
-        # 更新访问时间
-        self._last_access[session_id] = time.time()
-        
-        return self._sessions[session_id]
-    
+        now = time.monotonic()
+        shard = self._shard(session_id)
+        with shard.lock:
+            # 清理过期会话（只检查最久未访问的几项）
+            shard.clean_expired(now - self._session_timeout, now)
+            if self._store is None or session_id in shard.sessions or session_id in shard.retired:
+                return shard.touch(session_id, now)
+
+        # 不在内存中：在锁外从存储加载，加载期间不阻塞同一分片的其他会话
+        loaded = self._load(session_id)
+        with shard.lock:
+            return shard.touch(session_id, now, loaded)
+
+    def _load(self, session_id: str) -> Optional[_Loaded]:
+        """从存储加载会话，不存在或数据无效返回None"""
+        stored = self._store.load(session_id)
+        if stored is None:
+            return None
+        data, version = stored
+        try:
+            return ChessSession.from_bytes(data, session_id), data, version
+        except ValueError:
+            return None
+
+    def _pin(self, session_id: str) -> ChessSession:
+        """
+        获取会话并标记为使用中
+
+        配置了存储时，先比较存储中的版本号与内存中会话上次同步时的版本号：
+        相同（最常见）时不读取会话内容；不同说明其他进程已更新或删除该会话，
+        换用存储中的版本（存储中没有时换成新会话），多个进程交替处理同一会话的消息时
+        看到的是最新棋局。正在使用或等待写回的会话不检查
+        """
+        now = time.monotonic()
+        shard = self._shard(session_id)
+        while True:
+            with shard.lock:
+                shard.clean_expired(now - self._session_timeout, now)
+                if self._store is None or session_id in shard.in_use or session_id in shard.retired:
+                    session = shard.touch(session_id, now)
+                    shard.in_use[session_id] = shard.in_use.get(session_id, 0) + 1
+                    return session
+                resident = shard.sessions.get(session_id)
+                known = shard.versions.get(session_id)
+
+            # 在锁外读取存储；内存中的会话只读版本号，过时时才读取内容并反序列化
+            stale = resident is None or self._store.version(session_id) != known
+            loaded = self._load(session_id) if stale else None
+            with shard.lock:
+                current = shard.sessions.get(session_id)
+                if resident is not None and current is None and session_id not in shard.retired:
+                    # 读取期间内存中的会话被淘汰（很少见）：重新检查
+                    continue
+                if resident is not None and stale and current is resident and session_id not in shard.in_use:
+                    shard.remove(session_id, retire=False)
+                session = shard.touch(session_id, now, loaded)
+                shard.in_use[session_id] = shard.in_use.get(session_id, 0) + 1
+            return session
+
+    async def _pin_async(self, session_id: str) -> ChessSession:
+        """_pin的异步版本：读取存储和反序列化在线程中进行，不阻塞事件循环"""
+        if self._store is None:
+            return self._pin(session_id)
+        pinning = asyncio.ensure_future(asyncio.to_thread(self._pin, session_id))
+        try:
+            return await asyncio.shield(pinning)
+        except asyncio.CancelledError:
+            # 等待期间被取消：线程仍会完成标记，完成后立即取消使用中标记
+            def release(done: "asyncio.Future[ChessSession]"):
+                if not done.cancelled() and done.exception() is None:
+                    self._unpin(session_id)
+            pinning.add_done_callback(release)
+            raise
+
+    def _unpin(self, session_id: str):
+        """取消使用中标记并刷新访问时间"""
+        now = time.monotonic()
+        shard = self._shard(session_id)
+        with shard.lock:
+            count = shard.in_use.get(session_id, 0) - 1
+            if count > 0:
+                shard.in_use[session_id] = count
+            else:
+                shard.in_use.pop(session_id, None)
+                if session_id not in shard.sessions:
+                    # 使用期间会话已被清除：删除留到现在的asyncio锁
+                    shard.async_locks.pop(session_id, None)
+            if session_id in shard.last_access:
+                shard.last_access[session_id] = now
+                shard.last_access.move_to_end(session_id)
+                if shard.persistent:
+                    # 修改已由_write_back写回，这里只需续期（或重试写回失败的会话）
+                    shard.dirty.add(session_id)
+
+    def _write_back(self, session_id: str, session: ChessSession):
+        """
+        acquire结束时把修改写回存储
+
+        未修改的会话只留待后台线程批量续期；写入失败时会话仍在待写回集合中，
+        由后台线程重试，不影响本次请求
+        """
+        shard = self._shard(session_id)
+        # 持有会话锁：同一会话的写回依次进行，后一次写入使用前一次写入后的版本号
+        with session.lock:
+            with shard.lock:
+                if shard.sessions.get(session_id) is not session:
+                    # 使用期间会话已被清除
+                    return
+                synced = shard.synced.get(session_id)
+                expected = shard.versions.get(session_id)
+            data = session.to_bytes()
+            if data == synced:
+                return
+            try:
+                version = self._store.save(session_id, data, expected)
+            except Exception:
+                self.flush_errors += 1
+                return
+            with shard.lock:
+                self._saved(shard, session_id, session, data, version)
+
+    @staticmethod
+    def _saved(shard: _Shard, session_id: str, session: ChessSession, data: bytes, version: Optional[int]):
+        """
+        记录有条件写入的结果（需持有分片锁）
+
+        写入成功时更新同步状态；存储中的版本已被其他进程更新时放弃本地修改、
+        从内存中删除会话，下次访问时加载存储中的版本
+        """
+        if version is None:
+            shard.conflicts += 1
+            if shard.sessions.get(session_id) is session:
+                shard.remove(session_id, retire=False)
+            else:
+                shard.retired.pop(session_id, None)
+        elif shard.sessions.get(session_id) is session:
+            shard.synced[session_id] = data
+            shard.versions[session_id] = version
+
+    @contextmanager
+    def acquire(self, session_id: str = "default") -> Iterator[ChessSession]:
+        """
+        独占使用会话（同步版本）
+
+        期间会话不会过期或被淘汰，同一会话的其他acquire会等待；
+        配置了存储时，结束时立即把修改写回存储
+
+        Args:
+            session_id: 会话ID
+
+        Yields:
+            会话对象
+        """
+        session = self._pin(session_id)
+        try:
+            with session.lock:
+                try:
+                    yield session
+                finally:
+                    if self._store is not None:
+                        self._write_back(session_id, session)
+        finally:
+            self._unpin(session_id)
+
+    @asynccontextmanager
+    async def acquire_async(self, session_id: str = "default") -> AsyncIterator[ChessSession]:
+        """
+        独占使用会话（异步版本）
+
+        同一会话的异步请求按顺序执行（等待期间不阻塞事件循环），
+        可以跨越await持有；会话自身的修改仍由ChessSession.lock保护。
+        配置了存储时，结束时在线程中把修改写回存储
+
+        Args:
+            session_id: 会话ID
+
+        Yields:
+            会话对象
+        """
+        session = await self._pin_async(session_id)
+        try:
+            shard = self._shard(session_id)
+            with shard.lock:
+                lock = shard.async_locks.get(session_id)
+                if lock is None:
+                    lock = shard.async_locks[session_id] = asyncio.Lock()
+            async with lock:
+                try:
+                    yield session
+                finally:
+                    if self._store is not None:
+                        await asyncio.to_thread(self._write_back, session_id, session)
+        finally:
+            self._unpin(session_id)
+
     def clear_session(self, session_id: str):
         """
-        清除指定会话
-        
+        清除指定会话（同时从存储中删除）
+
         Args:
             session_id: 会话ID
         """
-        if session_id in self._sessions:
-            del self._sessions[session_id]
-        if session_id in self._last_access:
-            del self._last_access[session_id]
-    
+        shard = self._shard(session_id)
+        with shard.lock:
+            shard.remove(session_id, retire=False)
+        if self._store is not None:
+            self._store.delete(session_id)
+
     def clear_all(self):
-        """清除所有会话"""
-        self._sessions.clear()
-        self._last_access.clear()
-    
-    def _clean_expired(self):
-        """清理过期会话"""
-        current_time = time.time()
-        expired = []
-        
-        for session_id, last_time in self._last_access.items():
-            if current_time - last_time > self._session_timeout:
-                expired.append(session_id)
-        
-        for session_id in expired:
-            self.clear_session(session_id)
-    
+        """清除所有会话（同时清空存储）"""
+        for shard in self._shards:
+            with shard.lock:
+                shard.sessions.clear()
+                shard.last_access.clear()
+                for session_id in list(shard.async_locks):
+                    if session_id not in shard.in_use:
+                        del shard.async_locks[session_id]
+                shard.synced.clear()
+                shard.versions.clear()
+                shard.dirty.clear()
+                shard.retired.clear()
+        if self._store is not None:
+            self._store.clear()
+
+    def flush(self) -> int:
+        """
+        续期上次写回后访问过的会话，并写入还没写回的修改
+
+        acquire结束时修改已经写回，这里主要是批量续期只读访问过的会话；
+        通过get_session修改、已移出内存或写回失败的会话逐个有条件写入，
+        存储中的版本已被其他进程更新时放弃本地修改
+
+        Returns:
+            写入的会话数量
+        """
+        if self._store is None:
+            return 0
+        with self._flush_lock:
+            # 在分片锁内取出待写回的会话，序列化和写入都在锁外进行
+            pending: List[Tuple[_Shard, str, _Loaded]] = []
+            for shard in self._shards:
+                with shard.lock:
+                    for session_id in shard.dirty:
+                        session = shard.sessions.get(session_id)
+                        if session is not None:
+                            loaded = (session, shard.synced.get(session_id), shard.versions.get(session_id))
+                            pending.append((shard, session_id, loaded))
+                    pending.extend((shard, session_id, loaded) for session_id, loaded in shard.retired.items())
+                    shard.dirty.clear()
+                    shard.retired.clear()
+
+            changed: List[Tuple[_Shard, str, ChessSession, bytes, Optional[int]]] = []
+            unchanged: List[str] = []
+            for shard, session_id, (session, synced, version) in pending:
+                data = session.to_bytes()
+                if data != synced:
+                    changed.append((shard, session_id, session, data, version))
+                else:
+                    unchanged.append(session_id)
+
+            written = 0
+            done: Set[str] = set()
+            try:
+                self._store.touch_many(unchanged)
+                done.update(unchanged)
+                for shard, session_id, session, data, expected in changed:
+                    version = self._store.save(session_id, data, expected)
+                    with shard.lock:
+                        self._saved(shard, session_id, session, data, version)
+                    done.add(session_id)
+                    written += version is not None
+            except Exception:
+                # 写回失败：没处理完的会话放回待写回集合，下次重试
+                for shard, session_id, loaded in pending:
+                    if session_id in done:
+                        continue
+                    with shard.lock:
+                        if shard.sessions.get(session_id) is loaded[0]:
+                            shard.dirty.add(session_id)
+                        elif session_id not in shard.sessions:
+                            shard.retired.setdefault(session_id, loaded)
+                raise
+            return written
+
+    def _clean_expired(self) -> int:
+        """
+        清理所有分片的过期会话
+
+        Returns:
+            清理的会话数量
+        """
+        removed = 0
+        for shard in self._shards:
+            now = time.monotonic()
+            with shard.lock:
+                removed += shard.clean_expired(now - self._session_timeout, now)
+        return removed
+
+    def _sweep_loop(self, interval: float):
+        """后台线程：没有请求时过期会话也能及时释放，并定期写回存储"""
+        last_purge = time.monotonic()
+        while not self._stop_sweeper.wait(interval):
+            self._clean_expired()
+            if self._store is None:
+                continue
+            try:
+                self.flush()
+                if time.monotonic() - last_purge >= _PURGE_INTERVAL:
+                    self._store.purge_expired()
+                    last_purge = time.monotonic()
+            except Exception:
+                # 存储暂时不可用时保留待写回的会话，下次重试
+                self.flush_errors += 1
+
+    def close(self):
+        """停止后台线程，写回剩余会话并关闭存储"""
+        self._stop_sweeper.set()
+        if self._store is not None:
+            self.flush()
+            self._store.close()
+
     def get_active_count(self) -> int:
         """获取活跃会话数量"""
         self._clean_expired()
-        return len(self._sessions)
-    
+        count = 0
+        for shard in self._shards:
+            with shard.lock:
+                count += len(shard.sessions)
+        return count
+
     def get_all_sessions(self) -> Dict[str, Dict]:
         """获取所有会话信息"""
+        sessions = []
+        for shard in self._shards:
+            with shard.lock:
+                sessions.extend(shard.sessions.items())
         return {
-            sid: session.to_dict() 
-            for sid, session in self._sessions.items()
+            sid: session.to_dict()
+            for sid, session in sessions
         }
 
+    def stats(self) -> Dict[str, int]:
+        """获取会话统计信息"""
+        result = {"active": 0, "in_use": 0, "expired": 0, "evicted": 0, "shards": len(self._shards)}
+        if self._store is not None:
+            result.update(pending_writes=0, conflicts=0, flush_errors=self.flush_errors)
+        for shard in self._shards:
+            with shard.lock:
+                result["active"] += len(shard.sessions)
+                result["in_use"] += len(shard.in_use)
+                result["expired"] += shard.expired
+                result["evicted"] += shard.evicted
+                if self._store is not None:
+                    result["pending_writes"] += len(shard.dirty) + len(shard.retired)
+                    result["conflicts"] += shard.conflicts
+        return result
+
+
+def _env_int(name: str, default: Optional[int]) -> Optional[int]:
+    """读取整数环境变量，设为0表示不限"""
+    value = os.getenv(name)
+    if not value:
+        return default
+    return int(value) or None
+
 
 # 全局会话管理器单例
-session_manager = SessionManager()
\ No newline at end of file
+# 配置：SESSION_TIMEOUT（秒）、SESSION_MAX（最多会话数，0表示不限）、SESSION_SHARDS（分片数）、
+# SESSION_STORE_URL（会话存储，见store.py）、SESSION_FLUSH_INTERVAL（批量续期间隔秒数）
+_timeout = _env_int("SESSION_TIMEOUT", 3600) or 3600
+session_manager = SessionManager(
+    session_timeout=_timeout,
+    max_sessions=_env_int("SESSION_MAX", 10000),
+    num_shards=_env_int("SESSION_SHARDS", 16) or 16,
+    store=get_session_store(ttl=_timeout),
+    flush_interval=float(os.getenv("SESSION_FLUSH_INTERVAL") or 5.0)
+)
@@ -1,9 +1,97 @@
 """
 会话数据模型
+
+走法保存在变着树中：悔棋、重做、跳到任意节点和开新分支都不需要从头重放走法，
+跳转时从最近的公共祖先或最近的棋盘检查点出发，取代价较小的一种
 """
 
+import functools
+import threading
+
 import chess
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+
+from chess_core.utils import (
+    decode_position,
+    encode_position,
+    encoded_position_size,
+    get_piece_value,
+    material_delta,
+    pack_moves,
+    unpack_moves,
+)
+
+# 五次重复至少需要16个连续的可逆半回合，半回合计数小于该值时不必检查重复
+_FIVEFOLD_MIN_HALFMOVES = 16
+
+# 每隔多少半回合在变着树节点上保存一个棋盘检查点
+CHECKPOINT_INTERVAL = 16
+
+# 复制检查点棋盘时每个半回合的走法栈开销，约为一次push的该比例
+_COPY_COST_PER_PLY = 0.01
+
+
+def _clone_board(board: chess.Board) -> chess.Board:
+    """
+    复制棋盘，走法栈只做浅复制
+
+    Board.copy会逐个复制走法栈中的Move，长对局中与从头重放相当；
+    栈中的Move和局面状态对象不会被修改，共享即可
+    """
+    clone = board.copy(stack=False)
+    clone.move_stack = board.move_stack.copy()
+    clone._stack = board._stack.copy()
+    return clone
+
+
+def _synchronized(method):
+    """方法执行期间持有会话锁，同一会话的并发调用不会交错修改棋盘"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class VariationNode:
+    """变着树节点：从父节点走一步到达的局面"""
+    
+    __slots__ = ("node_id", "parent", "move", "san", "ply", "children", "selected", "material", "checkpoint")
+    
+    def __init__(
+        self,
+        node_id: int,
+        parent: Optional["VariationNode"],
+        move: Optional[chess.Move],
+        san: Optional[str],
+        material: Tuple[int, int]
+    ):
+        """
+        Args:
+            node_id: 节点编号，会话内唯一
+            parent: 父节点，根节点为None
+            move: 从父节点到达该节点的走法
+            san: 走法的代数记谱
+            material: (白方子力, 黑方子力)
+        """
+        self.node_id = node_id
+        self.parent = parent
+        self.move = move
+        self.san = san
+        self.ply = 0 if parent is None else parent.ply + 1
+        self.children: List["VariationNode"] = []
+        # 重做时进入的分支：最近一次经过的子节点
+        self.selected: Optional["VariationNode"] = None
+        self.material = material
+        # 到达该局面的棋盘副本（含走法栈），只在根节点和每CHECKPOINT_INTERVAL个半回合保存
+        self.checkpoint: Optional[chess.Board] = None
+    
+    def child(self, move: chess.Move) -> Optional["VariationNode"]:
+        """走法对应的子节点，不存在返回None"""
+        for node in self.children:
+            if node.move == move:
+                return node
+        return None
 
 
 class ChessSession:
@@ -17,12 +105,91 @@ class ChessSession:
             session_id: 会话ID
         """
         self.session_id = session_id
-        self.board = chess.Board()
+        # get_status的缓存：(计算时的节点, 走法栈长度, 状态)，局面变化时失效
+        self._status: Optional[Tuple[VariationNode, int, Dict[str, Any]]] = None
+        # 变着树；history是从根节点到当前节点的走法
+        self.root: VariationNode
+        self.current: VariationNode
         self.history: List[str] = []
+        self._nodes: Dict[int, VariationNode] = {}
+        self.board = chess.Board()
         self.last_analysis: Optional[Dict[str, Any]] = None
         self.created_at = None  # 可以添加时间戳
         self.updated_at = None
+        # 可重入锁：to_dict内部调用get_status等嵌套加锁不会死锁
+        self.lock = threading.RLock()
+    
+    @property
+    def board(self) -> chess.Board:
+        """当前棋盘"""
+        return self._board
+    
+    @board.setter
+    def board(self, board: chess.Board):
+        """替换棋盘：以其起始局面为根重建变着树，走法栈成为主线"""
+        root_board = board.root()
+        self._nodes = {}
+        self.root = self._add_node(None, None, None, get_piece_value(root_board))
+        self.root.checkpoint = root_board.copy()
+        self.current = self.root
+        self.history = []
+        self._board = root_board
+        self._status = None
+        for move in board.move_stack:
+            self._advance(move, root_board.san(move))
     
+    def _add_node(
+        self,
+        parent: Optional[VariationNode],
+        move: Optional[chess.Move],
+        san: Optional[str],
+        material: Tuple[int, int]
+    ) -> VariationNode:
+        """创建节点并登记编号"""
+        node = VariationNode(len(self._nodes), parent, move, san, material)
+        self._nodes[node.node_id] = node
+        if parent is not None:
+            parent.children.append(node)
+        return node
+    
+    def _advance(self, move: chess.Move, san: str):
+        """
+        从当前节点走一步：已有该走法的分支时沿分支前进，否则新建分支
+        
+        子力在新建节点时按父节点增量计算
+        """
+        node = self.current.child(move)
+        if node is None:
+            white_delta, black_delta = material_delta(self._board, move)
+            white_value, black_value = self.current.material
+            node = self._add_node(self.current, move, san, (white_value + white_delta, black_value + black_delta))
+        self.current.selected = node
+        self._board.push(move)
+        if node.checkpoint is None and node.ply % CHECKPOINT_INTERVAL == 0:
+            node.checkpoint = _clone_board(self._board)
+        self.history.append(node.san)
+        self.current = node
+    
+    def _retreat(self):
+        """退回父节点"""
+        node = self.current
+        node.parent.selected = node
+        self._board.pop()
+        self.history.pop()
+        self.current = node.parent
+    
+    def _navigation_result(self, **extra) -> Dict[str, Any]:
+        """悔棋、重做、跳转的返回值"""
+        return {
+            "success": True,
+            "fen": self.board.fen(),
+            "turn": "白方" if self.board.turn == chess.WHITE else "黑方",
+            "move_number": len(self.history),
+            "node_id": self.current.node_id,
+            **extra
+        }
+    
+    @_synchronized
     def make_move(self, move_san: str) -> Dict[str, Any]:
         """
         执行走法
@@ -46,16 +213,16 @@ class ChessSession:
                     "turn": "白方" if self.board.turn == chess.WHITE else "黑方"
                 }
             
-            # 执行走法
-            self.board.push(move)
-            self.history.append(move_san)
+            # 执行走法：当前节点已有该走法时沿原分支前进，否则开新分支
+            self._advance(move, move_san)
             
             return {
                 "success": True,
                 "fen": self.board.fen(),
                 "move": move_san,
                 "turn": "白方" if self.board.turn == chess.WHITE else "黑方",
-                "move_number": len(self.history)
+                "move_number": len(self.history),
+                "node_id": self.current.node_id
             }
             
         except ValueError as e:
@@ -65,56 +232,203 @@ class ChessSession:
                 "fen": self.board.fen()
             }
     
+    @_synchronized
     def get_status(self) -> Dict[str, Any]:
         """
         获取当前棋盘状态
         
+        同一局面只计算一次，局面变化后重新计算；直接修改board的走法栈时也会重新计算
+        
         Returns:
             状态信息
         """
+        board = self.board
+        plies = len(board.move_stack)
+        if self._status is None or self._status[0] is not self.current or self._status[1] != plies:
+            self._status = (self.current, plies, self._compute_status(board, plies))
+        return dict(self._status[2])
+    
+    def _compute_status(self, board: chess.Board, plies: int) -> Dict[str, Any]:
+        """计算状态：合法走法只生成一次，重复局面只在可能出现时检查"""
+        legal_moves = board.legal_moves.count()
+        in_check = board.is_check()
+        
         # 检查特殊状态
-        if self.board.is_checkmate():
-            winner = "黑方" if self.board.turn == chess.WHITE else "白方"
+        if legal_moves == 0 and in_check:
+            winner = "黑方" if board.turn == chess.WHITE else "白方"
             status = f"将死！{winner}获胜"
             game_over = True
-        elif self.board.is_stalemate():
+        elif legal_moves == 0:
             status = "逼和"
             game_over = True
-        elif self.board.is_insufficient_material():
+        elif board.is_insufficient_material():
             status = "子力不足，和棋"
             game_over = True
-        elif self.board.is_seventyfive_moves():
+        elif board.is_seventyfive_moves():
             status = "75步规则和棋"
             game_over = True
-        elif self.board.is_fivefold_repetition():
+        elif board.halfmove_clock >= _FIVEFOLD_MIN_HALFMOVES and board.is_fivefold_repetition():
             status = "五次重复和棋"
             game_over = True
-        elif self.board.is_check():
-            status = f"{'白方' if self.board.turn == chess.WHITE else '黑方'}被将军"
+        elif in_check:
+            status = f"{'白方' if board.turn == chess.WHITE else '黑方'}被将军"
             game_over = False
         else:
             status = "正常对局"
             game_over = False
         
-        # 计算双方子力
-        from chess_core.utils import get_piece_value
-        white_value, black_value = get_piece_value(self.board)
+        # 双方子力：建节点时已增量计算，棋盘被直接修改过时重新计算
+        if plies == self.current.ply:
+            white_value, black_value = self.current.material
+        else:
+            white_value, black_value = get_piece_value(board)
         
         return {
-            "fen": self.board.fen(),
-            "turn": "白方" if self.board.turn == chess.WHITE else "黑方",
-            "turn_code": "w" if self.board.turn == chess.WHITE else "b",
+            "fen": board.fen(),
+            "turn": "白方" if board.turn == chess.WHITE else "黑方",
+            "turn_code": "w" if board.turn == chess.WHITE else "b",
             "status": status,
             "game_over": game_over,
             "history": " → ".join(self.history) if self.history else "无",
             "move_count": len(self.history),
-            "fullmove_number": self.board.fullmove_number,
+            "fullmove_number": board.fullmove_number,
             "white_piece_value": white_value,
             "black_piece_value": black_value,
             "material_balance": white_value - black_value,
-            "legal_moves": len(list(self.board.legal_moves))
+            "legal_moves": legal_moves,
+            "node_id": self.current.node_id,
+            "can_undo": self.current.parent is not None,
+            "can_redo": self.current.selected is not None
         }
     
+    @_synchronized
+    def undo(self, steps: int = 1) -> Dict[str, Any]:
+        """
+        悔棋：退回若干步，退回的走法仍保留在变着树中，可以重做
+        
+        Args:
+            steps: 退回的半回合数
+        
+        Returns:
+            执行结果，undone为退回的走法
+        """
+        if self.current.parent is None:
+            return {"success": False, "error": "已经是初始局面，无法悔棋", "fen": self.board.fen()}
+        undone = []
+        for _ in range(min(max(1, steps), self.current.ply)):
+            undone.append(self.current.san)
+            self._retreat()
+        undone.reverse()
+        return self._navigation_result(undone=undone)
+    
+    @_synchronized
+    def redo(self, steps: int = 1) -> Dict[str, Any]:
+        """
+        重做：沿最近一次经过的分支前进若干步
+        
+        Args:
+            steps: 前进的半回合数
+        
+        Returns:
+            执行结果，redone为重做的走法
+        """
+        if self.current.selected is None:
+            return {"success": False, "error": "没有可以重做的走法", "fen": self.board.fen()}
+        redone = []
+        for _ in range(max(1, steps)):
+            node = self.current.selected
+            if node is None:
+                break
+            self._advance(node.move, node.san)
+            redone.append(node.san)
+        return self._navigation_result(redone=redone)
+    
+    @_synchronized
+    def goto(self, node_id: int) -> Dict[str, Any]:
+        """
+        跳到变着树中的任意节点
+        
+        从当前节点退回到最近公共祖先再前进，或者从目标节点最近的检查点复制棋盘再前进，
+        取需要走子次数较少的一种，不会从头重放整盘棋
+        
+        Args:
+            node_id: 目标节点编号（make_move、get_status和get_variation_tree的返回值中都有）
+        
+        Returns:
+            执行结果
+        """
+        target = self._nodes.get(node_id)
+        if target is None:
+            return {"success": False, "error": f"节点不存在: {node_id}", "fen": self.board.fen()}
+        
+        # 最近公共祖先：先把较深的一方提到同一深度，再一起向上
+        ancestor, up, down = self.current, 0, []
+        node = target
+        while ancestor.ply > node.ply:
+            ancestor, up = ancestor.parent, up + 1
+        while node.ply > ancestor.ply:
+            down.append(node)
+            node = node.parent
+        while ancestor is not node:
+            ancestor, up = ancestor.parent, up + 1
+            down.append(node)
+            node = node.parent
+        down.reverse()
+        
+        # 目标节点最近的检查点
+        checkpoint, replay = target, []
+        while checkpoint.checkpoint is None:
+            replay.append(checkpoint)
+            checkpoint = checkpoint.parent
+        replay.reverse()
+        
+        if len(replay) + checkpoint.ply * _COPY_COST_PER_PLY < up + len(down):
+            self._board = _clone_board(checkpoint.checkpoint)
+            for node in replay:
+                self._board.push(node.move)
+        else:
+            for _ in range(up):
+                self._board.pop()
+            for node in down:
+                self._board.push(node.move)
+        
+        # 走法历史保留公共前缀，补上新路径；沿途记录分支，之后重做沿这条路径
+        del self.history[ancestor.ply:]
+        self.history.extend(node.san for node in down)
+        for node in down:
+            node.parent.selected = node
+        self.current = target
+        return self._navigation_result()
+    
+    @_synchronized
+    def get_variation_tree(self) -> Dict[str, Any]:
+        """
+        获取变着树
+        
+        Returns:
+            根节点的嵌套字典：node_id、san、ply、current（是否为当前节点）、children
+        """
+        def describe(node: VariationNode) -> Dict[str, Any]:
+            return {
+                "node_id": node.node_id,
+                "san": node.san,
+                "ply": node.ply,
+                "current": node is self.current,
+                "children": []
+            }
+        
+        # 用栈代替递归，长对局不会超过递归深度限制
+        tree = describe(self.root)
+        stack = [(self.root, tree)]
+        while stack:
+            node, item = stack.pop()
+            for child in node.children:
+                child_item = describe(child)
+                item["children"].append(child_item)
+                stack.append((child, child_item))
+        return tree
+    
+    @_synchronized
     def reset(self) -> Dict[str, Any]:
         """
         重置棋盘到初始状态
@@ -123,7 +437,6 @@ class ChessSession:
             重置结果
         """
         self.board = chess.Board()
-        self.history = []
         self.last_analysis = None
         
         return {
@@ -132,6 +445,7 @@ class ChessSession:
             "fen": self.board.fen()
         }
     
+    @_synchronized
     def get_move_history(self) -> List[Dict[str, str]]:
         """
         获取格式化的走法历史
@@ -151,11 +465,50 @@ class ChessSession:
             })
         return moves
     
+    @_synchronized
+    def to_bytes(self) -> bytes:
+        """
+        序列化为紧凑的二进制：起始局面编码 + 每步2字节的走法序列
+        
+        保留到当前节点的完整走法栈，还原后重复局面判断和走法历史都不受影响；
+        变着树中的其他分支不保存
+        
+        Returns:
+            序列化后的字节串
+        """
+        return encode_position(self.board.root()) + pack_moves(self.board.move_stack)
+    
+    @classmethod
+    def from_bytes(cls, data: bytes, session_id: str = "default") -> "ChessSession":
+        """
+        从to_bytes的结果还原会话（last_analysis不保存）
+        
+        Args:
+            data: 序列化后的字节串
+            session_id: 会话ID
+        
+        Returns:
+            会话对象
+        
+        Raises:
+            ValueError: 数据无效或走法不合法
+        """
+        session = cls(session_id)
+        size = encoded_position_size(data)
+        session.board = decode_position(data[:size])
+        for move in unpack_moves(data[size:]):
+            if not session.board.is_legal(move):
+                raise ValueError(f"会话数据中的走法不合法: {move.uci()}")
+            session._advance(move, session.board.san(move))
+        return session
+    
+    @_synchronized
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
         return {
             "session_id": self.session_id,
             "fen": self.board.fen(),
             "history": self.history,
+            "node_id": self.current.node_id,
             "status": self.get_status()
         }
\ No newline at end of file
@@ -0,0 +1,374 @@
+"""
+会话存储后端
+把会话的紧凑编码（ChessSession.to_bytes：起始局面 + 走法序列）保存在进程外，
+多个app.py进程共享同一存储即可不依赖粘性路由，重启后对局也不会丢失
+
+每个会话带一个版本号，每次写入加一。写入是有条件的：只有存储中的版本仍是
+写入方上次读到的版本时才写入，多个进程同时修改同一会话时后写的一方失败，
+而不是覆盖先写的一方
+
+后端由SESSION_STORE_URL选择：
+    memory://                   进程内字典（单进程，主要用于测试）
+    sqlite:///path/sessions.db  本地SQLite文件（同一台机器上的多个进程）
+    redis://host:6379/0         Redis协议服务器（需要安装redis包，多台机器）
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class SessionStore(ABC):
+    """会话存储接口：按会话ID保存序列化后的字节串和版本号，超过ttl未写入或续期的会话视为过期"""
+
+    def __init__(self, ttl: Optional[float] = None):
+        """
+        Args:
+            ttl: 会话在存储中保留的秒数；None表示永久保留
+        """
+        self.ttl = ttl
+
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[Tuple[bytes, int]]:
+        """
+        读取会话
+
+        Args:
+            session_id: 会话ID
+
+        Returns:
+            (序列化后的会话, 版本号)，不存在或已过期返回None
+        """
+
+    @abstractmethod
+    def version(self, session_id: str) -> Optional[int]:
+        """
+        读取会话的版本号（不读取会话内容），用于判断内存中的会话是否已经过时
+
+        Returns:
+            版本号，不存在或已过期返回None
+        """
+
+    @abstractmethod
+    def save(self, session_id: str, data: bytes, expected: Optional[int]) -> Optional[int]:
+        """
+        有条件地写入会话并续期
+
+        Args:
+            session_id: 会话ID
+            data: 序列化后的会话
+            expected: 写入方上次读到的版本号，None表示写入方认为会话不存在
+
+        Returns:
+            写入后的版本号；存储中的版本与expected不同时不写入，返回None
+        """
+
+    @abstractmethod
+    def touch_many(self, session_ids: Iterable[str]):
+        """批量续期未修改的会话"""
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        """删除会话"""
+
+    @abstractmethod
+    def clear(self):
+        """删除所有会话"""
+
+    def purge_expired(self) -> int:
+        """
+        删除过期会话（自带过期机制的后端无需处理）
+
+        Returns:
+            删除的会话数量
+        """
+        return 0
+
+    def close(self):
+        """关闭连接"""
+
+
+class MemorySessionStore(SessionStore):
+    """进程内字典存储"""
+
+    def __init__(self, ttl: Optional[float] = None):
+        super().__init__(ttl)
+        self._lock = threading.Lock()
+        # 会话ID -> (序列化后的会话, 版本号, 最近写入时间)
+        self._items: Dict[str, Tuple[bytes, int, float]] = {}
+
+    def _alive(self, written_at: float) -> bool:
+        """是否未过期"""
+        return self.ttl is None or time.monotonic() - written_at < self.ttl
+
+    def load(self, session_id: str) -> Optional[Tuple[bytes, int]]:
+        with self._lock:
+            item = self._items.get(session_id)
+        if item is None or not self._alive(item[2]):
+            return None
+        return item[0], item[1]
+
+    def version(self, session_id: str) -> Optional[int]:
+        loaded = self.load(session_id)
+        return None if loaded is None else loaded[1]
+
+    def save(self, session_id: str, data: bytes, expected: Optional[int]) -> Optional[int]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(session_id)
+            current = item[1] if item is not None and self._alive(item[2]) else None
+            if current != expected:
+                return None
+            # 过期的会话版本号继续递增，不会与过期前的版本相同
+            version = (item[1] if item is not None else 0) + 1
+            self._items[session_id] = (data, version, now)
+        return version
+
+    def touch_many(self, session_ids: Iterable[str]):
+        now = time.monotonic()
+        with self._lock:
+            for session_id in session_ids:
+                item = self._items.get(session_id)
+                if item is not None:
+                    self._items[session_id] = (item[0], item[1], now)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._items.pop(session_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            expired = [sid for sid, item in self._items.items() if not self._alive(item[2])]
+            for session_id in expired:
+                del self._items[session_id]
+        return len(expired)
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite文件存储，同一台机器上的多个进程可共享（WAL模式）"""
+
+    def __init__(self, path: str, ttl: Optional[float] = None):
+        """
+        打开（必要时创建）存储文件
+
+        Args:
+            path: SQLite文件路径
+            ttl: 会话保留秒数
+        """
+        super().__init__(ttl)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                updated_at REAL NOT NULL,
+                version INTEGER NOT NULL DEFAULT 1
+            )
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+        if "version" not in columns:
+            self._conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        self._conn.commit()
+
+    def _deadline(self) -> float:
+        """早于该时间写入的会话已过期（多进程共享，用墙上时间）"""
+        return float("-inf") if self.ttl is None else time.time() - self.ttl
+
+    def load(self, session_id: str) -> Optional[Tuple[bytes, int]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, version FROM sessions WHERE id = ? AND updated_at > ?",
+                (session_id, self._deadline())
+            ).fetchone()
+        return None if row is None else (bytes(row[0]), row[1])
+
+    def version(self, session_id: str) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM sessions WHERE id = ? AND updated_at > ?",
+                (session_id, self._deadline())
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def save(self, session_id: str, data: bytes, expected: Optional[int]) -> Optional[int]:
+        with self._lock:
+            # BEGIN IMMEDIATE先取得写锁，比较和写入之间其他进程无法写入
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT version, updated_at FROM sessions WHERE id = ?", (session_id,)
+                ).fetchone()
+                current = row[0] if row is not None and row[1] > self._deadline() else None
+                if current != expected:
+                    self._conn.rollback()
+                    return None
+                version = (row[0] if row is not None else 0) + 1
+                self._conn.execute("""
+                    INSERT INTO sessions (id, data, updated_at, version) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET
+                        data = excluded.data, updated_at = excluded.updated_at, version = excluded.version
+                """, (session_id, data, time.time(), version))
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return version
+
+    def touch_many(self, session_ids: Iterable[str]):
+        rows = [(time.time(), session_id) for session_id in session_ids]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("UPDATE sessions SET updated_at = ? WHERE id = ?", rows)
+            self._conn.commit()
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions")
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        if self.ttl is None:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE updated_at <= ?", (self._deadline(),))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RedisSessionStore(SessionStore):
+    """Redis协议存储（Redis、Valkey、KeyDB等），过期由服务器按键的TTL处理"""
+
+    def __init__(self, url: str, ttl: Optional[float] = None, prefix: str = "hca:session:"):
+        """
+        连接服务器
+
+        每个会话是一个哈希键，字段data为序列化后的会话、version为版本号
+
+        Args:
+            url: redis://host:port/db 形式的地址
+            ttl: 会话保留秒数
+            prefix: 键名前缀
+
+        Raises:
+            ImportError: 未安装redis包
+        """
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("Redis会话存储需要redis包: pip install redis")
+        super().__init__(ttl)
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._watch_error = redis.WatchError
+
+    def _key(self, session_id: str) -> str:
+        return self.prefix + session_id
+
+    def _expire(self) -> Optional[int]:
+        """键的过期秒数"""
+        return None if self.ttl is None else max(1, int(self.ttl))
+
+    def load(self, session_id: str) -> Optional[Tuple[bytes, int]]:
+        data, version = self._client.hmget(self._key(session_id), "data", "version")
+        if data is None or version is None:
+            return None
+        return data, int(version)
+
+    def version(self, session_id: str) -> Optional[int]:
+        version = self._client.hget(self._key(session_id), "version")
+        return None if version is None else int(version)
+
+    def save(self, session_id: str, data: bytes, expected: Optional[int]) -> Optional[int]:
+        key = self._key(session_id)
+        with self._client.pipeline() as pipe:
+            try:
+                # WATCH：比较之后、写入之前键被其他客户端修改时事务不执行
+                pipe.watch(key)
+                current = pipe.hget(key, "version")
+                current = None if current is None else int(current)
+                if current != expected:
+                    pipe.unwatch()
+                    return None
+                version = (current or 0) + 1
+                pipe.multi()
+                pipe.hset(key, mapping={"data": data, "version": version})
+                expire = self._expire()
+                if expire is not None:
+                    pipe.expire(key, expire)
+                pipe.execute()
+            except self._watch_error:
+                return None
+        return version
+
+    def touch_many(self, session_ids: Iterable[str]):
+        expire = self._expire()
+        if expire is None:
+            return
+        pipe = self._client.pipeline(transaction=False)
+        for session_id in session_ids:
+            pipe.expire(self._key(session_id), expire)
+        pipe.execute()
+
+    def delete(self, session_id: str):
+        self._client.delete(self._key(session_id))
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=self.prefix + "*", count=1000))
+        for start in range(0, len(keys), 1000):
+            self._client.delete(*keys[start:start + 1000])
+
+    def close(self):
+        self._client.close()
+
+
+def open_session_store(url: Optional[str], ttl: Optional[float] = None) -> Optional[SessionStore]:
+    """
+    按地址打开会话存储
+
+    Args:
+        url: memory://、sqlite:///路径、redis://地址；直接给出以.db结尾的路径也视为SQLite
+        ttl: 会话保留秒数
+
+    Returns:
+        存储对象，url为空时返回None（会话只保存在进程内）
+
+    Raises:
+        ValueError: 无法识别的地址
+    """
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return MemorySessionStore(ttl)
+    if url.startswith("sqlite://"):
+        return SQLiteSessionStore(url[len("sqlite:///"):] or "sessions.db", ttl)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSessionStore(url, ttl)
+    if url.endswith(".db"):
+        return SQLiteSessionStore(url, ttl)
+    raise ValueError(f"无法识别的会话存储地址: {url}")
+
+
+def get_session_store(ttl: Optional[float] = None) -> Optional[SessionStore]:
+    """按环境变量SESSION_STORE_URL打开会话存储，未设置时返回None"""
+    return open_session_store(os.getenv("SESSION_STORE_URL"), ttl)
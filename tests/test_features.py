@@ -0,0 +1,47 @@
+"""批量特征：无效的FEN逐行报错，不影响同一块中的有效局面"""
+
+import chess
+import pytest
+
+from chess_core.features import iter_feature_rows, positions_to_planes
+
+pytest.importorskip("numpy")
+
+ITALIAN = "r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 2 3"
+
+
+@pytest.mark.parametrize("fen", [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNé w KQkq - 0 1",   # 非ASCII字符
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNx w KQkq - 0 1",   # 不是棋子的字母
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBN. w KQkq - 0 1",   # 占位符本身
+    "rnbqkbnrp/ppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",   # 横排长度不对但总数为64
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPPRNBQKBNR w KQkq - 0 1",    # 少一个斜线
+])
+def test_invalid_placement(fen):
+    with pytest.raises(ValueError):
+        positions_to_planes([fen])
+
+
+def test_mixed_chunk_reports_errors_per_row():
+    fens = [
+        chess.STARTING_FEN,
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNé w KQkq - 0 1",
+        ITALIAN,
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNx w KQkq - 0 1",
+        "4k3/8/8/8/8/8/8/4K3 w - - 0 1",
+    ]
+    rows = list(iter_feature_rows(fens, chunk_size=len(fens)))
+    assert [row["fen"] for row in rows] == fens
+    assert ["error" in row for row in rows] == [False, True, False, True, False]
+    assert rows[0]["phase_name"] == "开局"
+    assert rows[4]["phase_name"] == "残局"
+
+
+def test_matches_board_planes():
+    board = chess.Board(ITALIAN)
+    planes = positions_to_planes([ITALIAN, board])
+    for index, symbol in enumerate("PNBRQKpnbrqk"):
+        piece = chess.Piece.from_symbol(symbol)
+        expected = int(board.pieces(piece.piece_type, piece.color))
+        for row in planes:
+            assert sum(1 << square for square in range(64) if row[index, square]) == expected
@@ -0,0 +1,74 @@
+"""残局库：终局局面直接给出结果，不借出引擎"""
+
+import chess
+import chess.syzygy
+import pytest
+
+from chess_core.pool import EnginePool
+from chess_core.tablebase import SyzygyTablebase
+
+
+class FakeTables:
+    """代替chess.syzygy.Tablebase：目录中有一张KRvK表，只有双王时为和棋"""
+
+    wdl = {"KRvK": None}
+    dtz = {"KRvK": None}
+
+    def __init__(self, max_fds=None):
+        pass
+
+    def add_directory(self, directory):
+        return 2
+
+    def probe_wdl(self, board):
+        return 0 if len(board.piece_map()) == 2 else 2
+
+    def probe_dtz(self, board):
+        return 0 if len(board.piece_map()) == 2 else 1
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def tablebase(tmp_path, monkeypatch):
+    monkeypatch.setattr(chess.syzygy, "Tablebase", FakeTables)
+    return SyzygyTablebase(str(tmp_path))
+
+
+@pytest.mark.parametrize("fen, wdl, eval_value", [
+    ("4k3/8/8/8/8/8/8/4K3 w - - 0 1", 0, 0.0),                       # 王单挑：子力不足
+    ("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1", 0, 0.0),                      # 逼和
+    ("6rk/5Npp/8/8/8/8/8/6K1 b - - 0 1", -2, 100.0),                 # 闷杀，黑方被将死
+    ("rnbqkbnr/ppppp2p/5p2/6pQ/4P3/8/PPPP1PPP/RNB1KBNR b KQkq - 1 3", -2, 100.0),  # 子力超出残局库
+])
+def test_terminal_positions(tablebase, fen, wdl, eval_value):
+    result = tablebase.analyze_position(fen)
+    assert result["success"]
+    assert result["tablebase"]["wdl"] == wdl
+    assert result["eval_value"] == eval_value
+    assert result["best_move"] is None
+    assert result["variations"] == [] and result["best_moves"] == []
+
+
+def test_outside_tables_falls_through(tablebase):
+    assert tablebase.analyze_position(chess.STARTING_FEN) is None
+
+
+def test_bare_kings_never_check_out_engine(tablebase, tmp_path, monkeypatch):
+    # 引擎不预先启动，只要借出就会失败
+    engine_path = tmp_path / "stockfish"
+    engine_path.touch()
+    pool = EnginePool(str(engine_path), size=1, min_engines=0, tablebase=tablebase)
+
+    def checkout(*args, **kwargs):
+        raise AssertionError("王单挑不应借出引擎")
+
+    monkeypatch.setattr(pool, "checkout", checkout)
+    try:
+        fen = "4k3/8/8/8/8/8/8/4K3 w - - 0 1"
+        assert pool.analyze_position(fen)["evaluation"] == "终局: 和棋（子力不足）"
+        final = list(pool.analyze_stream(fen, time_limit=None))
+        assert len(final) == 1 and final[0]["final"]
+    finally:
+        pool.close()
@@ -2,6 +2,7 @@
 对话模式标签页
 """
 
+import asyncio
 import gradio as gr
 import json
 import os
@@ -14,18 +15,27 @@ from llm.gemini_client import gemini_client  # 确保这行正确
 from llm.tools import tools
 from llm.prompts import get_analysis_prompt
 from ui.components import render_board
-from chess_core.engine import get_engine
+from chess_core.async_engine import get_async_engine
+from chess_core.config import MAX_ANALYSIS_TIME, get_profile
+from chess_core.ponder import get_ponderer
 
 
-def process_chat_message(message, session_id="default"):
+async def process_chat_message(message, session_id="default"):
     """
     处理用户的自然语言输入（使用Gemini）
     """
     if not message or message.strip() == "":
         return "请输入消息..."
     
-    # 获取会话
-    session = session_manager.get_session(session_id)
+    # 获取会话；同一会话的消息按顺序处理，两条消息不会交错走子
+    async with session_manager.acquire_async(session_id) as session:
+        return await _process_session_message(message, session, session_id)
+
+
+async def _process_session_message(message, session, session_id):
+    """
+    在已独占的会话上处理一条消息
+    """
     current_fen = session.board.fen()
     current_turn = "白方" if session.board.turn == chess.WHITE else "黑方"
     
@@ -45,8 +55,9 @@ def process_chat_message(message, session_id="default"):
         否则直接回复用户。
         """
         
-        # 调用Gemini
-        response = gemini_client.chat_completion(
+        # 调用Gemini（同步SDK，放到线程中执行以免阻塞事件循环）
+        response = await asyncio.to_thread(
+            gemini_client.chat_completion,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": message}
@@ -65,22 +76,64 @@ def process_chat_message(message, session_id="default"):
             function_name = tool_call["name"]
             function_args = tool_call["arguments"]
             
+            # 后台预分析（CHAT_PONDER=1时开启）
+            ponderer = await get_ponderer()
+            
             # 执行对应的函数
             if function_name == "make_move":
                 result = session.make_move(function_args["move"])
                 results.append(result)
+                # 走子成功后立即在后台分析新局面，接下来的"谁优势？"可直接取用
+                if ponderer is not None and result["success"]:
+                    ponderer.start(session_id, session.board.fen())
                 
             elif function_name == "analyze_position":
-                # 调用引擎分析
-                engine = get_engine()
-                engine_result = engine.analyze_position(session.board.fen())
+                # 调用引擎分析：按工具参数选择分析配置档；给出深度时按深度搜索，
+                # 时间只作为上限
+                profile = get_profile(function_args.get("profile"))
+                depth = int(function_args["depth"]) if function_args.get("depth") else None
+                engine_result = None
+                if ponderer is not None:
+                    engine_result = await ponderer.analyze(
+                        session_id,
+                        session.board.fen(),
+                        multipv=profile.multipv,
+                        time_limit=profile.time_limit,
+                        depth=depth
+                    )
+                if engine_result is None:
+                    engine = await get_async_engine()
+                    engine_result = await engine.analyze_position(
+                        session.board.fen(),
+                        time_limit=MAX_ANALYSIS_TIME if depth else profile.time_limit,
+                        multipv=profile.multipv,
+                        depth=depth,
+                        session=session_id
+                    )
                 session.last_analysis = engine_result
                 results.append(engine_result)
                 
             elif function_name == "reset_board":
+                if ponderer is not None:
+                    ponderer.cancel(session_id)
                 result = session.reset()
                 results.append({"message": result["message"]})
                 
+            elif function_name in ("undo_move", "redo_move"):
+                steps = int(function_args.get("steps") or 1)
+                if function_name == "undo_move":
+                    result = session.undo(steps)
+                else:
+                    result = session.redo(steps)
+                if result["success"]:
+                    moves = result.get("undone") or result.get("redone")
+                    action = "撤销" if function_name == "undo_move" else "恢复"
+                    results.append({"message": f"已{action} {' '.join(moves)}"})
+                    if ponderer is not None:
+                        ponderer.start(session_id, session.board.fen())
+                else:
+                    results.append(result)
+                
             elif function_name == "get_move_history":
                 history = session.get_move_history()
                 results.append({"history": history})
@@ -106,7 +159,7 @@ def generate_chat_response(original_message, session, results, ai_suggestion="")
     # 否则生成简单回复
     if results and "best_move" in results[0]:
         r = results[0]
-        return f"分析完成！推荐走法：{r['best_move']}，评估：{r['evaluation']}。当前{status['status']}，轮到{status['turn']}。"
+        return f"分析完成！推荐走法：{r['best_move'] or '无（已终局）'}，评估：{r['evaluation']}。当前{status['status']}，轮到{status['turn']}。"
     elif results and "move" in results[0] and results[0].get("success"):
         return f"已记录 {results[0]['move']}。当前{status['status']}，轮到{status['turn']}。"
     else:
@@ -156,6 +209,7 @@ def create_chat_tab():
         **完全不用输入FEN**，直接描述你的走法：
         - **走棋**："我走e4"、"对手e5"、"我Nf3，对手Nc6"
         - **分析**："现在谁优势？"、"分析当前局面"
+        - **悔棋**："悔一步"、"撤销刚才两步"、"还是走回去吧"
         - **重置**："我想重新开始一局"
         """)
         
@@ -282,13 +336,13 @@ def create_chat_tab():
                 str(status["legal_moves"])
             )
         
-        def chat_respond(message, history, session_id):
+        async def chat_respond(message, history, session_id):
             """处理用户消息并更新界面"""
             if not message or message.strip() == "":
                 return "", history, session_id
             
             # 获取机器人回复
-            bot_message = process_chat_message(message, session_id)
+            bot_message = await process_chat_message(message, session_id)
             
             # 更新对话历史
             history.append((message, bot_message))
@@ -298,16 +352,19 @@ def create_chat_tab():
             
             return "", history, session_id, board_html, turn, status, fen, moves, material, legal
         
-        def reset_chat(session_id):
+        async def reset_chat(session_id):
             """重置棋盘"""
-            session = session_manager.get_session(session_id)
-            session.reset()
+            ponderer = await get_ponderer()
+            if ponderer is not None:
+                ponderer.cancel(session_id)
+            async with session_manager.acquire_async(session_id) as session:
+                session.reset()
             return update_chat_display(session_id)
         
-        def analyze_current(session_id):
+        async def analyze_current(session_id):
             """分析当前局面"""
             session = session_manager.get_session(session_id)
-            bot_message = process_chat_message("分析当前局面", session_id)
+            bot_message = await process_chat_message("分析当前局面", session_id)
             
             # 获取当前对话历史
             current_history = chatbot.value or []
@@ -5,7 +5,8 @@ FEN分析标签页
 
 import gradio as gr
 import os
-from chess_core.engine import get_engine
+from chess_core.async_engine import get_async_engine
+from chess_core.config import PROFILES, DEFAULT_PROFILE, INFINITE_ANALYSIS_MAX, MAX_ANALYSIS_TIME, get_profile
 from ui.components import render_board, create_analysis_card
 
 
@@ -40,6 +41,7 @@ def create_fen_tab():
                 # 分析按钮
                 with gr.Row():
                     analyze_btn = gr.Button("🔍 分析位置", variant="primary", size="lg", scale=2)
+                    stop_btn = gr.Button("⏹️ 停止", size="lg", scale=1)
                     clear_btn = gr.Button("🗑️ 清空", size="lg", scale=1)
                 
                 # 分析结果区域
@@ -79,55 +81,110 @@ def create_fen_tab():
         
         # 高级选项
         with gr.Accordion("⚙️ 高级选项", open=False):
+            default_profile = get_profile(DEFAULT_PROFILE)
+            profile = gr.Radio(
+                choices=[(p.label, name) for name, p in PROFILES.items()],
+                value=DEFAULT_PROFILE,
+                label="分析配置"
+            )
             time_limit = gr.Slider(
-                minimum=0.5,
-                maximum=5.0,
-                value=2.0,
-                step=0.5,
+                minimum=0.1,
+                maximum=10.0,
+                value=default_profile.time_limit,
+                step=0.1,
                 label="分析时间（秒）"
             )
+            with gr.Row():
+                depth_limit = gr.Number(
+                    value=0,
+                    precision=0,
+                    minimum=0,
+                    label="搜索深度（0表示不限，设置后按深度搜索）"
+                )
+                nodes_limit = gr.Number(
+                    value=0,
+                    precision=0,
+                    minimum=0,
+                    label="搜索节点数（0表示不限，设置后按节点数搜索）"
+                )
             multipv = gr.Slider(
                 minimum=1,
                 maximum=5,
-                value=3,
+                value=default_profile.multipv,
                 step=1,
                 label="显示最佳走法数量"
             )
+            infinite = gr.Checkbox(
+                value=False,
+                label=f"无限分析（持续加深，直到点击停止，最长{INFINITE_ANALYSIS_MAX / 60:g}分钟）"
+            )
         
         # 分析函数
-        def analyze_fen(fen, time_sec, multipv_count):
-            """分析FEN位置"""
+        def render_result(result):
+            """把（阶段性）分析结果渲染为HTML"""
+            analysis_html = create_analysis_card(
+                result["best_move"] or "无",
+                result["evaluation"],
+                result.get("variations", [])
+            )
+            
+            # 添加多走法列表
+            if result.get("best_moves"):
+                analysis_html += "<br><h4>其他可选走法：</h4><ul>"
+                for move in result["best_moves"][1:]:
+                    analysis_html += f"<li>{move['rank']}. {move['move']} ({move['evaluation']})</li>"
+                analysis_html += "</ul>"
+            
+            # 搜索进度
+            if result.get("tablebase"):
+                analysis_html += "<p style='color: #64748b;'>📚 Syzygy残局库精确结果（未搜索）</p>"
+                return analysis_html
+            state = "✅ 分析完成" if result.get("final") else "⏳ 分析中..."
+            if result.get("stopped"):
+                state = "⏹️ 已停止"
+            analysis_html += (
+                f"<p style='color: #64748b;'>{state} 深度 {result.get('depth', 0)} · "
+                f"节点 {result.get('nodes', 0):,} · {result.get('nps', 0) // 1000:,} kN/s</p>"
+            )
+            return analysis_html
+        
+        async def analyze_fen(fen, time_sec, multipv_count, infinite_mode, profile_name, depth_value, nodes_value,
+                              request: gr.Request = None):
+            """流式分析FEN位置，搜索加深时不断刷新结果"""
             try:
                 if not fen or fen.strip() == "":
-                    return render_board("start"), "请输入FEN"
-                
-                # 获取引擎
-                engine = get_engine()
+                    yield render_board("start"), "请输入FEN"
+                    return
                 
-                # 分析位置
-                result = engine.analyze_position(fen, time_limit=time_sec, multipv=multipv_count)
+                # 获取异步引擎池（等待空闲引擎时不占用线程）
+                engine = await get_async_engine()
+                board_html = render_board(fen)
                 
-                if result["success"]:
-                    # 创建分析卡片
-                    analysis_html = create_analysis_card(
-                        result["best_move"],
-                        result["evaluation"],
-                        result.get("variations", [])
-                    )
-                    
-                    # 添加多走法列表
-                    if result.get("best_moves"):
-                        analysis_html += "<br><h4>其他可选走法：</h4><ul>"
-                        for move in result["best_moves"][1:]:
-                            analysis_html += f"<li>{move['rank']}. {move['move']} ({move['evaluation']})</li>"
-                        analysis_html += "</ul>"
-                    
-                    return render_board(fen), analysis_html
+                # 分析位置：阶段性结果已在引擎层节流，停止按钮会关闭本生成器并释放引擎
+                # 设置了深度/节点数时按其搜索，时间只作为上限
+                depth = int(depth_value or 0) or None
+                nodes = int(nodes_value or 0) or None
+                if infinite_mode:
+                    depth = nodes = time_limit = None
+                elif depth or nodes:
+                    time_limit = MAX_ANALYSIS_TIME
                 else:
-                    return render_board(fen), f"❌ 分析失败：{result.get('error', '未知错误')}"
+                    time_limit = time_sec
+                async for result in engine.analyze_stream(
+                    fen,
+                    time_limit=time_limit,
+                    multipv=int(multipv_count),
+                    depth=depth,
+                    nodes=nodes,
+                    session=request.session_hash if request else None
+                ):
+                    if result["success"]:
+                        yield board_html, render_result(result)
+                    else:
+                        yield board_html, f"❌ 分析失败：{result.get('error', '未知错误')}"
                     
             except Exception as e:
-                return render_board(fen), f"❌ 错误：{str(e)}"
+                yield render_board(fen), f"❌ 错误：{str(e)}"
         
         def clear_inputs():
             """清空输入"""
@@ -141,12 +198,30 @@ def create_fen_tab():
             outputs=board_output
         )
         
-        analyze_btn.click(
+        def apply_profile(profile_name):
+            """选择配置档时同步时间和走法数量滑块"""
+            selected = get_profile(profile_name)
+            return selected.time_limit, selected.multipv
+        
+        profile.change(
+            apply_profile,
+            inputs=profile,
+            outputs=[time_limit, multipv]
+        )
+        
+        analyze_event = analyze_btn.click(
             analyze_fen,
-            inputs=[fen_input, time_limit, multipv],
+            inputs=[fen_input, time_limit, multipv, infinite, profile, depth_limit, nodes_limit],
             outputs=[board_output, analysis_output]
         )
         
+        stop_btn.click(
+            None,
+            None,
+            None,
+            cancels=[analyze_event]
+        )
+        
         clear_btn.click(
             clear_inputs,
             None,
@@ -159,7 +234,7 @@ def create_fen_tab():
             **操作步骤：**
             1. 在输入框中粘贴FEN字符串
             2. 点击"分析位置"按钮
-            3. 查看分析结果
+            3. 查看分析结果（随搜索加深实时刷新，可随时点击"停止"）
             
             **FEN格式说明：**
             - **第一部分**：棋盘位置（8行，/分隔）